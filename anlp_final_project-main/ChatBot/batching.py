@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+from metrics import METRICS
+
+
+@contextmanager
+def left_padding(tokenizer):
+    """
+    Temporarily pad on the left so every row of a batch ends on its last prompt
+    token; decoder-only generate() continues from the final position.
+    """
+    previous = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        yield tokenizer
+    finally:
+        tokenizer.padding_side = previous
+
+
+def length_buckets(items, lengths, batch_size: int):
+    """
+    Sort items by length and cut them into batches of at most batch_size,
+    so each padded batch wastes as little compute as possible on padding.
+    Returns a list of batches of (original_index, item) pairs.
+    """
+    order = sorted(range(len(items)), key=lambda i: lengths[i])
+    return [
+        [(i, items[i]) for i in order[start:start + batch_size]]
+        for start in range(0, len(order), batch_size)
+    ]
+
+
+def chunked(items, batch_size: int):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+class BatchTimer:
+    """Prints per-batch throughput for batched runs, whether or not metrics are enabled."""
+
+    def __init__(self, stage: str, size: int):
+        self.stage = stage
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        rate = self.size / elapsed if elapsed > 0 else float("inf")
+        print(f"[Batch] {self.stage}: {self.size} questions in {elapsed:.2f}s ({rate:.2f} q/s)")
+        return False
+
+
+def run_bucketed(prompts: list, batch_size: int, generate_fn, tokenizer, stage: str) -> list:
+    """
+    Length-bucket prompts, run generate_fn on every bucket and return its
+    outputs in the original prompt order. Each bucket's throughput is printed
+    and the bucket is timed as a "<stage>.batch" metrics span.
+    """
+    lengths = [len(ids) for ids in tokenizer(prompts)["input_ids"]]
+    outputs = [None] * len(prompts)
+    for bucket in length_buckets(prompts, lengths, batch_size):
+        with BatchTimer(stage, len(bucket)), METRICS.span(f"{stage}.batch", batch=len(bucket)):
+            texts = generate_fn([prompt for _, prompt in bucket])
+        for (i, _), text in zip(bucket, texts):
+            outputs[i] = text
+    return outputs
@@ -0,0 +1,143 @@
+"""
+Tokens per second and memory of the CPU backend (model_loader --backend cpu)
+in float32, bfloat16 and dynamic int8, on FinQA prompts built from the
+questions of data/finchatbot_300_dataset.jsonl.
+
+Every variant runs in its own process so its RSS is not inflated by the
+others; peak RSS includes torch and transformers themselves. Generation goes through ENGINE with the generation cache off;
+completions are compared with float32's to show what quantization changes.
+
+    python bench_cpu_backend.py --limit 32 --max-new-tokens 64 --threads 8
+    python bench_cpu_backend.py --model-name Qwen/Qwen2.5-0.5B-Instruct --variants fp32 int8
+    # Offline, on the randomly initialized stand-in model
+    python bench_cpu_backend.py --model-name standin
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from model_loader import CPU_DEFAULT_MODEL_NAME
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# name -> (dtype, quantization)
+VARIANTS = {"fp32": ("float32", "none"), "bf16": ("bfloat16", "none"), "int8": ("float32", "int8")}
+
+
+def rss_mb() -> tuple:
+    """(current, peak) resident set size of this process in MB."""
+    values = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                key, kb = line.split()[:2]
+                values[key] = int(kb) / 1024
+    return values["VmRSS:"], values["VmHWM:"]
+
+
+def weights_bytes(model) -> int:
+    """Bytes of the model's state dict; dynamically quantized layers keep theirs in packed-parameter tuples."""
+    import torch
+
+    def size(value):
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        return 0
+
+    return sum(size(v) for v in model.state_dict().values())
+
+
+def questions(path=DATA_DIR / "finchatbot_300_dataset.jsonl", limit: int = None) -> list:
+    with open(path, "r") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [row["input"] for row in rows][:limit]
+
+
+def run_variant(args) -> dict:
+    """Load one variant, generate for every prompt and measure it (runs in the child process)."""
+    from model_loader import HANDLE, configure
+    from model_registry import REGISTRY
+    from gen_cache import GENERATION_CACHE
+    from engine import ENGINE
+    from finqa import build_finqa_prompt
+    from metrics import METRICS
+
+    dtype, quantization = VARIANTS[args.variant]
+    configure(backend="cpu", model_name=args.model_name, dtype=dtype, quantization=quantization,
+              threads=args.threads, interop_threads=args.interop_threads)
+    REGISTRY.enabled = False
+    GENERATION_CACHE.bypass = True
+
+    start = time.perf_counter()
+    model = HANDLE.get()[0]
+    load_s = time.perf_counter() - start
+
+    prompts = [build_finqa_prompt(q) + "\n" for q in questions(limit=args.limit)]
+    batches = [prompts[i:i + args.batch_size] for i in range(0, len(prompts), args.batch_size)]
+    ENGINE.generate("finqa", batches[0][:1], args.max_new_tokens)  # warm-up
+
+    METRICS.configure(enabled=True)
+    METRICS.reset()
+    outputs = []
+    start = time.perf_counter()
+    for batch in batches:
+        outputs += ENGINE.generate("finqa", batch, args.max_new_tokens)
+    elapsed = time.perf_counter() - start
+    generate = METRICS.summary()["finqa.generate"]
+    return {"variant": args.variant, "load_s": load_s, "weights_mb": weights_bytes(model) / (1 << 20),
+            "peak_rss_mb": rss_mb()[1], "prompts": len(prompts), "prompt_tokens": generate["prompt_tokens"],
+            "generated_tokens": generate["generated_tokens"], "seconds": elapsed,
+            "tokens_per_s": generate["generated_tokens"] / elapsed, "outputs": outputs}
+
+
+def child_args(args, variant: str) -> list:
+    argv = [sys.executable, __file__, "--variant", variant, "--model-name", args.model_name,
+            "--limit", str(args.limit), "--batch-size", str(args.batch_size),
+            "--max-new-tokens", str(args.max_new_tokens)]
+    for flag, value in (("--threads", args.threads), ("--interop-threads", args.interop_threads)):
+        if value:
+            argv += [flag, str(value)]
+    return argv
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-name", type=str, default=CPU_DEFAULT_MODEL_NAME)
+    parser.add_argument("--variants", choices=list(VARIANTS), nargs="+", default=list(VARIANTS))
+    parser.add_argument("--limit", type=int, default=32, help="First N questions of finchatbot_300")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--interop-threads", type=int, default=None, help="torch inter-op threads")
+    parser.add_argument("--variant", choices=list(VARIANTS), default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        print(json.dumps(run_variant(args)))
+        sys.exit(0)
+
+    results = []
+    for variant in args.variants:
+        proc = subprocess.run(child_args(args, variant), capture_output=True, text=True)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        if proc.returncode != 0 or not lines:
+            print(f"[CPU Backend] {variant} failed:\n{proc.stderr.strip()}")
+            continue
+        results.append(json.loads(lines[-1]))
+
+    reference = next((r["outputs"] for r in results if r["variant"] == "fp32"), None)
+    print(f"[CPU Backend] {args.model_name} | {args.limit} prompts | batch {args.batch_size} | "
+          f"max_new_tokens {args.max_new_tokens} | threads {args.threads or 'default'}")
+    print(f"{'variant':<9}{'load s':>8}{'weights MB':>12}{'peak RSS MB':>13}{'tokens':>8}{'tok/s':>8}"
+          f"{'speedup':>9}{'same as fp32':>14}")
+    base = next((r["tokens_per_s"] for r in results if r["variant"] == "fp32"), None)
+    for r in results:
+        speedup = f"{r['tokens_per_s'] / base:.2f}x" if base else "-"
+        same = (f"{sum(a == b for a, b in zip(r['outputs'], reference))}/{r['prompts']}"
+                if reference is not None else "-")
+        print(f"{r['variant']:<9}{r['load_s']:>8.1f}{r['weights_mb']:>12.1f}{r['peak_rss_mb']:>13.0f}"
+              f"{r['generated_tokens']:>8}{r['tokens_per_s']:>8.1f}{speedup:>9}{same:>14}")
@@ -0,0 +1,126 @@
+"""
+Weekly news lookup from the CSV News column vs. the memory-mapped news store,
+on synthetic weekly symbol CSVs in the layout of prompt_builder.symbol_csv_path.
+
+    python bench_news_store.py --symbols 30 --years 3
+"""
+import csv
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+from news_store import NEWS_SPAM_PREFIX, NewsStore, ingest, symbol_from_csv
+from prompt import _row_news
+
+WORDS = ("shares rally after earnings beat as analysts raise targets while regulators probe supply chain "
+         "guidance cut demand outlook dividend buyback lawsuit merger record revenue margin pressure").split()
+
+
+def _sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize()
+
+
+def write_symbol_csv(path, symbol, weeks, per_week, rng):
+    """
+    One row per week. Like the real data, a week's News holds every article
+    from its start to its end date, so boundary-day articles appear twice;
+    it also holds the day after the end date, which both paths must drop.
+    """
+    first = date(2020, 1, 5)
+    by_day = {}
+    for i in range(7 * weeks + 1):
+        day = first + timedelta(days=i)
+        by_day[day] = [{"date": day.strftime("%Y%m%d") + f"{rng.randint(0, 235959):06d}",
+                        "headline": _sentence(rng, 10),
+                        "summary": NEWS_SPAM_PREFIX if rng.random() < 0.1 else _sentence(rng, 30)}
+                       for _ in range(rng.randint(0, 2 * per_week // 7))]
+    price = 100.0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Start Date", "End Date", "Start Price", "End Price", "News", "Basics", "Bin Label"])
+        for w in range(weeks):
+            start, end = first + timedelta(days=7 * w), first + timedelta(days=7 * w + 7)
+            news = [n for i in range(9) for n in by_day.get(start + timedelta(days=i), [])]
+            new_price = price * (1 + rng.uniform(-0.05, 0.05))
+            writer.writerow([start.isoformat(), end.isoformat(), f"{price:.2f}", f"{new_price:.2f}",
+                             json.dumps(news), json.dumps({}), "U1"])
+            price = new_price
+
+
+def read_rows(path):
+    csv.field_size_limit(sys.maxsize)
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def lookup_all(tables, store):
+    """Every week's articles of every symbol, as prompt construction fetches them."""
+    return [_row_news(symbol, row, row["Start Date"], row["End Date"], store)
+            for symbol, rows in tables for row in rows]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def peak_memory(fn):
+    """Peak traced allocation of fn() (timed separately: tracing slows everything down)."""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", type=int, default=30)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--per-week", type=int, default=40, help="Articles per symbol and week")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        paths = []
+        for i in range(args.symbols):
+            path = tmp / f"S{i:03d}_2020-01-05_2024-01-01.csv"
+            write_symbol_csv(path, symbol_from_csv(path), 52 * args.years, args.per_week, rng)
+            paths.append(path)
+        csv_mb = sum(p.stat().st_size for p in paths) / 1e6
+
+        start = time.perf_counter()
+        counts = ingest(paths, tmp / "store")
+        ingest_s = time.perf_counter() - start
+        store_mb = sum(p.stat().st_size for p in (tmp / "store").iterdir()) / 1e6
+        print(f"[News Store] {len(paths)} CSVs ({csv_mb:.1f} MB) -> {sum(counts.values())} distinct articles "
+              f"({store_mb:.1f} MB) in {ingest_s:.2f}s")
+
+        store = NewsStore(tmp / "store")
+        tables = [(symbol_from_csv(p), read_rows(p)) for p in paths]
+        legacy, legacy_s = timed(lambda: lookup_all(tables, None))
+        stored, store_s = timed(lambda: lookup_all(tables, store))
+        same = sum(a == b for a, b in zip(legacy, stored))
+
+        # Memory of building every week's news from scratch: the store does not need the News column
+        def from_csv():
+            lookup_all([(symbol_from_csv(p), read_rows(p)) for p in paths], None)
+
+        def from_store():
+            rows = [(symbol_from_csv(p), [dict(r, News=None) for r in read_rows(p)]) for p in paths]
+            lookup_all(rows, store)
+
+        weeks = len(legacy)
+        print(f"[CSV News JSON] {weeks} weeks, {sum(map(len, legacy))} articles: {legacy_s:.2f}s "
+              f"({1e6 * legacy_s / weeks:.0f} us/week) | peak {peak_memory(from_csv) / 1e6:.1f} MB")
+        print(f"[News Store]    {weeks} weeks, {sum(map(len, stored))} articles: {store_s:.2f}s "
+              f"({1e6 * store_s / weeks:.0f} us/week) | peak {peak_memory(from_store) / 1e6:.1f} MB | "
+              f"{legacy_s / store_s:.1f}x faster | {same}/{weeks} weeks with the same articles in the same order")
@@ -0,0 +1,111 @@
+"""
+Prefill time with and without the shared prefix cache, on the CPU stand-in
+model, for single prompts and for a left-padded batch of router prompts.
+
+    python bench_prefix_cache.py --repeats 10
+"""
+import os
+os.environ.setdefault("FINBOT_MODEL_NAME", "standin")
+
+import time
+import argparse
+import statistics
+import torch
+from model_loader import model, tokenizer
+from prefix_cache import PREFIX_CACHE, _share
+from pipeline import ROUTER_PROMPT_PREFIX, build_router_prompt
+from finred import finred_prompt_prefix, build_finred_prompt
+from forecaster import FORECAST_EXAMPLES, FORECAST_PROMPT_SUFFIX
+
+SAMPLE_INTRO = (
+    "[Company Introduction]:\n\nApple Inc is a leading entity in the Technology sector. "
+    "Incorporated and publicly traded since 1980-12-12, the company has established its reputation "
+    "as one of the key players in the market."
+)
+
+
+def _median_ms(fn, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000 * statistics.median(times)
+
+
+def bench_module(name: str, prefix: str, prompt: str, repeats: int):
+    tokens = tokenizer(prompt, return_tensors='pt')
+    input_ids = tokens["input_ids"].to(model.device)
+
+    def full_prefill():
+        with torch.no_grad():
+            model(input_ids=input_ids, use_cache=True)
+
+    entry = PREFIX_CACHE.get(model, tokenizer, name, prefix)
+    n = PREFIX_CACHE.reusable_length(entry, input_ids[0].tolist())
+
+    def cached_prefill():
+        past_key_values = _share(entry.past_key_values, n, 1)
+        with torch.no_grad():
+            model(input_ids=input_ids[:, n:], past_key_values=past_key_values, use_cache=True)
+
+    full_ms = _median_ms(full_prefill, repeats)
+    cached_ms = _median_ms(cached_prefill, repeats)
+
+    # Greedy continuations must not change when the prefix comes from the cache
+    kwargs = dict(max_new_tokens=16, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+    with torch.no_grad():
+        plain = model.generate(**tokens, **kwargs)
+    cached = PREFIX_CACHE.generate(model, tokenizer, name, prefix, tokens, **kwargs)
+    same = torch.equal(plain, cached)
+
+    print(f"{name:<11} prompt={input_ids.shape[1]:>5} tok  reused={n:>5} tok  "
+          f"full={full_ms:8.2f} ms  cached={cached_ms:8.2f} ms  "
+          f"speedup={full_ms / cached_ms:5.2f}x  identical={same}")
+
+
+def bench_batch(name: str, prefix: str, prompts: list, repeats: int):
+    """Padded batch: generate() with and without the prefix cache, and each row against its own unbatched run."""
+    tokenizer.padding_side = "left"
+    tokens = tokenizer(prompts, return_tensors='pt', padding=True)
+    kwargs = dict(max_new_tokens=16, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+
+    def plain():
+        with torch.no_grad():
+            return model.generate(**tokens, **kwargs)
+
+    def cached():
+        return PREFIX_CACHE.generate(model, tokenizer, name, prefix, tokens, **kwargs)
+
+    plain_ms = _median_ms(plain, repeats)
+    cached_ms = _median_ms(cached, repeats)
+    batched = cached()[:, tokens["input_ids"].shape[1]:]
+    same = torch.equal(plain()[:, tokens["input_ids"].shape[1]:], batched)
+    single = [cached_row for prompt, cached_row in zip(prompts, batched)
+              if torch.equal(_single_completion(name, prefix, prompt, kwargs), cached_row[:16])]
+    print(f"{name + ' x' + str(len(prompts)):<11} prompt={tokens['input_ids'].shape[1]:>5} tok  "
+          f"plain={plain_ms:8.2f} ms  cached={cached_ms:8.2f} ms  speedup={plain_ms / cached_ms:5.2f}x  "
+          f"identical={same}  rows as unbatched={len(single)}/{len(prompts)}")
+
+
+def _single_completion(name: str, prefix: str, prompt: str, kwargs: dict):
+    tokens = tokenizer(prompt, return_tensors='pt')
+    output_ids = PREFIX_CACHE.generate(model, tokenizer, name, prefix, tokens, **kwargs)
+    return output_ids[0, tokens["input_ids"].shape[1]:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    question = "Will AAPL stock go up next week?"
+    bench_module("router", ROUTER_PROMPT_PREFIX, build_router_prompt(question), args.repeats)
+    bench_module("finred", finred_prompt_prefix(), build_finred_prompt("Who founded Amazon?"), args.repeats)
+    bench_module("forecaster", FORECAST_EXAMPLES,
+                 FORECAST_EXAMPLES + FORECAST_PROMPT_SUFFIX.format(intro=SAMPLE_INTRO, question=question),
+                 args.repeats)
+
+    questions = ["Will AAPL stock go up next week?", "What is the EPS of MSFT?",
+                 "Who is the CEO of the company that makes the iPhone?", "Is NVDA a buy?"]
+    bench_batch("router", ROUTER_PROMPT_PREFIX, [build_router_prompt(q) for q in questions], args.repeats)
@@ -0,0 +1,42 @@
+"""
+Cold-start time of the entry points that should not load a model.
+
+    python bench_startup.py --repeats 3
+"""
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+HERE = Path(__file__).parent
+
+CASES = [
+    ("pipeline.py --help", [sys.executable, "pipeline.py", "--help"]),
+    ("import pipeline", [sys.executable, "-c",
+                         "import sys, pipeline, model_loader; assert not model_loader.HANDLE.loaded; "
+                         "assert 'torch' not in sys.modules"]),
+    ("import parse_finred_output", [sys.executable, "-c",
+                                    "from finred import parse_finred_output; import model_loader; "
+                                    "assert not model_loader.HANDLE.loaded"]),
+    ("import evaluate", [sys.executable, "-c", "import evaluate; assert evaluate._embedder is None"]),
+]
+
+
+def time_command(cmd, repeats: int) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for label, cmd in CASES:
+        print(f"{label:<30} {time_command(cmd, args.repeats):6.2f} s")
@@ -0,0 +1,93 @@
+"""
+Decode steps saved by the per-module stop strings (stopping.py), measured on
+the recorded benchmark runs in data/pipeline_outputs_*.jsonl.
+
+For every recorded generation the stop point is located in the generated
+text; everything the model produced after it is decode work the stopping
+criteria would have skipped. FinQA records hold the full decode, forecaster
+records the text after "[Your Forecast]:"; FinRED records only keep the
+parsed relations, so their count is a lower bound. Router generations are
+not recorded.
+
+    python bench_stopping.py
+    python bench_stopping.py --tokenizer NousResearch/Nous-Hermes-2-Mistral-7B-DPO
+"""
+import json
+import argparse
+from pathlib import Path
+from stopping import MODULE_STOPS
+
+DATA_DIR = Path(__file__).parent / "data"
+RUNS = ["pipeline_outputs_Hermes.jsonl", "pipeline_outputs_mistral.jsonl"]
+# Relations of the FinRED prompt examples, echoed at the start of old outputs
+FINRED_ECHO = "founded_by: Tesla, Elon Musk; headquarters_location: Amazon, Seattle; parent_organization: Instagram, Meta"
+
+
+def generated_text(item: dict):
+    """(stage, generated text) of one pipeline_outputs record, or None."""
+    module, output = item["routed_module"], item["pipeline_output"]
+    if module == "FinQA":
+        marker = f"Q: {item['input']}\nA:"
+        i = output.find(marker)
+        return ("finqa", output[i + len(marker):]) if i != -1 else None
+    if module == "FinRED":
+        if output.startswith(FINRED_ECHO):
+            output = output[len(FINRED_ECHO):].lstrip("; ")
+        return "finred", "\n" + output.replace("; ", "\n")
+    if module == "Forecaster":
+        return "forecaster", " " + output
+    return None
+
+
+def token_counter(name):
+    """Token count function, falling back to ~4 characters per token."""
+    try:
+        if name:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(name)
+        else:
+            from standin import build_standin_tokenizer
+            tokenizer = build_standin_tokenizer()
+    except ImportError:
+        print("[Stopping] tokenizers not installed, estimating 4 characters per token")
+        return lambda text: (len(text) + 3) // 4
+    return lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def measure(path: Path, count_tokens) -> dict:
+    stats = {}
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            found = generated_text(json.loads(line))
+            if found is None:
+                continue
+            stage, text = found
+            s = stats.setdefault(stage, {"rows": 0, "stopped": 0, "steps": 0, "steps_with_stops": 0})
+            steps = count_tokens(text)
+            cut = MODULE_STOPS[stage].find(text)
+            s["rows"] += 1
+            s["steps"] += steps
+            if cut is None:
+                s["steps_with_stops"] += steps
+            else:
+                s["stopped"] += 1
+                # The step that produced the stop string still runs
+                s["steps_with_stops"] += min(steps, count_tokens(text[:cut]) + 1)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokenizer", type=str, default=None, help="HF tokenizer (default: offline stand-in)")
+    args = parser.parse_args()
+
+    count_tokens = token_counter(args.tokenizer)
+    print(f"{'run':<34}{'module':<12}{'rows':>6}{'stopped':>9}{'steps':>9}{'with stops':>12}{'saved':>9}")
+    for name in RUNS:
+        for stage, s in sorted(measure(DATA_DIR / name, count_tokens).items()):
+            saved = s["steps"] - s["steps_with_stops"]
+            share = 100 * saved / s["steps"] if s["steps"] else 0.0
+            print(f"{name:<34}{stage:<12}{s['rows']:>6}{s['stopped']:>9}{s['steps']:>9}"
+                  f"{s['steps_with_stops']:>12}{share:>8.1f}%")
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark of SymbolIndex against the original linear substring scan.
+
+    python bench_symbol_index.py --universe 5000
+"""
+import json
+import time
+import random
+import string
+import argparse
+from pathlib import Path
+from indices import DOW_30, EURO_STOXX_50, CRYPTO, COMPANY_ALIASES
+from symbols import SymbolIndex
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+def legacy_extract(question: str, universe: list) -> str:
+    q = question.upper()
+    for symbol in universe:
+        if symbol in q:
+            return symbol
+    return "AAPL"
+
+
+def load_questions() -> list:
+    questions = []
+    for name in ["finchatbot_300_dataset.jsonl", "clean_router_testset_60.jsonl"]:
+        with open(DATA_DIR / name, "r") as f:
+            questions.extend(json.loads(line)["input"] for line in f if line.strip())
+    return questions
+
+
+def synthetic_universe(size: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    universe = set(DOW_30 + EURO_STOXX_50 + CRYPTO)
+    while len(universe) < size:
+        universe.add("".join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 5))))
+    return sorted(universe)
+
+
+def time_per_call(fn, questions: list, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for q in questions:
+            fn(q)
+    return 1e6 * (time.perf_counter() - start) / (repeats * len(questions))
+
+
+def run(universe: list, questions: list, repeats: int):
+    index = SymbolIndex(universe, COMPANY_ALIASES)
+    legacy_us = time_per_call(lambda q: legacy_extract(q, universe), questions, repeats)
+    index_us = time_per_call(index.extract, questions, repeats)
+    print(f"universe={len(universe):>6}  legacy={legacy_us:9.2f} us/question  "
+          f"index={index_us:7.2f} us/question  speedup={legacy_us / index_us:7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--universe", type=int, default=5000, help="Size of the synthetic ticker universe")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    questions = load_questions()
+    run(DOW_30 + EURO_STOXX_50 + CRYPTO, questions, args.repeats)
+    run(synthetic_universe(args.universe), questions, args.repeats)
+
+    # Questions where the substring scan fires on a ticker that is not a mentioned word
+    index = SymbolIndex(DOW_30 + EURO_STOXX_50 + CRYPTO, COMPANY_ALIASES)
+    spurious = [(q, legacy_extract(q, DOW_30 + EURO_STOXX_50 + CRYPTO)) for q in questions
+                if legacy_extract(q, DOW_30 + EURO_STOXX_50 + CRYPTO) not in index.extract(q) + ["AAPL"]]
+    print(f"legacy substring matches not mentioned as a word: {len(spurious)}/{len(questions)}")
+    for q, symbol in spurious[:5]:
+        print(f"  {symbol:<6} <- {q}")
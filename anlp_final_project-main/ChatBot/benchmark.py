@@ -0,0 +1,222 @@
+"""
+End-to-end latency/throughput benchmark of run_pipeline on a CPU-only box.
+
+Runs router + FinQA / FinRED / Forecaster against the randomly initialized
+stand-in model (standin.py) and the local company-profile fixture, so no
+weights, GPU or network are needed. The stand-in's router output is
+meaningless, so questions are dispatched to their labeled module through a
+"bench" router that still runs (and times) the real router first.
+
+    python benchmark.py --out bench_results/HEAD.json
+    python benchmark.py --compare bench_results/base.json bench_results/HEAD.json
+"""
+import os
+os.environ.setdefault("FINBOT_MODEL_NAME", "standin")
+
+import sys
+import json
+import time
+import random
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+import torch
+from model_loader import HANDLE
+from model_registry import REGISTRY
+from standin import build_standin_model, build_standin_tokenizer
+from gen_cache import GENERATION_CACHE
+from route_cache import ROUTE_CACHE
+from prefix_cache import PREFIX_CACHE
+from profiles import PROFILE_PROVIDER, FixtureBackend
+from metrics import METRICS
+import stopping
+import pipeline
+
+DATA_DIR = Path(__file__).parent / "data"
+MODULES = ["FinQA", "FinRED", "Forecaster"]
+# Spans reported per module; "router" and "pipeline" cover every question
+REPORTED_SPANS = ["pipeline", "router", "router.generate", "finqa", "finqa.generate",
+                  "finred", "finred.generate", "forecaster", "forecaster.generate", "profile.fetch"]
+
+
+def load_questions(per_module: int, seed: int) -> list:
+    """per_module labeled questions for each module from finchatbot_300_dataset.jsonl."""
+    by_module = {m: [] for m in MODULES}
+    with open(DATA_DIR / "finchatbot_300_dataset.jsonl", "r") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                if item.get("module") in by_module:
+                    by_module[item["module"]].append(item["input"])
+    rng = random.Random(seed)
+    questions = []
+    for module in MODULES:
+        for q in rng.sample(by_module[module], min(per_module, len(by_module[module]))):
+            questions.append((module, q))
+    return questions
+
+
+def install_bench_router(labels: dict):
+    def bench_router(questions):
+        pipeline.central_router_batch(questions)
+        return [labels[q] for q in questions]
+    pipeline.ROUTERS["bench"] = bench_router
+
+
+def setup(args, profile_store: str):
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    tokenizer = build_standin_tokenizer()
+    model = build_standin_model(tokenizer, hidden_size=args.hidden_size, num_layers=args.layers, seed=args.seed)
+    HANDLE.set(model, tokenizer, model_name="standin")
+    REGISTRY.enabled = False
+
+    PROFILE_PROVIDER.backend = FixtureBackend()
+    PROFILE_PROVIDER.store_path = Path(profile_store)
+    PROFILE_PROVIDER.invalidate()
+    GENERATION_CACHE.bypass = True
+    ROUTE_CACHE.enabled = False
+    PREFIX_CACHE.enabled = not args.no_prefix_cache
+    stopping.STOP_STRINGS_ENABLED = not args.no_stop_strings
+    METRICS.configure(enabled=True, path=args.spans)
+    return model
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except OSError:
+        return ""
+
+
+def summarize(summary: dict, questions: list, elapsed: float) -> dict:
+    spans = {}
+    for name in REPORTED_SPANS:
+        s = summary.get(name)
+        if not s:
+            continue
+        entry = {k: round(s[k], 3) for k in ("count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms")}
+        if s.get("prefill_seconds"):
+            entry["prefill_tok_s"] = round(s.get("prompt_tokens", 0) / s["prefill_seconds"], 1)
+        if s.get("decode_seconds"):
+            entry["decode_tok_s"] = round(s.get("generated_tokens", 0) / s["decode_seconds"], 1)
+        for key in ("prompt_tokens", "generated_tokens", "prefix_cached_tokens", "decode_steps", "decode_steps_saved"):
+            if key in s:
+                entry[key] = s[key]
+        spans[name] = entry
+    return {
+        "questions": len(questions),
+        "elapsed_s": round(elapsed, 3),
+        "questions_per_s": round(len(questions) / elapsed, 3) if elapsed > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "spans": spans,
+    }
+
+
+def run(args) -> dict:
+    questions = load_questions(args.per_module, args.seed)
+    install_bench_router({q: module for module, q in questions})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = setup(args, os.path.join(tmp, "profiles.json"))
+
+        # Warm-up: one question per module, not measured
+        for module in MODULES:
+            question = next(q for m, q in questions if m == module)
+            pipeline.run_pipeline(question, router="bench")
+        METRICS.reset()
+
+        failures = 0
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            for module, question in questions:
+                try:
+                    pipeline.run_pipeline(question, router="bench")
+                except Exception as e:
+                    failures += 1
+                    print(f"[Benchmark] {module} failed on {question!r}: {e}")
+        elapsed = time.perf_counter() - start
+
+    result = summarize(METRICS.summary(), questions * args.repeats, elapsed)
+    result["failures"] = failures
+    result["meta"] = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": __import__("transformers").__version__,
+        "threads": torch.get_num_threads(),
+        "params": sum(p.numel() for p in model.parameters()),
+        "args": vars(args),
+    }
+    return result
+
+
+def print_result(result: dict):
+    print(f"{result['questions']} questions in {result['elapsed_s']:.2f}s "
+          f"({result['questions_per_s']} q/s) | peak RSS {result['peak_rss_mb']} MB | failures {result['failures']}")
+    print(f"{'span':<22}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'prefill tok/s':>15}{'decode tok/s':>14}")
+    for name, s in result["spans"].items():
+        print(f"{name:<22}{s['count']:>5}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+              f"{s.get('prefill_tok_s', ''):>15}{s.get('decode_tok_s', ''):>14}")
+    for name, s in result["spans"].items():
+        if "decode_steps" in s:
+            print(f"{name}: {s['decode_steps']} decode steps, {s['decode_steps_saved']} saved")
+
+
+def compare(base_path: str, head_path: str):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    print(f"base {base['meta'].get('commit')} -> head {head['meta'].get('commit')}")
+    print(f"{'span':<22}{'metric':<15}{'base':>12}{'head':>12}{'change':>10}")
+    for name, h in head["spans"].items():
+        b = base["spans"].get(name)
+        if not b:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "prefill_tok_s", "decode_tok_s"):
+            if metric in b and metric in h and b[metric]:
+                change = 100 * (h[metric] - b[metric]) / b[metric]
+                print(f"{name:<22}{metric:<15}{b[metric]:>12.1f}{h[metric]:>12.1f}{change:>+9.1f}%")
+    for metric in ("questions_per_s", "peak_rss_mb"):
+        if base.get(metric) and head.get(metric):
+            change = 100 * (head[metric] - base[metric]) / base[metric]
+            print(f"{'total':<22}{metric:<15}{base[metric]:>12.1f}{head[metric]:>12.1f}{change:>+9.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--per-module", type=int, default=5, help="Questions per module")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-prefix-cache", action="store_true")
+    parser.add_argument("--no-stop-strings", action="store_true", help="Decode every row to max_new_tokens or EOS")
+    parser.add_argument("--spans", type=str, default=None, help="Also append every span as JSON lines here")
+    parser.add_argument("--out", type=str, default=None, help="Write results JSON here")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        result = run(args)
+        print_result(result)
+        if args.out:
+            Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.out, "w") as f:
+                json.dump(result, f, indent=2)
+            print(f"Results written to {args.out}")
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from gen_cache import CACHE_DIR
+
+
+class EmbeddingCache:
+    """
+    Persistent sentence-embedding store keyed by a hash of (model name, text).
+    Meant for texts that never change between runs, such as reference answers.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CACHE_DIR / "embeddings.sqlite"
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(str(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        return self._conn
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def encode(self, embedder, model_name: str, texts: list, batch_size: int = 64) -> np.ndarray:
+        """
+        Embeddings of texts as a float32 matrix, one row per text. Only texts
+        not cached yet are encoded, in batches, and then stored.
+        """
+        keys = [self.make_key(model_name, t) for t in texts]
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for key in set(keys):
+                row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    found[key] = np.frombuffer(row[0], dtype=np.float32)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for k in keys if k in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = embedder.encode(list(missing.values()), batch_size=batch_size, convert_to_numpy=True)
+            vectors = np.asarray(vectors, dtype=np.float32)
+            with self._lock:
+                conn = self._connect()
+                for key, vector in zip(missing, vectors):
+                    conn.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                 (key, vector.tobytes()))
+                    found[key] = vector
+                conn.commit()
+
+        return np.stack([found[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+
+EMBEDDING_CACHE = EmbeddingCache(path=os.getenv("FINBOT_EMBEDDING_CACHE_PATH"))
@@ -0,0 +1,209 @@
+import time
+import threading
+from model_registry import REGISTRY
+from gen_cache import GENERATION_CACHE
+from prefix_cache import PREFIX_CACHE
+from batching import left_padding, run_bucketed
+from metrics import METRICS
+from stopping import (stopping_kwargs, mixed_stopping_kwargs, stop_signature, trim_completions, decode_steps,
+                      StopTrimmer)
+
+
+class GenerationEngine:
+    """
+    The one tokenize -> generate -> decode path shared by the router, FinQA,
+    FinRED and the forecaster.
+
+    Every call takes a list of prompts and returns only the text generated
+    after each prompt. Prompts are cut to a common context budget (model
+    context minus max_new_tokens), keeping their end, so the question is
+    never lost. Decoding is greedy. The generation cache, the prefix KV
+    cache, metrics spans and stop strings are applied here and nowhere else.
+    stream() is the same path for one prompt, yielding text as it decodes.
+    """
+
+    def __init__(self, cache=GENERATION_CACHE, prefix_cache=PREFIX_CACHE):
+        self.cache = cache
+        self.prefix_cache = prefix_cache
+
+    @staticmethod
+    def context_budget(model, tokenizer, max_new_tokens: int, max_length: int = None) -> int:
+        """Prompt tokens that fit in the context next to max_new_tokens."""
+        limit = getattr(model.config, "max_position_embeddings", None) or tokenizer.model_max_length
+        budget = limit - max_new_tokens
+        if max_length is not None:
+            budget = min(budget, max_length)
+        return max(1, budget)
+
+    @staticmethod
+    def encode(model, tokenizer, prompts: list, budget: int) -> dict:
+        """Left-padded batch of prompts, each cut to its last budget tokens."""
+        input_ids = [ids[-budget:] for ids in tokenizer(prompts, truncation=False)["input_ids"]]
+        with left_padding(tokenizer):
+            tokens = tokenizer.pad({"input_ids": input_ids}, return_tensors='pt')
+        return {k: v.to(model.device) for k, v in tokens.items()}
+
+    def generate(self, stage: str, prompts: list, max_new_tokens: int, prefix: str = None,
+                 max_length: int = None) -> list:
+        """
+        Completions for prompts, served from the generation cache where
+        possible; the rest run in one padded generate call. prefix is the
+        static prompt head whose KV state the prefix cache may reuse.
+        """
+        model, tokenizer = REGISTRY.get(stage)
+        budget = self.context_budget(model, tokenizer, max_new_tokens, max_length)
+        return self.cache.cached_generate(
+            REGISTRY.model_id(stage), prompts, self._cache_kwargs(stage, max_new_tokens, budget),
+            lambda batch: self._generate(model, tokenizer, stage, batch, max_new_tokens, budget, prefix)
+        )
+
+    def stream(self, stage: str, prompt: str, max_new_tokens: int, prefix: str = None,
+               max_length: int = None):
+        """
+        Completion of one prompt as text pieces, yielded while it is decoded.
+        The pieces join to exactly what generate() returns for the prompt.
+        Time to the first piece is recorded as a "<stage>.ttft" span.
+        """
+        from transformers import TextIteratorStreamer
+
+        start = time.perf_counter()
+        model, tokenizer = REGISTRY.get(stage)
+        budget = self.context_budget(model, tokenizer, max_new_tokens, max_length)
+        key = self.cache.make_key(REGISTRY.model_id(stage), prompt, self._cache_kwargs(stage, max_new_tokens, budget))
+        cached = None if self.cache.bypass else self.cache.get(key)
+        if cached is not None:
+            METRICS.add(cache_hits=1)
+            METRICS.observe(f"{stage}.ttft", time.perf_counter() - start)
+            yield cached
+            return
+
+        with METRICS.span(f"{stage}.tokenize", batch=1):
+            tokens = self.encode(model, tokenizer, [prompt], budget)
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        failure = []
+
+        def run():
+            try:
+                self._run_generate(model, tokenizer, stage, tokens, max_new_tokens, prefix, streamer=streamer)
+            except Exception as e:
+                failure.append(e)
+            finally:
+                # Ends the stream even if generate() failed or ignored the streamer
+                streamer.end()
+
+        thread = threading.Thread(target=run, name=f"{stage}-stream", daemon=True)
+        thread.start()
+        trimmer = StopTrimmer(stage)
+        first = True
+        try:
+            for text in streamer:
+                piece = trimmer.feed(text)
+                if piece:
+                    if first:
+                        METRICS.observe(f"{stage}.ttft", time.perf_counter() - start)
+                        first = False
+                    yield piece
+            piece = trimmer.finish()
+            if piece:
+                yield piece
+        finally:
+            thread.join()
+        if failure:
+            raise failure[0]
+        if not self.cache.bypass:
+            self.cache.put(key, trimmer.output)
+
+    @staticmethod
+    def _cache_kwargs(stage: str, max_new_tokens: int, budget: int) -> dict:
+        return {"module": stage, "max_new_tokens": max_new_tokens, "context": budget, "stop": stop_signature(stage)}
+
+    def generate_bucketed(self, stage: str, prompts: list, batch_size: int, max_new_tokens: int,
+                          prefix: str = None) -> list:
+        """generate() over length-sorted buckets of batch_size, in input order."""
+        tokenizer = REGISTRY.get(stage)[1]
+        return run_bucketed(prompts, batch_size,
+                            lambda batch: self.generate(stage, batch, max_new_tokens, prefix), tokenizer, stage)
+
+    def generate_mixed(self, stages: list, prompts: list, max_new_tokens: list) -> list:
+        """
+        Completions of prompts from different stages (e.g. the sub-questions
+        of a multi-hop question) in one padded generate call. Each row stops
+        at its own stage's stop strings and max_new_tokens, so the call takes
+        about as long as its longest row. Rows are cached like generate().
+        Stages served by different models or adapters (see model_registry)
+        cannot share a call; each such group runs on its own.
+        """
+        model_ids = [REGISTRY.model_id(stage) for stage in stages]
+        if len(set(model_ids)) > 1:
+            outputs = [None] * len(prompts)
+            for group in dict.fromkeys(model_ids):
+                rows = [i for i, m in enumerate(model_ids) if m == group]
+                texts = self.generate_mixed([stages[i] for i in rows], [prompts[i] for i in rows],
+                                            [max_new_tokens[i] for i in rows])
+                for i, text in zip(rows, texts):
+                    outputs[i] = text
+            return outputs
+
+        model, tokenizer = REGISTRY.get(stages[0])
+        budget = self.context_budget(model, tokenizer, max(max_new_tokens))
+        if self.cache.bypass:
+            return self._generate_mixed(model, tokenizer, stages, prompts, max_new_tokens, budget)
+
+        keys = [self.cache.make_key(model_ids[0], prompt, self._cache_kwargs(stage, n, budget))
+                for stage, prompt, n in zip(stages, prompts, max_new_tokens)]
+        outputs = [self.cache.get(key) for key in keys]
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        METRICS.add(cache_hits=len(prompts) - len(missing), cache_misses=len(missing))
+        if missing:
+            generated = self._generate_mixed(model, tokenizer, [stages[i] for i in missing],
+                                             [prompts[i] for i in missing], [max_new_tokens[i] for i in missing],
+                                             budget)
+            for i, text in zip(missing, generated):
+                outputs[i] = text
+                self.cache.put(keys[i], text)
+        return outputs
+
+    def _generate_mixed(self, model, tokenizer, stages: list, prompts: list, max_new_tokens: list,
+                        budget: int) -> list:
+        with METRICS.span("mixed.tokenize", batch=len(prompts)):
+            tokens = self.encode(model, tokenizer, prompts, budget)
+        stopping = mixed_stopping_kwargs(stages, tokenizer, tokens, max_new_tokens)
+        output_ids = self._run_generate(model, tokenizer, "mixed", tokens, max(max_new_tokens), None,
+                                        stopping=stopping)
+        new_ids = output_ids[:, tokens["input_ids"].shape[1]:]
+        return [trim_completions(stage, [tokenizer.decode(ids[:n], skip_special_tokens=True)])[0]
+                for stage, ids, n in zip(stages, new_ids, max_new_tokens)]
+
+    def _generate(self, model, tokenizer, stage: str, prompts: list, max_new_tokens: int, budget: int,
+                  prefix: str) -> list:
+        with METRICS.span(f"{stage}.tokenize", batch=len(prompts)):
+            tokens = self.encode(model, tokenizer, prompts, budget)
+        output_ids = self._run_generate(model, tokenizer, stage, tokens, max_new_tokens, prefix)
+        new_ids = output_ids[:, tokens["input_ids"].shape[1]:]
+        return trim_completions(stage, tokenizer.batch_decode(new_ids, skip_special_tokens=True))
+
+    def _run_generate(self, model, tokenizer, stage: str, tokens: dict, max_new_tokens: int, prefix: str,
+                      stopping: dict = None, **extra):
+        import torch
+
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        with METRICS.span(f"{stage}.generate", batch=tokens["input_ids"].shape[0]) as span, torch.no_grad():
+            generate_kwargs = dict(
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                eos_token_id=tokenizer.eos_token_id,
+                pad_token_id=pad_token_id,
+                **METRICS.generate_kwargs(span),
+                **(stopping if stopping is not None else stopping_kwargs(stage, tokenizer, tokens)),
+                **extra
+            )
+            if prefix is None:
+                output_ids = model.generate(**tokens, **generate_kwargs)
+            else:
+                output_ids = self.prefix_cache.generate(model, tokenizer, stage, prefix, tokens, **generate_kwargs)
+            METRICS.record_generation(span, tokens, output_ids, pad_token_id)
+            span.add(**decode_steps(tokens, output_ids, max_new_tokens))
+        return output_ids
+
+
+ENGINE = GenerationEngine()
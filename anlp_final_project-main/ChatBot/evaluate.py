@@ -4,10 +4,37 @@ from pathlib import Path
 from collections import defaultdict
 from sklearn.metrics import accuracy_score, mean_squared_error
 from rouge_score import rouge_scorer
-from sentence_transformers import SentenceTransformer, util
-
-# --- Load embedding model for FinQA ---
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+from triple_matcher import soft_match, soft_match_triples
+
+# --- Embedding model for FinQA (loaded on first use) ---
+EMBEDDER_NAME = 'all-MiniLM-L6-v2'
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        from sentence_transformers import SentenceTransformer
+        _embedder = SentenceTransformer(EMBEDDER_NAME)
+    return _embedder
+
+
+def finqa_similarities(refs, preds, batch_size=64):
+    """
+    Paired cosine similarity of every (reference, prediction) pair. Both sides
+    are encoded in large batches; reference embeddings come from the
+    persistent embedding cache since references never change between runs.
+    """
+    if not refs:
+        return []
+    import torch
+    from sentence_transformers import util
+    from embedding_cache import EMBEDDING_CACHE
+
+    embedder = get_embedder()
+    emb_ref = EMBEDDING_CACHE.encode(embedder, EMBEDDER_NAME, refs, batch_size=batch_size)
+    emb_pred = embedder.encode(preds, batch_size=batch_size, convert_to_numpy=True)
+    return util.pairwise_cos_sim(torch.from_numpy(emb_ref), torch.from_numpy(emb_pred)).tolist()
 
 # --- FinRED Soft Match Utilities ---
 def extract_tuples(text):
@@ -26,20 +53,6 @@ def normalize_triple(triple):
     rel, head, tail = triple
     return (rel.lower().strip(), normalize_entity(head), normalize_entity(tail))
 
-def soft_match(a: str, b: str, threshold: float = 0.7) -> bool:
-    a, b = a.lower(), b.lower()
-    overlap = sum(1 for ch in a if ch in b)
-    return (overlap / max(len(a), len(b))) >= threshold
-
-def soft_match_triples(pred_triples, gold_triples, threshold=0.7):
-    matched = 0
-    for gt in gold_triples:
-        for pt in pred_triples:
-            if gt[0] == pt[0] and soft_match(gt[1], pt[1], threshold) and soft_match(gt[2], pt[2], threshold):
-                matched += 1
-                break
-    return matched
-
 # --- FinForecaster Parser ---
 def parse_answer(answer):
     try:
@@ -89,7 +102,7 @@ def evaluate_pipeline_with_softmatch(jsonl_path):
     with open(jsonl_path) as f:
         data = [json.loads(line) for line in f]
 
-    finqa_scores, finred_gold, finred_pred = [], [], []
+    finqa_refs, finqa_preds, finred_gold, finred_pred = [], [], [], []
     forecast_outputs, forecast_refs, forecast_instrs = [], [], []
 
     for i, entry in enumerate(data):
@@ -99,10 +112,8 @@ def evaluate_pipeline_with_softmatch(jsonl_path):
         pred = entry["pipeline_output"].strip()
 
         if module == "FinQA":
-            emb_ref = embedder.encode(gt, convert_to_tensor=True)
-            emb_pred = embedder.encode(pred, convert_to_tensor=True)
-            score = util.cos_sim(emb_ref, emb_pred).item()
-            finqa_scores.append(score)
+            finqa_refs.append(gt)
+            finqa_preds.append(pred)
 
         elif module == "FinRED":
             gold = set(normalize_triple(t) for t in extract_tuples(gt))
@@ -115,6 +126,7 @@ def evaluate_pipeline_with_softmatch(jsonl_path):
             forecast_refs.append(gt)
             forecast_instrs.append(instr)
 
+    finqa_scores = finqa_similarities(finqa_refs, finqa_preds)
     if finqa_scores:
         print(f"\n[FinQA Evaluation] Avg Cosine Similarity: {sum(finqa_scores)/len(finqa_scores):.4f}")
 
@@ -163,4 +175,5 @@ def evaluate_pipeline_with_softmatch(jsonl_path):
 
 
 # Example usage:
-evaluate_pipeline_with_softmatch("FinChatBot/data/pipeline_outputs_Hermes.jsonl")
\ No newline at end of file
+if __name__ == "__main__":
+    evaluate_pipeline_with_softmatch("FinChatBot/data/pipeline_outputs_Hermes.jsonl")
\ No newline at end of file
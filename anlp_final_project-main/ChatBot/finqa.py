@@ -1,14 +1,15 @@
-import torch
 from pathlib import Path
-from datasets import load_from_disk
-import pandas as pd
-from model_loader import model, tokenizer
+from engine import ENGINE
+from metrics import METRICS
+from streaming import AnswerStream
 
 
 def preprocess_finqa_dataset(dataset_path: str = None, sample_size: int = 100):
     """
     Load and preprocess the FIQA dataset, then return a list of questions (inputs).
     """
+    from datasets import load_from_disk
+
     if dataset_path is None:
         dataset_path = Path(__file__).parent.parent / 'data/fiqa-2018/'
 
@@ -30,46 +31,11 @@ def parse_finqa_output(output: str) -> str:
     return output.strip()
 
 
-def run_finqa(question: str, max_new_tokens: int = 256) -> str:
-    """
-    Generate a financial answer using the FinQA module (powered by an LLM).
-    Fixes previous issues where the model repeated few-shot answers.
-    """
-    prompt = build_finqa_prompt(question)
-    prompt += "\n"
-
-    print(f"\n===== PROMPT DEBUG =====\n{prompt}\n========================\n")
-
-    # Tokenize without truncation
-    tokens = tokenizer(
-        prompt,
-        return_tensors='pt',
-        truncation=False
-    )
-
-    # Truncate manually to fit within the model's max context length
-    max_input_len = getattr(model.config, "max_position_embeddings", 1024)
-    for k in tokens:
-        tokens[k] = tokens[k][:, -max_input_len:]
-
-    # Move tokens to the model's device
-    tokens = {k: v.to(model.device) for k, v in tokens.items()}
-
-    # Generate model output
-    with torch.no_grad():
-        output_ids = model.generate(
-            **tokens,
-            max_new_tokens=256,  # increase from 128 or 256
-            do_sample=False,
-            temperature=0.0,
-            early_stopping=False,
-            eos_token_id=tokenizer.eos_token_id,
-            pad_token_id=tokenizer.eos_token_id
-        )
-
-    # Decode and extract the final answer
-    output_text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
+# extract_finqa_answer keeps what follows the last of these
+FINQA_MARKERS = ("### NEW QUESTION BELOW ###", "Answer:")
+
 
+def extract_finqa_answer(output_text: str) -> str:
     if "### NEW QUESTION BELOW ###" in output_text:
         output_text = output_text.split("### NEW QUESTION BELOW ###")[-1]
 
@@ -79,3 +45,52 @@ def run_finqa(question: str, max_new_tokens: int = 256) -> str:
     return parse_finqa_output(output_text)
 
 
+def generate_finqa(prompts: list, max_new_tokens: int = 256) -> list:
+    """
+    FinQA completions for a list of prompts (generated text only). A single
+    prompt goes through the same path.
+    """
+    return ENGINE.generate("finqa", prompts, max_new_tokens)
+
+
+def run_finqa(question: str, max_new_tokens: int = 256) -> str:
+    """
+    Generate a financial answer using the FinQA module (powered by an LLM).
+    Fixes previous issues where the model repeated few-shot answers.
+    """
+    with METRICS.span("finqa"):
+        prompt = build_finqa_prompt(question)
+        prompt += "\n"
+
+        # Decode and extract the final answer
+        output_text = generate_finqa([prompt], max_new_tokens)[0]
+        with METRICS.span("finqa.parse"):
+            return extract_finqa_answer(output_text)
+
+
+def run_finqa_batch(questions: list, batch_size: int = 8, max_new_tokens: int = 256) -> list:
+    """
+    Batched run_finqa: prompts are sorted by length into buckets of batch_size
+    and each bucket is one padded generate call.
+    """
+    with METRICS.span("finqa", batch=len(questions)):
+        prompts = [build_finqa_prompt(q) + "\n" for q in questions]
+        texts = ENGINE.generate_bucketed("finqa", prompts, batch_size, max_new_tokens)
+        with METRICS.span("finqa.parse", batch=len(texts)):
+            return [extract_finqa_answer(text) for text in texts]
+
+
+def run_finqa_stream(question: str, max_new_tokens: int = 256):
+    """
+    run_finqa as a stream of events (see streaming.py): the answer arrives
+    while it is generated and ends identical to run_finqa's.
+    """
+    prompt = build_finqa_prompt(question) + "\n"
+    answer = AnswerStream(FINQA_MARKERS)
+    pieces = []
+    for piece in ENGINE.stream("finqa", prompt, max_new_tokens):
+        pieces.append(piece)
+        yield from answer.feed(piece)
+    output = extract_finqa_answer("".join(pieces))
+    yield from answer.finish(output)
+    yield {"event": "done", "output": output}
@@ -1,6 +1,9 @@
 import re
-import torch
-from model_loader import model, tokenizer
+from engine import ENGINE
+from metrics import METRICS
+from streaming import delta
+
+FINRED_MAX_NEW_TOKENS = 48
 
 RELATIONS = [
     'product_or_material_produced', 'manufacturer', 'distributed_by', 'industry',
@@ -21,10 +24,13 @@ ALIAS_MAP = {
 }
 
 
-def build_finred_prompt(text: str) -> str:
+def finred_prompt_prefix() -> str:
+    """
+    Static instructions and examples shared by every FinRED prompt.
+    """
     relation_list = ", ".join(RELATIONS)
 
-    prompt = f"""You are a financial information extraction assistant.
+    return f"""You are a financial information extraction assistant.
 
 Your task is to extract **only one valid financial relation** that directly answers the given question.
 
@@ -59,9 +65,15 @@ parent_organization: Instagram, Meta
 [END OF EXAMPLES]
 
 Now answer the following:
-Question: {text.strip()}
+"""
+
+
+FINRED_PROMPT_SUFFIX = """Question: {text}
 Answer:"""
-    return prompt
+
+
+def build_finred_prompt(text: str) -> str:
+    return finred_prompt_prefix() + FINRED_PROMPT_SUFFIX.format(text=text.strip())
 
 
 def parse_finred_output(output_text: str, source_text: str = ""):
@@ -102,40 +114,58 @@ def parse_finred_output(output_text: str, source_text: str = ""):
     return triples
 
 
-def run_finred(text: str, max_new_tokens: int = 256) -> str:
-    prompt = build_finred_prompt(text)
-    tokens = tokenizer(prompt, return_tensors='pt', padding=True, truncation=False)
-    tokens = {k: v.to(model.device) for k, v in tokens.items()}
-
-    with torch.no_grad():
-        output_ids = model.generate(
-            **tokens,
-            max_new_tokens=48,
-            eos_token_id=tokenizer.eos_token_id,
-            pad_token_id=tokenizer.pad_token_id,
-            do_sample=False
-        )
-
-    full_output = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-
-    # Extract answer portion only (after Output:)
-    if "Answer:" in full_output:
-        output_text = full_output.split("Output:", 1)[-1]
-    else:
-        output_text = full_output
+def generate_finred(prompts: list, max_new_tokens: int = FINRED_MAX_NEW_TOKENS) -> list:
+    """
+    FinRED completions for a list of prompts (generated text only); the
+    shared instructions and examples are served from the prefix cache.
+    """
+    return ENGINE.generate("finred", prompts, max_new_tokens, prefix=finred_prompt_prefix())
+
+
+def extract_finred_relations(output_text: str, text: str) -> str:
+    # Keep only what follows an "Answer:"/"Output:" label the model repeated
+    output_text = re.split(r'(?:Answer|Output)\s*:', output_text)[-1]
 
     # Remove hallucinated instruction/text reprints
     output_text = re.sub(r'Text\s*:\s*.*', '', output_text, flags=re.IGNORECASE)
-    output_text = re.sub(r'^\s*Output\s*:\s*', '', output_text, flags=re.IGNORECASE)
     output_text = output_text.strip()
 
-    print("\n--- Raw model output ---")
-    print(output_text)
-    print("------------------------\n")
-
     relations = parse_finred_output(output_text, text)
 
     if not relations:
         return "[No valid relation extracted]"
 
     return "; ".join([f"{r[0]}: {r[1]}, {r[2]}" for r in relations])
+
+
+def run_finred(text: str, max_new_tokens: int = FINRED_MAX_NEW_TOKENS) -> str:
+    with METRICS.span("finred"):
+        prompt = build_finred_prompt(text)
+        output_text = generate_finred([prompt], max_new_tokens)[0]
+        with METRICS.span("finred.parse"):
+            return extract_finred_relations(output_text, text)
+
+
+def run_finred_batch(texts: list, batch_size: int = 8) -> list:
+    """
+    Batched run_finred: prompts are sorted by length into buckets of batch_size
+    and each bucket is one padded generate call.
+    """
+    with METRICS.span("finred", batch=len(texts)):
+        prompts = [build_finred_prompt(t) for t in texts]
+        outputs = ENGINE.generate_bucketed("finred", prompts, batch_size, FINRED_MAX_NEW_TOKENS,
+                                           prefix=finred_prompt_prefix())
+        with METRICS.span("finred.parse", batch=len(outputs)):
+            return [extract_finred_relations(out, t) for out, t in zip(outputs, texts)]
+
+
+def run_finred_stream(text: str, max_new_tokens: int = FINRED_MAX_NEW_TOKENS):
+    """
+    run_finred as a stream of events (see streaming.py). Relations are only
+    known once the answer line is complete, so the output arrives in one piece.
+    """
+    prompt = build_finred_prompt(text)
+    output_text = "".join(ENGINE.stream("finred", prompt, max_new_tokens, prefix=finred_prompt_prefix()))
+    output = extract_finred_relations(output_text, text)
+    yield delta(output)
+    yield {"event": "done", "output": output}
@@ -1,14 +1,14 @@
-import torch
 from prompt import get_company_prompt
-from model_loader import model, tokenizer
+from model_registry import REGISTRY
+from engine import ENGINE
+from prompt_budget import Section, fit_sections, token_counter, special_tokens
+from metrics import METRICS
+from streaming import AnswerStream
 
-def build_forecast_prompt(question: str, symbol: str) -> str:
-    """
-    Construct few-shot prompt using company profile + user question and 2 examples.
-    """
-    intro = get_company_prompt(symbol)
+FORECAST_MAX_NEW_TOKENS = 256
+FORECAST_MARKER = "[Your Forecast]:"
 
-    examples = """[Company Introduction]:
+FORECAST_EXAMPLES = """[Company Introduction]:
 Apple Inc is a major player in the technology sector, trading under AAPL. From 2024-03-01 to 2024-03-08, its stock price increased from 170.00 to 174.50.
 
 [Positive Developments]:
@@ -43,32 +43,88 @@ Analysis: While innovation continues, short-term headwinds from legal costs and
 ---
 """
 
-    return f"{examples}[Company Introduction]:\n{intro}\n\n[Question]: {question}\n[Your Forecast]:"
+FORECAST_PROMPT_SUFFIX = "[Company Introduction]:\n{intro}\n\n[Question]: {question}\n[Your Forecast]:"
+
+
+def forecast_sections(question: str, symbol: str) -> list:
+    """
+    The forecast prompt as prompt_budget sections: the two few-shot examples
+    may be dropped (the second one first), the company introduction and the
+    question are always kept.
+    """
+    intro = get_company_prompt(symbol)
+    first, second = FORECAST_EXAMPLES.split("---\n\n", 1)
+    return [
+        Section(first + "---\n\n", priority=(1,)),
+        Section(second, priority=(0,)),
+        Section(FORECAST_PROMPT_SUFFIX.format(intro=intro, question=question)),
+    ]
+
+
+def build_forecast_prompt(question: str, symbol: str, fit: bool = True) -> str:
+    """
+    Construct few-shot prompt using company profile + user question and 2 examples.
+    With fit, examples are dropped if the prompt would not fit in the model
+    context next to FORECAST_MAX_NEW_TOKENS.
+    """
+    sections = forecast_sections(question, symbol)
+    if not fit:
+        return "".join(s.text for s in sections)
+    model, tokenizer = REGISTRY.get("forecaster")
+    # The engine's budget counts the BOS token the tokenizer adds; the sections do not
+    budget = ENGINE.context_budget(model, tokenizer, FORECAST_MAX_NEW_TOKENS) - special_tokens(tokenizer)
+    prompt, stats = fit_sections(sections, budget, token_counter(tokenizer))
+    METRICS.add(prompt_tokens_saved=stats["tokens_before"] - stats["tokens"])
+    return prompt
+
+
+def generate_forecasts(prompts: list, max_new_tokens: int = FORECAST_MAX_NEW_TOKENS) -> list:
+    """
+    Forecaster completions for a list of prompts (generated text only); the
+    few-shot examples are served from the prefix cache.
+    """
+    return ENGINE.generate("forecaster", prompts, max_new_tokens, prefix=FORECAST_EXAMPLES)
+
+
+def extract_forecast(output_text: str) -> str:
+    return output_text.split(FORECAST_MARKER)[-1].strip()
 
 
 def run_forecaster(question: str, symbol: str) -> str:
-    prompt = build_forecast_prompt(question, symbol)
-
-    # Tokenize without setting max_length
-    tokens = tokenizer(
-        prompt,
-        return_tensors='pt',
-        padding=True,
-        truncation=True  # truncate if really needed
-        # Do NOT set max_length here
-    )
-    tokens = {k: v.to(model.device) for k, v in tokens.items()}
-
-    with torch.no_grad():
-        output_ids = model.generate(
-            **tokens,
-            max_new_tokens=256,
-            eos_token_id=tokenizer.eos_token_id,
-            do_sample=False
-        )
-
-    output_text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-    if "[Your Forecast]:" in output_text:
-        output_text = output_text.split("[Your Forecast]:")[-1].strip()
-    print(f"Prompt tokenized length: {tokens['input_ids'].shape[1]}")
-    return output_text
+    with METRICS.span("forecaster", symbol=symbol):
+        with METRICS.span("forecaster.prompt"):
+            prompt = build_forecast_prompt(question, symbol)
+        output_text = generate_forecasts([prompt])[0]
+        with METRICS.span("forecaster.parse"):
+            return extract_forecast(output_text)
+
+
+def run_forecaster_batch(questions: list, symbols: list, batch_size: int = 8) -> list:
+    """
+    Batched run_forecaster: prompts are sorted by length into buckets of
+    batch_size and each bucket is one padded generate call.
+    """
+    with METRICS.span("forecaster", batch=len(questions)):
+        with METRICS.span("forecaster.prompt", batch=len(questions)):
+            prompts = [build_forecast_prompt(q, s) for q, s in zip(questions, symbols)]
+        texts = ENGINE.generate_bucketed("forecaster", prompts, batch_size, FORECAST_MAX_NEW_TOKENS,
+                                         prefix=FORECAST_EXAMPLES)
+        with METRICS.span("forecaster.parse", batch=len(texts)):
+            return [extract_forecast(text) for text in texts]
+
+
+def run_forecaster_stream(question: str, symbol: str):
+    """
+    run_forecaster as a stream of events (see streaming.py): the forecast
+    arrives while it is generated and ends identical to run_forecaster's.
+    """
+    with METRICS.span("forecaster.prompt"):
+        prompt = build_forecast_prompt(question, symbol)
+    answer = AnswerStream([FORECAST_MARKER])
+    pieces = []
+    for piece in ENGINE.stream("forecaster", prompt, FORECAST_MAX_NEW_TOKENS, prefix=FORECAST_EXAMPLES):
+        pieces.append(piece)
+        yield from answer.feed(piece)
+    output = extract_forecast("".join(pieces))
+    yield from answer.finish(output)
+    yield {"event": "done", "output": output}
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from metrics import METRICS
+
+CACHE_DIR = Path(os.getenv("FINBOT_CACHE_DIR", Path.home() / ".cache" / "finbot"))
+
+
+class GenerationCache:
+    """
+    Persistent prompt -> generated text cache in SQLite.
+
+    Keys combine the model identity, the exact prompt and the generation
+    kwargs; decoding is greedy, so a hit is exactly what the model would have
+    produced. The store is bounded to max_bytes of text and evicts the least
+    recently used entries first. Set bypass (or FINBOT_GEN_CACHE=off) to always
+    call the model and leave the store untouched.
+    """
+
+    def __init__(self, path=None, max_bytes: int = 256 * 1024 * 1024, bypass: bool = False):
+        self.path = Path(path) if path else CACHE_DIR / "generations.sqlite"
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total_bytes = 0
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT PRIMARY KEY, output TEXT NOT NULL, bytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS generations_lru ON generations (last_access)")
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM generations").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(model_id: str, prompt: str, generate_kwargs: dict) -> str:
+        payload = json.dumps([model_id, prompt, generate_kwargs], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT output FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE generations SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, output: str):
+        size = len(output.encode("utf-8"))
+        with self._lock:
+            conn = self._connect()
+            old = conn.execute("SELECT bytes FROM generations WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (key, output, bytes, last_access) VALUES (?, ?, ?, ?)",
+                (key, output, size, time.time())
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        while self._total_bytes > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, bytes FROM generations ORDER BY last_access ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def cached_generate(self, model_id: str, prompts: list, generate_kwargs: dict, generate_fn) -> list:
+        """
+        Return generate_fn(prompts), calling it only for the prompts that are
+        not cached yet (in a single call, preserving their order).
+        """
+        if self.bypass:
+            return generate_fn(prompts)
+
+        keys = [self.make_key(model_id, prompt, generate_kwargs) for prompt in prompts]
+        outputs = [self.get(key) for key in keys]
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        METRICS.add(cache_hits=len(prompts) - len(missing), cache_misses=len(missing))
+        if missing:
+            generated = generate_fn([prompts[i] for i in missing])
+            for i, text in zip(missing, generated):
+                outputs[i] = text
+                self.put(keys[i], text)
+        return outputs
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "bytes": self._total_bytes,
+        }
+
+    def report(self):
+        if self.bypass:
+            return
+        s = self.stats()
+        print(f"[Generation Cache] hits: {s['hits']} | misses: {s['misses']} | hit rate: {s['hit_rate']:.2%} | "
+              f"evictions: {s['evictions']} | size: {s['bytes'] / 1e6:.1f} MB")
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM generations")
+            conn.commit()
+            self._total_bytes = 0
+
+
+GENERATION_CACHE = GenerationCache(
+    path=os.getenv("FINBOT_GEN_CACHE_PATH"),
+    max_bytes=int(os.getenv("FINBOT_GEN_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    bypass=os.getenv("FINBOT_GEN_CACHE", "on").lower() in ("off", "0", "false")
+)
@@ -24,4 +24,33 @@ CRYPTO = [
     "AVAX-USD",
     "DOGE-USD",
     "TRX-USD"
-]
\ No newline at end of file
+]
+
+# Company / coin names as users write them -> ticker in the lists above
+COMPANY_ALIASES = {
+    "American Express": "AXP", "Amgen": "AMGN", "Apple": "AAPL", "Boeing": "BA",
+    "Caterpillar": "CAT", "Cisco": "CSCO", "Chevron": "CVX", "Goldman Sachs": "GS",
+    "Home Depot": "HD", "Honeywell": "HON", "Intel": "INTC", "Johnson & Johnson": "JNJ",
+    "Coca-Cola": "KO", "Coca Cola": "KO", "JPMorgan": "JPM", "JP Morgan": "JPM",
+    "McDonald's": "MCD", "McDonalds": "MCD", "3M": "MMM", "Merck": "MRK",
+    "Microsoft": "MSFT", "Nike": "NKE", "Procter & Gamble": "PG", "Travelers": "TRV",
+    "UnitedHealth": "UNH", "Salesforce": "CRM", "Verizon": "VZ", "Visa": "V",
+    "Walgreens": "WBA", "Walmart": "WMT", "Disney": "DIS", "Dow Inc": "DOW",
+    "Adidas": "ADS.DE", "Adyen": "ADYEN.AS", "Ahold Delhaize": "AD.AS", "Air Liquide": "AI.PA",
+    "Airbus": "AIR.PA", "Allianz": "ALV.DE", "AB InBev": "ABI.BR", "ASML": "ASML.AS",
+    "AXA": "CS.PA", "BASF": "BAS.DE", "Bayer": "BAYN.DE", "BBVA": "BBVA.MC",
+    "Santander": "SAN.MC", "BMW": "BMW.DE", "BNP Paribas": "BNP.PA", "Danone": "BN.PA",
+    "Daimler": "DAI.DE", "Deutsche Post": "DPW.DE", "Deutsche Telekom": "DTE.DE", "Enel": "ENEL.MI",
+    "Engie": "ENGI.PA", "EssilorLuxottica": "EL.PA", "Fresenius": "FRE.DE", "Iberdrola": "IBE.MC",
+    "Inditex": "ITX.MC", "Infineon": "IFX.DE", "ING": "INGA.AS", "Intesa Sanpaolo": "ISP.MI",
+    "Kering": "KER.PA", "Philips": "PHIA.AS", "L'Oreal": "OR.PA", "Linde": "LIN.DE",
+    "LVMH": "MC.PA", "Munich Re": "MUV2.DE", "Nokia": "NOKIA.SE", "Orange": "ORA.PA",
+    "Pernod Ricard": "RI.PA", "Safran": "SAF.PA", "Sanofi": "SAN.PA", "SAP": "SAP.DE",
+    "Schneider Electric": "SU.PA", "Siemens": "SIE.DE", "Societe Generale": "GLE.PA",
+    "STMicroelectronics": "STM.PA", "Telefonica": "TEF.MC", "TotalEnergies": "TTE.PA",
+    "Unilever": "UNA.AS", "Vinci": "DG.PA", "Volkswagen": "VOW3.DE",
+    "Bitcoin": "BTC-USD", "BTC": "BTC-USD", "Ethereum": "ETH-USD", "ETH": "ETH-USD",
+    "Cardano": "ADA-USD", "ADA": "ADA-USD", "Ripple": "XRP-USD", "XRP": "XRP-USD",
+    "Solana": "SOL-USD", "SOL": "SOL-USD", "Polkadot": "DOT-USD", "Avalanche": "AVAX-USD",
+    "AVAX": "AVAX-USD", "Dogecoin": "DOGE-USD", "DOGE": "DOGE-USD", "Tron": "TRX-USD", "TRX": "TRX-USD",
+}
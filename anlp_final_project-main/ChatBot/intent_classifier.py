@@ -0,0 +1,269 @@
+"""
+First-stage intent classifier for the router: multinomial logistic
+regression over hashed word and character n-grams, in pure Python.
+
+It answers in microseconds; questions it is not confident about go to the
+LLM router (pipeline.ROUTERS["classifier"]). The trained model is a JSON
+artifact (data/intent_classifier.json) holding only the hashed features
+seen in training.
+
+    # Train on the labeled datasets and write the artifact
+    python intent_classifier.py train
+    # Held-out accuracy, latency and LLM-fallback coverage
+    python intent_classifier.py report
+    # Also run the LLM router live on a labeled file for comparison
+    python intent_classifier.py report --llm data/router_test_60_with_outputs.jsonl
+"""
+import os
+import re
+import json
+import math
+import time
+import zlib
+import random
+import argparse
+from pathlib import Path
+
+DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_MODEL_PATH = DATA_DIR / "intent_classifier.json"
+TRAIN_FILES = ["finchatbot_300_dataset.jsonl", "clean_router_testset_60.jsonl"]
+LABELS = ["FinQA", "FinRED", "Forecaster"]
+DEFAULT_THRESHOLD = 0.7
+
+_WORD = re.compile(r"[a-z0-9$%&']+")
+
+
+def ngrams(text: str) -> list:
+    """Word unigrams and bigrams plus character trigrams of every word."""
+    words = _WORD.findall(text.lower())
+    grams = ["w:" + w for w in words]
+    grams += ["b:" + a + " " + b for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f" {w} "
+        grams += ["c:" + padded[i:i + 3] for i in range(len(padded) - 2)]
+    return grams
+
+
+def features(text: str, buckets: int) -> dict:
+    """L2-normalized hashed n-gram counts {bucket: value}. crc32 keeps hashes stable across runs."""
+    counts = {}
+    for gram in ngrams(text):
+        index = zlib.crc32(gram.encode("utf-8")) % buckets
+        counts[index] = counts.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {k: v / norm for k, v in counts.items()}
+
+
+class IntentClassifier:
+    """
+    Softmax regression with sparse weights {bucket: [weight per label]}.
+    predict() returns (label, probability); route() returns None for a
+    question whose best probability is below threshold.
+    """
+
+    def __init__(self, labels=LABELS, buckets: int = 1 << 18, threshold: float = DEFAULT_THRESHOLD):
+        self.labels = list(labels)
+        self.buckets = buckets
+        self.threshold = threshold
+        self.bias = [0.0] * len(self.labels)
+        self.weights = {}
+
+    def scores(self, x: dict) -> list:
+        scores = list(self.bias)
+        for index, value in x.items():
+            row = self.weights.get(index)
+            if row is not None:
+                for j, w in enumerate(row):
+                    scores[j] += w * value
+        return scores
+
+    @staticmethod
+    def _softmax(scores: list) -> list:
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict_proba(self, question: str) -> dict:
+        return dict(zip(self.labels, self._softmax(self.scores(features(question, self.buckets)))))
+
+    def predict(self, question: str):
+        probs = self._softmax(self.scores(features(question, self.buckets)))
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.labels[best], probs[best]
+
+    def route(self, questions: list) -> list:
+        routes = []
+        for question in questions:
+            label, prob = self.predict(question)
+            routes.append(label if prob >= self.threshold else None)
+        return routes
+
+    def fit(self, questions: list, labels: list, epochs: int = 30, lr: float = 0.5, l2: float = 1e-4,
+            seed: int = 0):
+        """Plain SGD on the cross-entropy loss with L2 decay applied to the touched weights."""
+        data = [(features(q, self.buckets), self.labels.index(y)) for q, y in zip(questions, labels)]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            step = lr / (1 + epoch)
+            for x, y in data:
+                probs = self._softmax(self.scores(x))
+                grads = [p - (1.0 if j == y else 0.0) for j, p in enumerate(probs)]
+                for j, g in enumerate(grads):
+                    self.bias[j] -= step * g
+                for index, value in x.items():
+                    row = self.weights.setdefault(index, [0.0] * len(self.labels))
+                    for j, g in enumerate(grads):
+                        row[j] -= step * (g * value + l2 * row[j])
+        return self
+
+    def save(self, path):
+        payload = {
+            "labels": self.labels,
+            "buckets": self.buckets,
+            "threshold": self.threshold,
+            "bias": [round(b, 6) for b in self.bias],
+            "weights": {str(k): [round(w, 5) for w in row] for k, row in sorted(self.weights.items())},
+        }
+        with open(path, "w") as f:
+            json.dump(payload, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            payload = json.load(f)
+        model = cls(payload["labels"], payload["buckets"], payload["threshold"])
+        model.bias = payload["bias"]
+        model.weights = {int(k): row for k, row in payload["weights"].items()}
+        return model
+
+
+_default = {}
+
+
+def default_classifier():
+    """
+    The classifier behind ROUTERS["classifier"], loaded once from
+    FINBOT_INTENT_MODEL (default data/intent_classifier.json). The
+    threshold can be overridden with FINBOT_INTENT_THRESHOLD.
+    """
+    if "model" not in _default:
+        model = IntentClassifier.load(os.getenv("FINBOT_INTENT_MODEL", DEFAULT_MODEL_PATH))
+        if os.getenv("FINBOT_INTENT_THRESHOLD"):
+            model.threshold = float(os.getenv("FINBOT_INTENT_THRESHOLD"))
+        _default["model"] = model
+    return _default["model"]
+
+
+def load_labeled(path) -> list:
+    with open(path, "r") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [(item["input"], item["module"]) for item in items if item.get("module") in LABELS]
+
+
+def train(files: list, **kwargs) -> IntentClassifier:
+    data = [pair for name in files for pair in load_labeled(DATA_DIR / name)]
+    return IntentClassifier(**kwargs).fit([q for q, _ in data], [y for _, y in data])
+
+
+def evaluate(model: IntentClassifier, data: list) -> dict:
+    """Accuracy, confident coverage and per-question latency of model on (question, label) pairs."""
+    correct = confident = confident_correct = 0
+    start = time.perf_counter()
+    predictions = [model.predict(q) for q, _ in data]
+    elapsed = time.perf_counter() - start
+    for (_, gold), (label, prob) in zip(data, predictions):
+        correct += label == gold
+        if prob >= model.threshold:
+            confident += 1
+            confident_correct += label == gold
+    return {
+        "n": len(data),
+        "accuracy": correct / len(data),
+        "coverage": confident / len(data),
+        "confident_accuracy": confident_correct / confident if confident else 0.0,
+        "us_per_question": 1e6 * elapsed / len(data),
+        "predictions": predictions,
+    }
+
+
+def recorded_routes(name: str) -> dict:
+    """question -> module chosen by the LLM router in a recorded pipeline_outputs run."""
+    with open(DATA_DIR / name, "r") as f:
+        return {item["input"]: item["routed_module"] for item in map(json.loads, filter(str.strip, f))}
+
+
+def distinct(data: list) -> list:
+    """(question, label) pairs with repeated questions kept once, in first-seen order."""
+    return list(dict.fromkeys(data))
+
+
+def report(threshold: float, folds: int = 5):
+    # Headline, held out: train on finchatbot_300 only, test on the 60-question router sets
+    # (minus any question that also appears in finchatbot_300)
+    train_data = load_labeled(DATA_DIR / "finchatbot_300_dataset.jsonl")
+    seen = {q for q, _ in train_data}
+    model = train(["finchatbot_300_dataset.jsonl"], threshold=threshold)
+    for name in ["clean_router_testset_60.jsonl", "router_test_60_with_outputs.jsonl"]:
+        test = [pair for pair in distinct(load_labeled(DATA_DIR / name)) if pair[0] not in seen]
+        r = evaluate(model, test)
+        print(f"[Classifier] {name} (held out, {r['n']} questions): accuracy {r['accuracy']:.1%} | "
+              f"confident {r['coverage']:.0%} of questions at {r['confident_accuracy']:.1%} | "
+              f"{r['us_per_question']:.0f} us/question")
+
+    # finchatbot_300 repeats a few questions many times, so the folds split distinct
+    # questions (group k-fold): no held-out question is ever in its fold's training rows
+    questions = distinct(train_data)
+    random.Random(0).shuffle(questions)
+    folds = min(folds, len(questions))
+    predictions = {}
+    for k in range(folds):
+        held_out = questions[k::folds]
+        held_out_questions = {q for q, _ in held_out}
+        rest = [pair for pair in train_data if pair[0] not in held_out_questions]
+        fold_model = IntentClassifier(threshold=threshold).fit([q for q, _ in rest], [y for _, y in rest])
+        for (q, _), prediction in zip(held_out, evaluate(fold_model, held_out)["predictions"]):
+            predictions[q] = prediction
+    accuracy = sum(predictions[q][0] == y for q, y in questions) / len(questions)
+    print(f"[Classifier] finchatbot_300 ({folds}-fold CV over {len(questions)} distinct questions): "
+          f"accuracy {accuracy:.1%}")
+
+    # The LLM router's recorded decisions next to the classifier's held-out predictions, per distinct question
+    for name in ["pipeline_outputs_mistral.jsonl", "pipeline_outputs_Hermes.jsonl"]:
+        llm = recorded_routes(name)
+        compared = [(q, y) for q, y in questions if q in llm]
+        llm_accuracy = sum(llm[q] == y for q, y in compared) / len(compared)
+        # Hybrid: the classifier's confident answers, the recorded LLM decision otherwise
+        hybrid = sum((predictions[q][0] if predictions[q][1] >= threshold else llm[q]) == y for q, y in compared)
+        deferred = sum(predictions[q][1] < threshold for q, _ in compared)
+        print(f"[Router: {name}] {len(compared)} questions | LLM accuracy {llm_accuracy:.1%} | "
+              f"classifier alone {sum(predictions[q][0] == y for q, y in compared) / len(compared):.1%} | "
+              f"classifier + LLM fallback {hybrid / len(compared):.1%} "
+              f"with {deferred}/{len(compared)} questions sent to the LLM")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_parser = sub.add_parser("train", help="Train on the labeled datasets and write the artifact")
+    train_parser.add_argument("--files", nargs="+", default=TRAIN_FILES, help="Labeled JSONL files in data/")
+    train_parser.add_argument("--out", type=str, default=str(DEFAULT_MODEL_PATH))
+    train_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    report_parser = sub.add_parser("report", help="Accuracy/latency against the LLM router")
+    report_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    report_parser.add_argument("--llm", type=str, metavar="FILE",
+                               help="Also time the generate router live on this labeled JSONL file")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        start = time.perf_counter()
+        model = train(args.files, threshold=args.threshold)
+        model.save(args.out)
+        print(f"[Classifier] trained on {', '.join(args.files)} in {time.perf_counter() - start:.1f}s; "
+              f"{len(model.weights)} features written to {args.out} ({os.path.getsize(args.out) / 1e3:.0f} kB)")
+    else:
+        report(args.threshold)
+        if args.llm:
+            from pipeline import compare_routers
+            compare_routers(args.llm, routers=("generate", "classifier"))
@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+from collections import Counter
+from itertools import islice
+
+
+def input_hash(item: dict) -> str:
+    """Stable key of a dataset item, independent of key order and file position."""
+    payload = json.dumps(item, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def iter_jsonl(path: str, start: int = 0, stop: int = None):
+    """
+    Lazily yield (line_index, item) for lines start..stop-1 of a JSONL file.
+    Blank lines keep their index but are skipped.
+    """
+    with open(path, "r") as f:
+        for i, line in enumerate(islice(f, start, stop), start=start):
+            line = line.strip()
+            if line:
+                yield i, json.loads(line)
+
+
+def finished_counts(path: str) -> Counter:
+    """
+    Count the input hashes already written to an output JSONL file.
+
+    A trailing line cut off by a crash is truncated away first, so appending
+    can resume from a clean line boundary.
+    """
+    counts = Counter()
+    if not os.path.exists(path):
+        return counts
+
+    good_end = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError:
+                break
+            counts[record.get("input_hash")] += 1
+            good_end = f.tell()
+
+    if good_end != os.path.getsize(path):
+        print(f"[Resume] Truncating incomplete tail of {path} at byte {good_end}")
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+    return counts
+
+
+class JsonlAppender:
+    """
+    Appends one JSON record per line, flushing every write and fsyncing
+    every fsync_every records and on close.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 10):
+        self.path = path
+        self.fsync_every = fsync_every
+        self._pending = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def __exit__(self, *exc):
+        self._sync()
+        self._file.close()
+        return False
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._pending = 0
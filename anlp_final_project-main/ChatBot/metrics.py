@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _NullSpan:
+    """Stand-in returned while metrics are disabled; every call is a no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counts):
+        pass
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One timed stage. Numeric counters (prompt_tokens, generated_tokens,
+    cache_hits, ...) are summed per span name; attrs are only written to
+    the JSON lines output.
+    """
+
+    def __init__(self, metrics, name: str, parent, attrs: dict):
+        self.metrics = metrics
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.counts = {}
+        self.first_token_at = None
+
+    def __enter__(self):
+        self.metrics._push(self)
+        self.ts = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall = time.perf_counter() - self.start
+        self.metrics._pop(self)
+        if self.first_token_at is not None:
+            prefill = self.first_token_at - self.start
+            self.add(prefill_seconds=prefill, decode_seconds=self.wall - prefill)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.metrics._finish(self)
+        return False
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def record(self) -> dict:
+        record = {"span": self.name, "parent": self.parent.name if self.parent else None,
+                  "ts": round(self.ts, 6), "wall_ms": round(1000 * self.wall, 3)}
+        record.update(self.counts)
+        generated = self.counts.get("generated_tokens")
+        if generated:
+            decode = self.counts.get("decode_seconds", self.wall)
+            record["tokens_per_s"] = round(generated / decode, 2) if decode > 0 else None
+        record.update(self.attrs)
+        return record
+
+
+class _Aggregate:
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.wall_sum = 0.0
+        self.walls = deque(maxlen=window)
+        self.counts = {}
+
+
+class Metrics:
+    """
+    Span-based instrumentation of the pipeline stages.
+
+    with METRICS.span("finqa.generate", batch=4) as span:
+        ...
+        span.add(prompt_tokens=512, generated_tokens=80)
+
+    Finished spans are aggregated per name (count, latency quantiles over the
+    last `window` spans, summed counters), optionally appended to a JSON
+    lines file, and exported as Prometheus text. While disabled span()
+    returns NULL_SPAN and nothing is timed or stored.
+    """
+
+    def __init__(self, enabled: bool = False, path=None, window: int = 10000):
+        self.enabled = enabled or bool(path)
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._aggregates = {}
+        self._file = None
+
+    def configure(self, enabled: bool = True, path=None):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.enabled = enabled or bool(path)
+            self.path = path
+
+    def reset(self):
+        with self._lock:
+            self._aggregates = {}
+
+    # --- Spans ---
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _push(self, span: Span):
+        self._stack().append(span)
+
+    def _pop(self, span: Span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        stack = self._stack()
+        return Span(self, name, stack[-1] if stack else None, attrs)
+
+    def current(self):
+        """The innermost open span of this thread (NULL_SPAN if none)."""
+        if not self.enabled:
+            return NULL_SPAN
+        stack = self._stack()
+        return stack[-1] if stack else NULL_SPAN
+
+    def add(self, **counts):
+        """Add counters to the innermost open span, e.g. cache hits seen deep in a call."""
+        if self.enabled:
+            self.current().add(**counts)
+
+    def observe(self, name: str, seconds: float, **attrs):
+        """
+        Record a duration measured outside a with-block (e.g. time to first
+        token of a generator) as a finished span of that length.
+        """
+        if not self.enabled:
+            return
+        stack = self._stack()
+        span = Span(self, name, stack[-1] if stack else None, attrs)
+        span.ts = time.time() - seconds
+        span.wall = seconds
+        self._finish(span)
+
+    # --- Generation helpers ---
+    def generate_kwargs(self, span) -> dict:
+        """
+        Extra model.generate() kwargs that split span into prefill and decode:
+        the first logits-processor call happens right after the prefill forward.
+        """
+        if span is NULL_SPAN:
+            return {}
+        from transformers import LogitsProcessorList
+
+        def first_token(input_ids, scores):
+            span.mark_first_token()
+            return scores
+
+        return {"logits_processor": LogitsProcessorList([first_token])}
+
+    def record_generation(self, span, tokens: dict, output_ids, pad_token_id=None):
+        """Count prompt tokens (non-padding) and newly generated tokens of a batch."""
+        if span is NULL_SPAN:
+            return
+        mask = tokens.get("attention_mask")
+        prompt_tokens = int(mask.sum()) if mask is not None else tokens["input_ids"].numel()
+        new_ids = output_ids[:, tokens["input_ids"].shape[1]:]
+        if pad_token_id is None:
+            generated = new_ids.numel()
+        else:
+            generated = int((new_ids != pad_token_id).sum())
+        span.add(prompt_tokens=prompt_tokens, generated_tokens=generated)
+
+    # --- Aggregation and output ---
+    def _finish(self, span: Span):
+        record = span.record()
+        with self._lock:
+            agg = self._aggregates.get(span.name)
+            if agg is None:
+                agg = self._aggregates[span.name] = _Aggregate(self.window)
+            agg.count += 1
+            agg.errors += "error" in span.attrs
+            agg.wall_sum += span.wall
+            agg.walls.append(span.wall)
+            for key, value in span.counts.items():
+                agg.counts[key] = agg.counts.get(key, 0) + value
+            if self.path:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                self._file.flush()
+
+    @staticmethod
+    def _quantile(values: list, q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    def summary(self) -> dict:
+        """{span name: {count, errors, mean_ms, p50_ms, p95_ms, p99_ms, <counter sums>}}"""
+        with self._lock:
+            aggregates = dict(self._aggregates)
+        result = {}
+        for name, agg in sorted(aggregates.items()):
+            walls = list(agg.walls)
+            entry = {"count": agg.count, "errors": agg.errors,
+                     "mean_ms": 1000 * agg.wall_sum / agg.count if agg.count else 0.0}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}_ms"] = 1000 * self._quantile(walls, q)
+            entry.update(agg.counts)
+            result[name] = entry
+        return result
+
+    def prometheus(self, prefix: str = "finbot") -> str:
+        """Prometheus text exposition of every span aggregate."""
+        with self._lock:
+            aggregates = dict(self._aggregates)
+        lines = [f"# TYPE {prefix}_span_seconds summary"]
+        counters = {}
+        for name, agg in sorted(aggregates.items()):
+            label = f'span="{name}"'
+            walls = list(agg.walls)
+            for q in QUANTILES:
+                lines.append(f'{prefix}_span_seconds{{{label},quantile="{q}"}} {self._quantile(walls, q):.6f}')
+            lines.append(f"{prefix}_span_seconds_sum{{{label}}} {agg.wall_sum:.6f}")
+            lines.append(f"{prefix}_span_seconds_count{{{label}}} {agg.count}")
+            counters.setdefault("errors", []).append((label, agg.errors))
+            for key, value in sorted(agg.counts.items()):
+                counters.setdefault(key, []).append((label, value))
+        for key, values in sorted(counters.items()):
+            lines.append(f"# TYPE {prefix}_{key}_total counter")
+            lines.extend(f"{prefix}_{key}_total{{{label}}} {value}" for label, value in values)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def report(self):
+        for name, s in self.summary().items():
+            extra = "".join(f" | {k}: {v}" for k, v in s.items()
+                            if k not in ("count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms"))
+            print(f"[Metrics] {name}: n={s['count']} | p50 {s['p50_ms']:.1f} ms | "
+                  f"p95 {s['p95_ms']:.1f} ms | p99 {s['p99_ms']:.1f} ms{extra}")
+
+
+METRICS = Metrics(enabled=os.getenv("FINBOT_METRICS", "off").lower() in ("1", "on", "true"),
+                  path=os.getenv("FINBOT_METRICS_PATH"))
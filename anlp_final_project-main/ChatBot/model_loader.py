@@ -1,42 +1,275 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
-
-# # CHANGE THIS LINE TO SWITCH MODEL
-# # model_name = "mistralai/Mistral-7B-Instruct-v0.2"
-# model_name = "NousResearch/Hermes-2-Pro-Mistral-7B"
-
-# # Load tokenizer and override max length
-# tokenizer = AutoTokenizer.from_pretrained(model_name)
-# tokenizer.model_max_length = 4096 
-
-# # Make sure pad token is set
-# if tokenizer.pad_token is None:
-#     tokenizer.pad_token = tokenizer.eos_token  
-
-# # Load model
-# model = AutoModelForCausalLM.from_pretrained(
-#     model_name,
-#     device_map="auto",
-#     torch_dtype=torch.float16 
-# ).eval()
-
-model_name = "meta-llama/Llama-2-13b-chat-hf"  # You must have accepted its license on Hugging Face
-
-tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
-tokenizer.model_max_length = 4096
-
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
-
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_use_double_quant=True,
-    bnb_4bit_compute_dtype=torch.float16,
-    bnb_4bit_quant_type="nf4"
-)
-
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    quantization_config=bnb_config,
-    device_map="auto"
-).eval()
\ No newline at end of file
+import os
+import threading
+
+# The model is loaded lazily: importing this module (or anything that imports
+# `model` / `tokenizer` from it) never touches the weights. The first attribute
+# access or call on either handle loads both, once, under a lock.
+#
+# To switch models set the environment before the first use, e.g. for the
+# Hermes/Mistral runs:
+#   FINBOT_MODEL_NAME=NousResearch/Hermes-2-Pro-Mistral-7B FINBOT_QUANTIZATION=none
+# or pass --model-name / --dtype / --quantization on the pipeline CLI.
+# Different models or LoRA adapters per stage are configured in
+# model_registry.py (--model-registry); stages it does not cover use HANDLE.
+#
+# On machines without a GPU use the CPU backend (FINBOT_BACKEND=cpu or
+# --backend cpu): a smaller model in float32 / bfloat16, optionally with
+# PyTorch dynamic int8 quantization of its linear layers (--quantization
+# int8), on FINBOT_THREADS / --threads intra-op threads.
+
+DEFAULT_MODEL_NAME = "meta-llama/Llama-2-13b-chat-hf"  # You must have accepted its license on Hugging Face
+CPU_DEFAULT_MODEL_NAME = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+
+# Tiny randomly initialized CPU model for benchmarks; no download needed
+STANDIN_MODEL_NAME = "standin"
+
+BACKENDS = ["gpu", "cpu"]
+DTYPES = ["float16", "bfloat16", "float32"]
+# 4bit / 8bit: bitsandbytes (gpu backend); int8: PyTorch dynamic quantization (cpu backend)
+QUANTIZATIONS = ["4bit", "8bit", "int8", "none"]
+BACKEND_QUANTIZATIONS = {"gpu": ["4bit", "8bit", "none"], "cpu": ["int8", "none"]}
+# float16 matmuls on CPU are slow or unsupported
+BACKEND_DTYPES = {"gpu": DTYPES, "cpu": ["bfloat16", "float32"]}
+BACKEND_DEFAULTS = {
+    "gpu": {"model_name": DEFAULT_MODEL_NAME, "dtype": "float16", "quantization": "4bit"},
+    "cpu": {"model_name": CPU_DEFAULT_MODEL_NAME, "dtype": "float32", "quantization": "none"},
+}
+
+
+def default_config(backend: str = None) -> dict:
+    backend = backend or os.getenv("FINBOT_BACKEND", "gpu")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+    defaults = BACKEND_DEFAULTS[backend]
+    return {
+        "backend": backend,
+        "model_name": os.getenv("FINBOT_MODEL_NAME", defaults["model_name"]),
+        "dtype": os.getenv("FINBOT_DTYPE", defaults["dtype"]),
+        "quantization": os.getenv("FINBOT_QUANTIZATION", defaults["quantization"]),
+        "threads": int(os.getenv("FINBOT_THREADS", "0")) or None,
+        "interop_threads": int(os.getenv("FINBOT_INTEROP_THREADS", "0")) or None,
+    }
+
+
+def check_config(config: dict):
+    if config["quantization"] not in BACKEND_QUANTIZATIONS[config["backend"]]:
+        raise ValueError(f"Quantization {config['quantization']!r} is not available on the {config['backend']} "
+                         f"backend; use one of {BACKEND_QUANTIZATIONS[config['backend']]}")
+    if config["dtype"] not in BACKEND_DTYPES[config["backend"]]:
+        raise ValueError(f"dtype {config['dtype']!r} is not available on the {config['backend']} backend; "
+                         f"use one of {BACKEND_DTYPES[config['backend']]}")
+
+
+def _set_threads(config: dict):
+    import torch
+
+    if config.get("threads"):
+        torch.set_num_threads(config["threads"])
+    if config.get("interop_threads"):
+        try:
+            torch.set_num_interop_threads(config["interop_threads"])
+        except RuntimeError:
+            # Only settable once, before any inter-op parallel work
+            print(f"[Model Loader] Inter-op threads already fixed at {torch.get_num_interop_threads()}")
+
+
+def _load_tokenizer(model_name: str):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+    tokenizer.model_max_length = 4096
+
+    # Make sure pad token is set
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def _prepare_cpu(model, config: dict):
+    """Cast to the configured dtype, or dynamically quantize the linear layers to int8."""
+    import torch
+
+    if config["quantization"] == "int8":
+        # Dynamic quantization takes float32 weights; activations stay float32
+        return torch.ao.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8)
+    return model.to(getattr(torch, config["dtype"]))
+
+
+def _load(config: dict):
+    check_config(config)
+    _set_threads(config)
+    if config["model_name"] == STANDIN_MODEL_NAME:
+        from standin import build_standin_model, build_standin_tokenizer
+
+        tokenizer = build_standin_tokenizer()
+        model = build_standin_model(tokenizer)
+        if config["backend"] == "cpu":
+            model = _prepare_cpu(model, config)
+        return model, tokenizer
+
+    import torch
+    from transformers import AutoModelForCausalLM, BitsAndBytesConfig
+
+    model_name = config["model_name"]
+    dtype = getattr(torch, config["dtype"])
+    tokenizer = _load_tokenizer(model_name)
+
+    if config["backend"] == "cpu":
+        load_dtype = torch.float32 if config["quantization"] == "int8" else dtype
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=load_dtype, low_cpu_mem_usage=True)
+        return _prepare_cpu(model.eval(), config), tokenizer
+
+    kwargs = {"device_map": "auto"}
+    if config["quantization"] == "4bit":
+        kwargs["quantization_config"] = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_use_double_quant=True,
+            bnb_4bit_compute_dtype=dtype,
+            bnb_4bit_quant_type="nf4"
+        )
+    elif config["quantization"] == "8bit":
+        kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+    else:
+        kwargs["torch_dtype"] = dtype
+
+    model = AutoModelForCausalLM.from_pretrained(model_name, **kwargs).eval()
+    return model, tokenizer
+
+
+class ModelHandle:
+    """
+    Thread-safe, load-once holder for the shared model and tokenizer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pair = None
+        self.config = default_config()
+
+    @property
+    def loaded(self) -> bool:
+        return self._pair is not None
+
+    def configure(self, model_name: str = None, dtype: str = None, quantization: str = None, backend: str = None,
+                  threads: int = None, interop_threads: int = None):
+        updates = {"model_name": model_name, "dtype": dtype, "quantization": quantization, "backend": backend,
+                   "threads": threads, "interop_threads": interop_threads}
+        updates = {k: v for k, v in updates.items() if v is not None}
+        with self._lock:
+            if self._pair is not None and any(self.config[k] != v for k, v in updates.items()):
+                raise RuntimeError("Model already loaded; configure it before the first use or call unload()")
+            # Another backend brings its own defaults for what is not set explicitly
+            config = default_config(backend) if backend not in (None, self.config["backend"]) else dict(self.config)
+            config.update(updates)
+            check_config(config)
+            self.config = config
+
+    def get(self):
+        pair = self._pair
+        if pair is None:
+            with self._lock:
+                if self._pair is None:
+                    print(f"[Model Loader] Loading {self.config['model_name']} ({self.config['backend']}, "
+                          f"{self.config['quantization']}, {self.config['dtype']})")
+                    self._pair = _load(self.config)
+                pair = self._pair
+        return pair
+
+    def set(self, model, tokenizer, model_name: str = None):
+        """Install an already constructed model/tokenizer pair."""
+        with self._lock:
+            self._pair = (model, tokenizer)
+            if model_name is not None:
+                self.config["model_name"] = model_name
+
+    def unload(self):
+        with self._lock:
+            if self._pair is not None:
+                from prefix_cache import PREFIX_CACHE
+                PREFIX_CACHE.forget(self._pair[0])
+            self._pair = None
+
+
+HANDLE = ModelHandle()
+
+
+class _LazyObject:
+    """Forwards every attribute access and call to HANDLE's model or tokenizer."""
+
+    def __init__(self, index: int):
+        object.__setattr__(self, "_index", index)
+
+    def _resolve(self):
+        return HANDLE.get()[self._index]
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __repr__(self):
+        if not HANDLE.loaded:
+            return f"<lazy {'model' if self._index == 0 else 'tokenizer'} for {HANDLE.config['model_name']}>"
+        return repr(self._resolve())
+
+
+model = _LazyObject(0)
+tokenizer = _LazyObject(1)
+
+
+def configure(**kwargs):
+    HANDLE.configure(**kwargs)
+
+
+def model_id() -> str:
+    """Identity of the configured model, for caches keyed by model."""
+    return config_id(HANDLE.config)
+
+
+def config_id(config: dict) -> str:
+    """model_name|dtype|quantization, plus |cpu for the CPU backend (its greedy outputs may differ)."""
+    backend = "|cpu" if config.get("backend") == "cpu" else ""
+    return f"{config['model_name']}|{config['dtype']}|{config['quantization']}{backend}"
+
+
+def preload():
+    """Load the model of every stage now instead of on first use."""
+    from model_registry import REGISTRY
+    REGISTRY.preload()
+
+
+def add_model_arguments(parser):
+    parser.add_argument("--model-name", type=str, default=None,
+                        help=f"Hugging Face model id or '{STANDIN_MODEL_NAME}' (env FINBOT_MODEL_NAME)")
+    parser.add_argument("--dtype", choices=DTYPES, default=None, help="Weights / compute dtype (env FINBOT_DTYPE)")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None,
+                        help="4bit / 8bit bitsandbytes (gpu) or int8 dynamic quantization (cpu) "
+                             "(env FINBOT_QUANTIZATION)")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help=f"gpu: bitsandbytes + device_map=auto; cpu: float32 / bfloat16 / int8, "
+                             f"default model {CPU_DEFAULT_MODEL_NAME} (env FINBOT_BACKEND)")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads (env FINBOT_THREADS)")
+    parser.add_argument("--interop-threads", type=int, default=None,
+                        help="torch inter-op threads (env FINBOT_INTEROP_THREADS)")
+    parser.add_argument("--model-registry", type=str, default=None,
+                        help="JSON file of per-stage models / adapters (env FINBOT_MODEL_REGISTRY)")
+    parser.add_argument("--memory-budget", type=str, default=None,
+                        help="Memory for registry models, e.g. 20GB (env FINBOT_MODEL_MEMORY_BUDGET)")
+    parser.add_argument("--preload", action="store_true", help="Load the model before handling any input")
+
+
+def configure_from_args(args):
+    configure(model_name=args.model_name, dtype=args.dtype, quantization=args.quantization, backend=args.backend,
+              threads=args.threads, interop_threads=args.interop_threads)
+    if args.model_registry is not None or args.memory_budget is not None:
+        from model_registry import REGISTRY
+        REGISTRY.configure(path=args.model_registry, budget=args.memory_budget)
+    if args.preload:
+        preload()
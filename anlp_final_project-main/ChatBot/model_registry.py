@@ -0,0 +1,346 @@
+"""
+Per-stage models: which base model, and optionally which LoRA adapter,
+answers the router, FinQA, FinRED and the forecaster.
+
+A registry file (FINBOT_MODEL_REGISTRY or --model-registry) maps stage
+names to specs; "default" covers the stages not listed:
+
+    {"forecaster": {"base": "meta-llama/Llama-2-7b-chat-hf",
+                    "adapter": "FinGPT/fingpt-forecaster_dow30_llama2-7b_lora"},
+     "finred":     {"base": "meta-llama/Llama-2-7b-chat-hf", "adapter": "FinGPT/fingpt-mt_llama2-7b_lora"},
+     "finqa":      {"base": "meta-llama/Meta-Llama-3.1-8B", "adapter": "FinGPT/fingpt-mt_llama3-8b_lora",
+                    "quantization": "none", "dtype": "bfloat16"}}
+
+backend, dtype and quantization default to model_loader's configuration. Stages
+without a spec (all of them without a file) use model_loader's HANDLE, so
+nothing changes unless a registry is configured.
+
+Bases are loaded on first use. Stages whose specs share a base, dtype and
+quantization share one resident copy: their adapters are loaded onto it
+with peft and the active one is switched per call. Switching changes the
+shared model, so generation must run on one thread at a time (as the
+server's model worker does).
+
+Resident bases are kept within a memory budget (FINBOT_MODEL_MEMORY_BUDGET
+or --memory-budget, e.g. "20GB"; unset means unlimited). When a load would
+exceed it, the least recently used bases are evicted first; a base's size
+is measured after loading (weights plus its adapters) and remembered, so a
+reload makes room before it starts. HANDLE's model, once loaded, counts
+against the budget too but is never evicted. Loads, evictions and adapter switches
+are counted as METRICS spans and in report().
+
+    # Which model serves which stage, and which stages share a base
+    python model_registry.py --model-registry models.json --show
+    # Load every stage in turn and report loads / evictions under a budget
+    python model_registry.py --model-registry models.json --memory-budget 16GB --warm
+"""
+import os
+import re
+import gc
+import json
+import argparse
+import threading
+from collections import OrderedDict
+from model_loader import HANDLE, _load, default_config, config_id, model_id as default_model_id
+from metrics import METRICS
+
+STAGES = ["router", "finqa", "finred", "forecaster"]
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_bytes(value) -> int:
+    """'20GB', '512M', '1.5G' or a plain number of bytes; None / '' / 0 mean no limit."""
+    if value in (None, "", 0, "0"):
+        return None
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)(?:i?B)?\s*", str(value), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Not a memory size: {value!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def format_bytes(n: int) -> str:
+    return f"{n / (1 << 30):.2f} GB" if n >= 1 << 30 else f"{n / (1 << 20):.0f} MB"
+
+
+class ModelSpec:
+    """A base model and an optional LoRA adapter; backend / dtype / quantization None means model_loader's."""
+
+    def __init__(self, base: str, adapter: str = None, dtype: str = None, quantization: str = None,
+                 backend: str = None):
+        self.base = base
+        self.adapter = adapter
+        self.dtype = dtype
+        self.quantization = quantization
+        self.backend = backend
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(base=value) if isinstance(value, str) else cls(**value)
+
+    def config(self) -> dict:
+        """model_loader config of the base."""
+        config = dict(HANDLE.config)
+        if self.backend not in (None, config["backend"]):
+            config = default_config(self.backend)
+        config["model_name"] = self.base
+        config["dtype"] = self.dtype or config["dtype"]
+        config["quantization"] = self.quantization or config["quantization"]
+        return config
+
+    def base_key(self) -> str:
+        return config_id(self.config())
+
+    def __repr__(self):
+        config = self.config()
+        adapter = f" + {self.adapter}" if self.adapter else ""
+        return f"{self.base}{adapter} ({config['quantization']}, {config['dtype']})"
+
+
+def load_specs(path) -> dict:
+    """{stage: ModelSpec} of a registry file."""
+    with open(path, "r") as f:
+        return {stage: ModelSpec.from_json(value) for stage, value in json.load(f).items()}
+
+
+def adapter_name(adapter: str) -> str:
+    """peft adapter name for an adapter id (module names cannot contain '.')."""
+    return re.sub(r"\W", "_", adapter)
+
+
+def _footprint(model) -> int:
+    if hasattr(model, "get_memory_footprint"):
+        return model.get_memory_footprint()
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _adapter_footprint(model, name: str) -> int:
+    return sum(p.numel() * p.element_size() for n, p in model.named_parameters() if f".{name}." in n)
+
+
+def _free_memory():
+    gc.collect()
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class _Resident:
+    """A loaded base, the adapters loaded onto it and the one currently active."""
+
+    def __init__(self, key: str, model, tokenizer, size: int):
+        self.key = key
+        self.model = model
+        self.tokenizer = tokenizer
+        self.size = size
+        self.adapters = {}  # peft adapter name -> adapter id
+        self.active = None
+
+
+class ModelRegistry:
+    """stage -> (model, tokenizer), loading lazily within a memory budget."""
+
+    def __init__(self, specs: dict = None, budget: int = None, enabled: bool = True):
+        self.specs = specs or {}
+        self.budget = budget
+        self.enabled = enabled
+        self.loads = 0
+        self.evictions = 0
+        self.adapter_loads = 0
+        self.adapter_switches = 0
+        self.peak_bytes = 0
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()  # base key -> _Resident, least recently used first
+        self._sizes = {}                # base key -> bytes measured at its last load
+        self._handle_size = (None, 0)   # (id, bytes) of HANDLE's model when last measured
+
+    def configure(self, path=None, budget=None):
+        """Replace the specs with path's and / or set the budget; a new registry unloads every base."""
+        if path is not None:
+            specs = load_specs(path)
+            self.unload()
+            self.specs = specs
+        if budget is not None:
+            self.budget = parse_bytes(budget)
+
+    def spec(self, stage: str):
+        """The stage's spec, or None if it uses model_loader's HANDLE."""
+        if not self.enabled:
+            return None
+        return self.specs.get(stage) or self.specs.get("default")
+
+    def model_id(self, stage: str) -> str:
+        """Identity of the stage's model and adapter, for caches keyed by model."""
+        spec = self.spec(stage)
+        if spec is None:
+            return default_model_id()
+        return spec.base_key() + (f"|{spec.adapter}" if spec.adapter else "")
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(entry.size for entry in self._resident.values()) + self._handle_bytes()
+
+    def _handle_bytes(self) -> int:
+        """HANDLE's model once loaded: it counts against the budget but is never evicted."""
+        if not HANDLE.loaded:
+            return 0
+        model = HANDLE.get()[0]
+        if self._handle_size[0] != id(model):
+            self._handle_size = (id(model), _footprint(model))
+        return self._handle_size[1]
+
+    def get(self, stage: str):
+        """(model, tokenizer) of stage, loading its base and adapter if needed."""
+        spec = self.spec(stage)
+        if spec is None:
+            return HANDLE.get()
+        with self._lock:
+            entry = self._base(spec, stage)
+            return self._activate(entry, spec.adapter), entry.tokenizer
+
+    def _base(self, spec: ModelSpec, stage: str) -> _Resident:
+        key = spec.base_key()
+        entry = self._resident.get(key)
+        if entry is not None:
+            self._resident.move_to_end(key)
+            return entry
+
+        # A base seen before has a known size: make room before loading it again
+        self._make_room(self._sizes.get(key, 0))
+        print(f"[Model Registry] Loading {spec.base} ({spec.config()['quantization']}, "
+              f"{spec.config()['dtype']}) for {stage}")
+        with METRICS.span("model.load", model=key, stage=stage) as span:
+            model, tokenizer = _load(spec.config())
+            size = _footprint(model)
+            span.add(bytes=size)
+        entry = self._resident[key] = _Resident(key, model, tokenizer, size)
+        self._sizes[key] = size
+        self.loads += 1
+        METRICS.add(model_loads=1)
+        # Peak before evicting: the new base and the old ones were all in memory
+        self.peak_bytes = max(self.peak_bytes, self.resident_bytes)
+        self._make_room(0, keep=key)
+        return entry
+
+    def _activate(self, entry: _Resident, adapter: str):
+        """entry's model with adapter active, or with every adapter disabled for None."""
+        if adapter is None:
+            if entry.active is not None:
+                entry.model.base_model.disable_adapter_layers()
+                entry.active = None
+                self.adapter_switches += 1
+                METRICS.add(adapter_switches=1)
+            return entry.model
+
+        name = adapter_name(adapter)
+        if name not in entry.adapters:
+            print(f"[Model Registry] Loading adapter {adapter} onto {entry.key}")
+            with METRICS.span("model.adapter_load", model=entry.key, adapter=adapter) as span:
+                if not entry.adapters:
+                    from peft import PeftModel
+                    entry.model = PeftModel.from_pretrained(entry.model, adapter, adapter_name=name).eval()
+                else:
+                    entry.model.load_adapter(adapter, adapter_name=name)
+                size = _adapter_footprint(entry.model, name)
+                span.add(bytes=size)
+            entry.adapters[name] = adapter
+            entry.size += size
+            self._sizes[entry.key] = entry.size
+            self.adapter_loads += 1
+            METRICS.add(adapter_loads=1)
+            self.peak_bytes = max(self.peak_bytes, self.resident_bytes)
+            self._make_room(0, keep=entry.key)
+            entry.active = None
+
+        if entry.active != name:
+            entry.model.set_adapter(name)
+            entry.model.base_model.enable_adapter_layers()
+            entry.active = name
+            self.adapter_switches += 1
+            METRICS.add(adapter_switches=1)
+        return entry.model
+
+    def _make_room(self, incoming: int, keep: str = None):
+        """Evict least recently used bases (never keep) until incoming more bytes fit the budget."""
+        if self.budget is None:
+            return
+        for key in list(self._resident):
+            if self.resident_bytes + incoming <= self.budget:
+                break
+            if key != keep:
+                self._evict(key)
+        if self.resident_bytes + incoming > self.budget:
+            print(f"[Model Registry] {format_bytes(self.resident_bytes + incoming)} resident exceeds "
+                  f"the {format_bytes(self.budget)} budget")
+
+    def _evict(self, key: str):
+        entry = self._resident.pop(key)
+        print(f"[Model Registry] Evicting {key} ({format_bytes(entry.size)})")
+        with METRICS.span("model.evict", model=key) as span:
+            span.add(bytes=entry.size)
+            # The prefix cache knows models by id(config), which a later load may reuse
+            from prefix_cache import PREFIX_CACHE
+            PREFIX_CACHE.forget(entry.model)
+            entry.model = entry.tokenizer = None
+            del entry
+            _free_memory()
+        self.evictions += 1
+        METRICS.add(model_evictions=1)
+
+    def unload(self):
+        with self._lock:
+            for key in list(self._resident):
+                self._evict(key)
+
+    def preload(self, stages: list = STAGES):
+        """Load the models of stages now (later ones may evict earlier ones under a tight budget)."""
+        for stage in stages:
+            self.get(stage)
+
+    def report(self):
+        if not self.specs:
+            return
+        budget = format_bytes(self.budget) if self.budget is not None else "unlimited"
+        print(f"[Model Registry] loads: {self.loads} | evictions: {self.evictions} | "
+              f"adapter loads: {self.adapter_loads} | adapter switches: {self.adapter_switches} | "
+              f"resident: {len(self._resident)} ({format_bytes(self.resident_bytes)}) | "
+              f"peak: {format_bytes(self.peak_bytes)} | budget: {budget}")
+
+    def show(self):
+        bases = {}
+        for stage in STAGES:
+            spec = self.spec(stage)
+            print(f"[Model Registry] {stage}: {spec if spec is not None else default_model_id() + ' (HANDLE)'}")
+            if spec is not None:
+                bases.setdefault(spec.base_key(), []).append(stage)
+        for key, stages in bases.items():
+            print(f"[Model Registry] base {key} shared by {', '.join(stages)}")
+
+
+REGISTRY = ModelRegistry(budget=parse_bytes(os.getenv("FINBOT_MODEL_MEMORY_BUDGET")))
+if os.getenv("FINBOT_MODEL_REGISTRY"):
+    REGISTRY.configure(path=os.environ["FINBOT_MODEL_REGISTRY"])
+
+
+if __name__ == "__main__":
+    from model_loader import add_model_arguments, configure_from_args
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--show", action="store_true", help="Print the model of every stage")
+    parser.add_argument("--warm", action="store_true", help="Load every stage's model in turn")
+    parser.add_argument("--stages", type=str, nargs="+", default=STAGES, help="Stages (in order) for --warm")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    if args.show:
+        REGISTRY.show()
+    if args.warm:
+        METRICS.configure(enabled=True, path=METRICS.path)
+        REGISTRY.preload(args.stages)
+        REGISTRY.report()
+        METRICS.report()
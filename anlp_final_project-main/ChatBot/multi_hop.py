@@ -0,0 +1,227 @@
+"""
+Multi-hop questions that need two modules, e.g. a FinQA question combined
+with a Forecaster one (data/multi_hop_questions.json).
+
+run_multi_hop splits the question into two sub-questions, routes both in
+one router batch and answers both in one padded generate call on the
+shared model (ENGINE.generate_mixed), so its latency is close to that of
+the slower sub-question. Company profiles for the forecaster are fetched
+in the background while the router runs and the other sub-question's
+prompt is built; the forecaster prompt (and so the generate call) waits
+for them. The answers are merged into one output.
+
+The split is chosen with the intent classifier: among the clause
+boundaries of the question, the one whose two halves it most confidently
+puts in two different modules. A question without a usable boundary is
+answered by run_pipeline.
+
+    python multi_hop.py --question "Who founded Amazon, and will AMZN go up next week?"
+    python multi_hop.py --file data/multi_hop_questions.json --out multi_hop_outputs.jsonl
+    # Add the one-after-the-other baseline to the timing of --file (both timed
+    # with the generation and route caches off)
+    python multi_hop.py --file data/multi_hop_questions.json --sequential
+    # Decomposition accuracy against the source questions, no model needed
+    python multi_hop.py --report
+"""
+import re
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from model_loader import add_model_arguments, configure_from_args
+from intent_classifier import default_classifier
+from profiles import PROFILE_PROVIDER
+from gen_cache import GENERATION_CACHE
+from route_cache import ROUTE_CACHE
+from metrics import METRICS
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# A clause boundary followed by the start of a new question or condition
+CLAUSE_BOUNDARY = re.compile(
+    r"(?:[,;:]\s+(?:and\s+|but\s+|while\s+|then\s+)?|[?.]\s+|\s+and\s+)"
+    r"(?=(?:how|what|which|who|where|when|why|is|are|will|would|could|can|do|does|should|if|given|based|"
+    r"considering|particularly|specifically|additionally|then|after|in\s+relation)\b)",
+    re.IGNORECASE
+)
+MIN_CLAUSE_WORDS = 3
+
+_io = ThreadPoolExecutor(max_workers=4, thread_name_prefix="multi-hop-io")
+
+
+def _best_split(question: str):
+    """(score, first, second, first module, second module) of the best boundary, or None."""
+    classifier = default_classifier()
+    best = None
+    for m in CLAUSE_BOUNDARY.finditer(question):
+        first, second = question[:m.start()].strip(), question[m.end():].strip()
+        if len(first.split()) < MIN_CLAUSE_WORDS or len(second.split()) < MIN_CLAUSE_WORDS:
+            continue
+        p, q = classifier.predict_proba(first), classifier.predict_proba(second)
+        for a in p:
+            for b in q:
+                if a != b and (best is None or p[a] * q[b] > best[0]):
+                    best = (p[a] * q[b], first, second, a, b)
+    return best
+
+
+def decompose(question: str):
+    """
+    (first sub-question, second sub-question) at the clause boundary whose
+    halves the intent classifier most confidently assigns to two different
+    modules, or None if the question has no such boundary.
+    """
+    best = _best_split(question)
+    return None if best is None else best[1:3]
+
+
+def _module_request(module: str, question: str, profile):
+    """(stage, prompt, max_new_tokens, extract) answering question with module."""
+    # Module imports load torch; kept local so decompose() and --report run without it
+    from finqa import build_finqa_prompt, extract_finqa_answer
+    from finred import build_finred_prompt, extract_finred_relations, FINRED_MAX_NEW_TOKENS
+    from forecaster import build_forecast_prompt, extract_forecast, FORECAST_MAX_NEW_TOKENS
+    from pipeline import extract_symbol_from_question
+
+    if module == "FinRED":
+        return ("finred", build_finred_prompt(question), FINRED_MAX_NEW_TOKENS,
+                lambda text: extract_finred_relations(text, question))
+    if module == "Forecaster":
+        # The profile fetch started before routing; wait for it here
+        if profile is not None:
+            profile.result()
+        return ("forecaster", build_forecast_prompt(question, extract_symbol_from_question(question)),
+                FORECAST_MAX_NEW_TOKENS, extract_forecast)
+    return "finqa", build_finqa_prompt(question) + "\n", 256, extract_finqa_answer
+
+
+def merge_answers(sub_questions: list, modules: list, answers: list) -> str:
+    return "\n\n".join(f"[{module}] {question}\n{answer}"
+                       for question, module, answer in zip(sub_questions, modules, answers))
+
+
+def run_multi_hop(question: str, router: str = "generate") -> dict:
+    """
+    Answer a question that combines two modules. Returns the sub-questions,
+    their modules and answers, and the merged output.
+    """
+    from engine import ENGINE
+    from pipeline import route_batch, run_pipeline, extract_symbol_from_question
+
+    with METRICS.span("multi_hop", router=router) as span:
+        with METRICS.span("multi_hop.decompose"):
+            sub_questions = decompose(question)
+        if sub_questions is None:
+            span.set(decomposed=False)
+            response = run_pipeline(question, router=router)
+            return {"sub_questions": [question], "routed_modules": [response["routed_module"]],
+                    "answers": [response["output"]], "output": response["output"]}
+        sub_questions = list(sub_questions)
+
+        # Either half may turn out to be the forecaster's: fetch both symbols' profiles during routing
+        symbols = {extract_symbol_from_question(q) for q in sub_questions}
+        profile = _io.submit(lambda: [PROFILE_PROVIDER.get(s) for s in symbols])
+
+        modules = route_batch(sub_questions, router=router)
+        span.set(modules=modules)
+        with METRICS.span("multi_hop.prompt"):
+            # Forecaster prompts last: the others are built while the profile fetch finishes
+            order = sorted(range(len(modules)), key=lambda i: modules[i] == "Forecaster")
+            requests = [None] * len(modules)
+            for i in order:
+                requests[i] = _module_request(modules[i], sub_questions[i], profile)
+        stages, prompts, max_new_tokens, extractors = map(list, zip(*requests))
+        texts = ENGINE.generate_mixed(stages, prompts, max_new_tokens)
+        with METRICS.span("multi_hop.parse"):
+            answers = [extract(text) for extract, text in zip(extractors, texts)]
+
+    return {"sub_questions": sub_questions, "routed_modules": modules, "answers": answers,
+            "output": merge_answers(sub_questions, modules, answers)}
+
+
+def run_multi_hop_sequential(question: str, router: str = "generate") -> dict:
+    """Baseline: the same sub-questions through run_pipeline one after the other."""
+    from pipeline import run_pipeline
+
+    sub_questions = list(decompose(question) or [question])
+    responses = [run_pipeline(q, router=router) for q in sub_questions]
+    modules = [r["routed_module"] for r in responses]
+    answers = [r["output"] for r in responses]
+    return {"sub_questions": sub_questions, "routed_modules": modules, "answers": answers,
+            "output": merge_answers(sub_questions, modules, answers)}
+
+
+def load_multi_hop(path=DATA_DIR / "multi_hop_questions.json") -> list:
+    """(question, [gold module of each source question]) pairs."""
+    with open(path, "r") as f:
+        items = json.load(f)
+    return [(item["multi_hop_question"], [q["input"]["module"] for q in item["original_questions"]])
+            for item in items]
+
+
+def report(path=DATA_DIR / "multi_hop_questions.json"):
+    """How often decompose() + the classifier's labels recover the source questions' modules."""
+    data = load_multi_hop(path)
+    split = exact = same_set = 0
+    by_pair = {}
+    start = time.perf_counter()
+    for question, gold in data:
+        best = _best_split(question)
+        stats = by_pair.setdefault(" + ".join(gold), [0, 0])
+        stats[0] += 1
+        if best is None:
+            continue
+        split += 1
+        labels = list(best[3:])
+        exact += labels == gold
+        same_set += set(labels) == set(gold)
+        stats[1] += set(labels) == set(gold)
+    elapsed = time.perf_counter() - start
+    print(f"[Multi-hop] {len(data)} questions | split {split} | modules correct (any order) {same_set} "
+          f"| in order {exact} | {1e6 * elapsed / len(data):.0f} us/question")
+    for pair, (n, correct) in sorted(by_pair.items()):
+        print(f"[Multi-hop] {pair}: {correct}/{n}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--question", type=str, help="Answer one multi-hop question")
+    parser.add_argument("--file", type=str, help="multi_hop_questions.json-style file to answer")
+    parser.add_argument("--out", type=str, default=None, help="Write one JSON line per answered question")
+    parser.add_argument("--router", type=str, default="generate", help="A router of pipeline.ROUTERS")
+    parser.add_argument("--sequential", action="store_true", help="Also time the one-after-the-other baseline")
+    parser.add_argument("--report", action="store_true", help="Decomposition accuracy only (no model)")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    if args.report:
+        report()
+    elif args.question:
+        configure_from_args(args)
+        print(run_multi_hop(args.question, router=args.router)["output"])
+    elif args.file:
+        configure_from_args(args)
+        # Otherwise the run that goes second is served from what the first one cached
+        GENERATION_CACHE.bypass = True
+        ROUTE_CACHE.enabled = False
+        data = load_multi_hop(args.file)
+        out = open(args.out, "w", encoding="utf-8") if args.out else None
+        batched_s = sequential_s = 0.0
+        for question, gold in data:
+            start = time.perf_counter()
+            response = run_multi_hop(question, router=args.router)
+            batched_s += time.perf_counter() - start
+            if args.sequential:
+                start = time.perf_counter()
+                run_multi_hop_sequential(question, router=args.router)
+                sequential_s += time.perf_counter() - start
+            if out is not None:
+                out.write(json.dumps(dict(response, input=question, modules=gold), ensure_ascii=False) + "\n")
+        if out is not None:
+            out.close()
+        line = f"[Multi-hop] {len(data)} questions | batched {1000 * batched_s / len(data):.0f} ms/question"
+        if args.sequential:
+            line += f" | sequential {1000 * sequential_s / len(data):.0f} ms/question"
+        print(line)
+        METRICS.report()
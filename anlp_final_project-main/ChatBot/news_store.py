@@ -0,0 +1,201 @@
+"""
+On-disk news store: the "News" JSON of the weekly symbol CSVs, parsed once.
+
+Ingestion formats every article as it appears in a prompt
+("[Headline]: ...\n[Summary]: ...\n") and keeps, for every week (CSV
+row), exactly the articles the CSV path selects: those dated up to the
+week's end date that are not spam, in CSV order. Articles shared by
+several weeks are stored once. Per store directory:
+
+  news.bin      the distinct formatted articles, UTF-8, back to back
+  offsets.bin   uint64 start offset of every article (plus the end)
+  items.bin     uint32 article numbers of every week, in CSV order
+  weeks.bin     uint64 start of every week in items.bin (plus the end)
+  starts.bin    uint32 YYYYMMDD start date of every week
+  ends.bin      uint32 YYYYMMDD end date of every week
+  symbols.json  {symbol: [first, stop)} weeks of that symbol, sorted by date
+
+Lookups memory-map the binary files; a week's articles are one bisect over
+the symbol's start dates and slices of news.bin, nothing is parsed.
+
+    # One-time ingestion of every symbol CSV in a directory
+    python news_store.py ingest --csv-dir data/csvs --out data/news_store
+    python news_store.py lookup --store data/news_store AAPL 2024-03-01 2024-03-08
+"""
+import os
+import csv
+import sys
+import json
+import mmap
+import hashlib
+import argparse
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+NEWS_SPAM_PREFIX = "Looking for stock market analysis and research with proves results?"
+NEWS_TEMPLATE = "[Headline]: {}\n[Summary]: {}\n"
+FILES = ["news.bin", "offsets.bin", "items.bin", "weeks.bin", "starts.bin", "ends.bin", "symbols.json"]
+
+
+def date_key(value) -> int:
+    """YYYYMMDD as an int from '2024-03-01', '20240301...', a date or a Timestamp."""
+    if hasattr(value, "strftime"):
+        value = value.strftime("%Y%m%d")
+    return int(str(value).replace("-", "")[:8])
+
+
+def symbol_from_csv(path) -> str:
+    """AAPL from <dir>/AAPL_2023-01-01_2024-01-01.csv (see prompt_builder.symbol_csv_path)."""
+    return Path(path).name.split("_")[0]
+
+
+def week_articles(raw_news: str, end_date) -> list:
+    """
+    Formatted articles of one CSV row's News JSON: non-spam, dated up to
+    end_date, in CSV order (the selection prompt.py has always made).
+    """
+    cutoff = date_key(end_date)
+    return [NEWS_TEMPLATE.format(n['headline'], n['summary']) for n in json.loads(raw_news)
+            if date_key(n['date']) <= cutoff and not n['summary'].startswith(NEWS_SPAM_PREFIX)]
+
+
+def read_weeks(csv_paths: list):
+    """(start, end, formatted articles) of every week in a symbol's CSVs, by date; repeated weeks once."""
+    csv.field_size_limit(sys.maxsize)
+    weeks = {}
+    for path in csv_paths:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                key = (date_key(row["Start Date"]), date_key(row["End Date"]))
+                if key not in weeks:
+                    weeks[key] = week_articles(row["News"], row["End Date"])
+    return [(start, end, articles) for (start, end), articles in sorted(weeks.items())]
+
+
+def ingest(csv_paths: list, out_dir) -> dict:
+    """Build a store in out_dir from symbol CSVs. Returns {symbol: number of distinct articles}."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    by_symbol = {}
+    for path in sorted(csv_paths):
+        by_symbol.setdefault(symbol_from_csv(path), []).append(path)
+
+    symbols, counts = {}, {}
+    offsets = array("Q", [0])
+    items, weeks = array("I"), array("Q", [0])
+    starts, ends = array("I"), array("I")
+    with open(out_dir / "news.bin.tmp", "wb") as news:
+        for symbol, paths in sorted(by_symbol.items()):
+            numbers = {}  # formatted article -> article number, within the symbol
+            first = len(starts)
+            for start, end, articles in read_weeks(paths):
+                for text in articles:
+                    if text not in numbers:
+                        data = text.encode("utf-8")
+                        news.write(data)
+                        numbers[text] = len(offsets) - 1
+                        offsets.append(offsets[-1] + len(data))
+                    items.append(numbers[text])
+                weeks.append(len(items))
+                starts.append(start)
+                ends.append(end)
+            symbols[symbol] = [first, len(starts)]
+            counts[symbol] = len(numbers)
+    for name, values in (("offsets.bin", offsets), ("items.bin", items), ("weeks.bin", weeks),
+                         ("starts.bin", starts), ("ends.bin", ends)):
+        with open(out_dir / f"{name}.tmp", "wb") as f:
+            values.tofile(f)
+    with open(out_dir / "symbols.json.tmp", "w") as f:
+        json.dump(symbols, f)
+    # symbols.json last: a store is complete once it is in place
+    for name in FILES:
+        os.replace(out_dir / f"{name}.tmp", out_dir / name)
+    return counts
+
+
+class NewsStore:
+    """Read side of a store directory; files are mapped on first use."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._symbols = None
+
+    def _open(self):
+        if self._symbols is not None:
+            return
+        with open(self.path / "symbols.json", "r") as f:
+            symbols = json.load(f)
+        self._maps = []
+        self._news = self._map("news.bin", None)
+        self._offsets = self._map("offsets.bin", "Q")
+        self._items = self._map("items.bin", "I")
+        self._weeks = self._map("weeks.bin", "Q")
+        self._starts = self._map("starts.bin", "I")
+        self._ends = self._map("ends.bin", "I")
+        self._symbols = symbols
+
+    def _map(self, name: str, fmt):
+        with open(self.path / name, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b"").cast(fmt) if fmt else b""
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(fmt) if fmt else mapped
+
+    def __contains__(self, symbol: str) -> bool:
+        self._open()
+        return symbol in self._symbols
+
+    def symbols(self) -> list:
+        self._open()
+        return sorted(self._symbols)
+
+    def version(self) -> str:
+        """Changes whenever the store is rebuilt; for caches derived from it."""
+        stat = os.stat(self.path / "symbols.json")
+        key = f"{self.path.resolve()}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+    def week(self, symbol: str, start_date, end_date):
+        """Formatted articles of symbol's week start_date..end_date as the CSV gives them, or None if not ingested."""
+        self._open()
+        first, stop = self._symbols.get(symbol, (0, 0))
+        start, end = date_key(start_date), date_key(end_date)
+        i = bisect_left(self._starts, start, first, stop)
+        while i < stop and self._starts[i] == start:
+            if self._ends[i] == end:
+                offsets = self._offsets
+                return [self._news[offsets[k]:offsets[k + 1]].decode("utf-8")
+                        for k in self._items[self._weeks[i]:self._weeks[i + 1]]]
+            i += 1
+        return None
+
+
+NEWS_STORE = NewsStore(os.environ["FINBOT_NEWS_STORE"]) if os.getenv("FINBOT_NEWS_STORE") else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = sub.add_parser("ingest", help="Build a store from the weekly symbol CSVs")
+    ingest_parser.add_argument("--csv-dir", type=str, required=True)
+    ingest_parser.add_argument("--out", type=str, required=True)
+    lookup_parser = sub.add_parser("lookup", help="Print the articles of one of a symbol's weeks")
+    lookup_parser.add_argument("--store", type=str, required=True)
+    lookup_parser.add_argument("symbol")
+    lookup_parser.add_argument("start_date")
+    lookup_parser.add_argument("end_date")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        counts = ingest(sorted(Path(args.csv_dir).glob("*.csv")), args.out)
+        size = os.path.getsize(Path(args.out) / "news.bin")
+        print(f"[News Store] {sum(counts.values())} distinct articles of {len(counts)} symbols, "
+              f"{size / 1e6:.1f} MB of text in {args.out}")
+    else:
+        articles = NewsStore(args.store).week(args.symbol, args.start_date, args.end_date)
+        if articles is None:
+            print(f"[News Store] {args.symbol} {args.start_date}..{args.end_date} is not in {args.store}")
+        for article in articles or []:
+            print(article)
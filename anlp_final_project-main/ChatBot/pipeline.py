@@ -1,23 +1,29 @@
 import json
-import torch
+import time
 import argparse
-from model_loader import model, tokenizer
-from finqa import run_finqa
-from finred import run_finred
-from forecaster import run_forecaster
-from indices import DOW_30, EURO_STOXX_50, CRYPTO
+from model_loader import add_model_arguments, configure_from_args
+from gen_cache import GENERATION_CACHE
+from engine import ENGINE
+from batching import chunked, BatchTimer
+from jsonl_io import iter_jsonl, input_hash, finished_counts, JsonlAppender
+from finqa import run_finqa, run_finqa_batch, run_finqa_stream
+from finred import run_finred, run_finred_batch, run_finred_stream
+from forecaster import run_forecaster, run_forecaster_batch, run_forecaster_stream
+from symbols import SYMBOL_INDEX
+from intent_classifier import default_classifier
+from route_cache import ROUTE_CACHE
+from model_registry import REGISTRY
+from metrics import METRICS
+from streaming import delta
 
 
 def extract_symbol_from_question(question: str) -> str:
-    q = question.upper()
-    for symbol in DOW_30 + EURO_STOXX_50 + CRYPTO:
-        if symbol in q:
-            return symbol
-    return "AAPL"
+    with METRICS.span("symbol"):
+        symbols = SYMBOL_INDEX.extract(question)
+    return symbols[0] if symbols else "AAPL"
 
 
-def build_router_prompt(question: str) -> str:
-    return f"""
+ROUTER_PROMPT_PREFIX = """
 You are a classification assistant for a financial question-answering system.
 
 Your task is to read a user's financial question or statement and classify it into exactly ONE of the following module categories:
@@ -65,106 +71,483 @@ A: Forecaster
 
 Now classify this input:
 
-Input: {question}
+"""
+
+ROUTER_PROMPT_SUFFIX = """Input: {question}
 A:"""
 
-def central_router(question: str, max_length: int = 1024) -> str:
-    prompt = build_router_prompt(question)
-
-    tokens = tokenizer(prompt, return_tensors='pt', truncation=True, padding=True, max_length=max_length)
-    tokens = {k: v.to(model.device) for k, v in tokens.items()}
-
-    with torch.no_grad():
-        output_ids = model.generate(
-            **tokens,
-            max_new_tokens=10,
-            do_sample=False,
-            eos_token_id=tokenizer.eos_token_id,
-            pad_token_id=tokenizer.pad_token_id
-        )
 
-    output_text = tokenizer.decode(output_ids[0], skip_special_tokens=True).strip().lower()
-    print("[Router Output]:", output_text)
-    print("[Router Output Full]:", repr(output_text))  # Use repr to see all whitespace
-    
-    # Extract just the last answer part
-    # Look for the last occurrence of "a:" and take what follows
-    if "a:" in output_text:
-        last_answer = output_text.split("a:")[-1].strip()
-        print("[Extracted Answer]:", last_answer)
-        
-        if "finqa" == last_answer:
-            return "FinQA"
-        elif "finred" == last_answer:
-            return "FinRED"
-        elif "forecaster" == last_answer:
-            return "Forecaster"
+ROUTER_MAX_NEW_TOKENS = 10
+
+
+def build_router_prompt(question: str) -> str:
+    return ROUTER_PROMPT_PREFIX + ROUTER_PROMPT_SUFFIX.format(question=question)
+
+def parse_router_output(output_text: str) -> str:
+    output_text = output_text.strip().lower()
+
+    # The completion is just the label; if the model repeated "A:", take what follows the last one
+    last_answer = output_text.split("a:")[-1].strip()
+
+    if "finqa" == last_answer:
+        return "FinQA"
+    elif "finred" == last_answer:
+        return "FinRED"
+    elif "forecaster" == last_answer:
+        return "Forecaster"
     
     # Fallback to default if extraction fails
     return "FinQA"  # Or choose another default
 
 
-def run_pipeline(question: str) -> dict:
-    model_choice = central_router(question)
-    print(f"[Routing Decision] → {model_choice}")
+def generate_router(questions: list, max_length: int = 1024) -> list:
+    """
+    Router completions for a list of questions (generated text only); the
+    few-shot examples are served from the prefix cache.
+    """
+    prompts = [build_router_prompt(q) for q in questions]
+    return ENGINE.generate("router", prompts, ROUTER_MAX_NEW_TOKENS, prefix=ROUTER_PROMPT_PREFIX,
+                           max_length=max_length)
+
+
+def central_router(question: str, max_length: int = 1024) -> str:
+    return central_router_batch([question], max_length)[0]
+
+
+def central_router_batch(questions: list, max_length: int = 1024) -> list:
+    with METRICS.span("router", batch=len(questions)):
+        return [parse_router_output(text) for text in generate_router(questions, max_length)]
+
+
+ROUTER_LABELS = ["FinQA", "FinRED", "Forecaster"]
+
+_router_label_ids = {}
+
+
+def router_label_token_ids(tokenizer) -> list:
+    """
+    Token ids each label adds after the router prompt's trailing "A:".
+    Tokenized in context so sentencepiece word-boundary markers match.
+    """
+    key = (tokenizer.name_or_path, len(tokenizer))
+    if key not in _router_label_ids:
+        base = tokenizer("A:", add_special_tokens=False)["input_ids"]
+        label_ids = []
+        for label in ROUTER_LABELS:
+            full = tokenizer("A: " + label, add_special_tokens=False)["input_ids"]
+            if full[:len(base)] == base:
+                label_ids.append(full[len(base):])
+            else:
+                label_ids.append(tokenizer(" " + label, add_special_tokens=False)["input_ids"])
+        _router_label_ids[key] = label_ids
+    return _router_label_ids[key]
+
+
+def _repeat_past(past_key_values, n: int):
+    # Cache objects (transformers >= 4.38) repeat in place; legacy caches are tuples
+    if hasattr(past_key_values, "batch_repeat_interleave"):
+        past_key_values.batch_repeat_interleave(n)
+        return past_key_values
+    return tuple(tuple(t.repeat_interleave(n, dim=0) for t in layer) for layer in past_key_values)
+
+
+def score_router_batch(questions: list, max_length: int = 1024) -> list:
+    """
+    Route by comparing the log-probabilities of the "FinQA", "FinRED" and
+    "Forecaster" continuations instead of free-form generation.
+
+    The few-shot prompts are prefilled once in a single padded forward pass.
+    Labels that span several tokens are finished with one extra forward over
+    just those tokens on top of the prompt cache, so no decode loop is run.
+    Returns one (label, {label: probability}) pair per question.
+    """
+    import torch
+
+    model, tokenizer = REGISTRY.get("router")
+    with METRICS.span("router.tokenize", batch=len(questions)):
+        prompts = [build_router_prompt(q) for q in questions]
+        budget = ENGINE.context_budget(model, tokenizer, 0, max_length)
+        tokens = ENGINE.encode(model, tokenizer, prompts, budget)
+    input_ids = tokens["input_ids"]
+    attention_mask = tokens["attention_mask"]
+    position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+    label_ids = router_label_token_ids(tokenizer)
+    n_labels = len(label_ids)
+    tail_len = max(len(ids) for ids in label_ids) - 1
+
+    with METRICS.span("router.score", batch=len(questions)) as span, torch.no_grad():
+        span.add(prompt_tokens=int(attention_mask.sum()))
+        out = model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=tail_len > 0
+        )
+        first = out.logits[:, -1, :].float().log_softmax(-1)
+        scores = torch.stack([first[:, ids[0]] for ids in label_ids], dim=1)
+
+        if tail_len > 0:
+            # Row b * n_labels + j continues prompt b with label j
+            feed = torch.full((len(prompts) * n_labels, tail_len), tokenizer.pad_token_id, dtype=torch.long)
+            feed_mask = torch.zeros_like(feed)
+            for j, ids in enumerate(label_ids):
+                if len(ids) > 1:
+                    feed[j::n_labels, :len(ids) - 1] = torch.tensor(ids[:-1])
+                    feed_mask[j::n_labels, :len(ids) - 1] = 1
+
+            prompt_mask = attention_mask.repeat_interleave(n_labels, dim=0)
+            positions = prompt_mask.sum(-1, keepdim=True) + torch.arange(tail_len, device=model.device).unsqueeze(0)
+            tail_out = model(
+                input_ids=feed.to(model.device),
+                attention_mask=torch.cat([prompt_mask, feed_mask.to(model.device)], dim=-1),
+                position_ids=positions,
+                past_key_values=_repeat_past(out.past_key_values, n_labels),
+                use_cache=False
+            )
+            tail = tail_out.logits.float().log_softmax(-1)
+            for j, ids in enumerate(label_ids):
+                for k in range(1, len(ids)):
+                    scores[:, j] += tail[j::n_labels, k - 1, ids[k]]
+
+    probs = scores.softmax(-1).tolist()
+    results = []
+    for row in probs:
+        best = max(range(n_labels), key=lambda j: row[j])
+        results.append((ROUTER_LABELS[best], dict(zip(ROUTER_LABELS, row))))
+    return results
+
+
+def score_router(question: str, max_length: int = 1024):
+    return score_router_batch([question], max_length)[0]
+
+
+def _score_route(questions: list) -> list:
+    with METRICS.span("router", batch=len(questions)):
+        return [label for label, _ in score_router_batch(questions)]
+
+
+def _classifier_route(questions: list) -> list:
+    """
+    Hashed n-gram intent classifier first; only the questions it is not
+    confident about go through the generate router, in one batch.
+    """
+    with METRICS.span("router.classifier", batch=len(questions)) as span:
+        routes = default_classifier().route(questions)
+        unsure = [i for i, label in enumerate(routes) if label is None]
+        span.add(classifier_routed=len(questions) - len(unsure), llm_routed=len(unsure))
+    if unsure:
+        for i, label in zip(unsure, central_router_batch([questions[i] for i in unsure])):
+            routes[i] = label
+    return routes
+
+
+ROUTERS = {
+    "generate": central_router_batch,
+    "score": _score_route,
+    "classifier": _classifier_route,
+}
+
+
+def route_batch(questions: list, router: str = "generate") -> list:
+    """
+    Routes for questions. Questions close enough to one routed before by the
+    same router model and router are answered by the route cache; only the
+    rest reach ROUTERS[router].
+    """
+    if not ROUTE_CACHE.enabled:
+        return ROUTERS[router](questions)
+    with METRICS.span("router.cache", batch=len(questions)):
+        return ROUTE_CACHE.route(questions, ROUTERS[router], namespace=f"{REGISTRY.model_id('router')}|{router}")
+
+
+def compare_routers(dataset_path: str, routers=("generate", "score", "classifier")):
+    """
+    Report routing accuracy and mean per-question latency of each router on a
+    labeled JSONL file such as data/clean_router_testset_60.jsonl. The route
+    cache is bypassed so every router really runs.
+    """
+    with open(dataset_path, 'r') as f:
+        data = [json.loads(line) for line in f if line.strip()]
+
+    for name in routers:
+        correct = 0
+        start = time.perf_counter()
+        for item in data:
+            if ROUTERS[name]([item["input"]])[0] == item["module"]:
+                correct += 1
+        elapsed = time.perf_counter() - start
+        print(f"[Router: {name}] Accuracy: {correct / len(data):.2%} ({correct}/{len(data)}) | "
+              f"Avg latency: {1000 * elapsed / len(data):.1f} ms")
+
+
+def run_pipeline(question: str, router: str = "generate") -> dict:
+    with METRICS.span("pipeline", router=router) as span:
+        model_choice = route_batch([question], router=router)[0]
+        span.set(module=model_choice)
+
+        if model_choice == "FinRED":
+            output = run_finred(question)
+        elif model_choice == "FinQA":
+            output = run_finqa(question)
+        elif model_choice == "Forecaster":
+            symbol = extract_symbol_from_question(question)
+            span.set(symbol=symbol)
+            output = run_forecaster(question, symbol=symbol)
+        else:
+            output = "Sorry, I couldn't determine the right model to use."
+
+    return {
+        "routed_module": model_choice,
+        "output": output
+    }
+
+
+def run_pipeline_stream(question: str, router: str = "generate"):
+    """
+    run_pipeline as a stream of events (see streaming.py): the routing
+    decision first, then the answer while it is generated, then "done"
+    carrying the same response run_pipeline returns. Time to the first
+    answer text is recorded as a "pipeline.ttft" span.
+    """
+    start = time.perf_counter()
+    model_choice = route_batch([question], router=router)[0]
+    yield {"event": "route", "module": model_choice}
 
     if model_choice == "FinRED":
-        output = run_finred(question)
+        events = run_finred_stream(question)
     elif model_choice == "FinQA":
-        output = run_finqa(question)
+        events = run_finqa_stream(question)
     elif model_choice == "Forecaster":
-        symbol = extract_symbol_from_question(question)
-        print(f"[Extracted Symbol] → {symbol}")
-        output = run_forecaster(question, symbol=symbol)
+        events = run_forecaster_stream(question, symbol=extract_symbol_from_question(question))
     else:
         output = "Sorry, I couldn't determine the right model to use."
+        events = [delta(output), {"event": "done", "output": output}]
+
+    first = True
+    for event in events:
+        if event["event"] == "done":
+            output = event["output"]
+            continue
+        if first and event["event"] == "delta":
+            METRICS.observe("pipeline.ttft", time.perf_counter() - start, module=model_choice)
+            first = False
+        yield event
+
+    yield {"event": "done", "routed_module": model_choice, "output": output}
+
+
+def run_pipeline_batch(questions: list, batch_size: int = 8, router: str = "generate") -> list:
+    """
+    Batched run_pipeline: route every question in padded batches, group the
+    questions by routed module and run each module over length-sorted buckets.
+    Returns one response dict per question, in input order.
+    """
+    with METRICS.span("pipeline", batch=len(questions), router=router):
+        routes = []
+        outputs = [None] * len(questions)
+        for batch in chunked(questions, batch_size):
+            with BatchTimer("router", len(batch)):
+                routes.extend(_route_batch_safely(batch, router, outputs, len(routes)))
+
+        groups = {}
+        for i, module in enumerate(routes):
+            if module != "Error":
+                groups.setdefault(module, []).append(i)
+
+        for module, indices in groups.items():
+            group = [questions[i] for i in indices]
+            try:
+                if module == "FinRED":
+                    answers = run_finred_batch(group, batch_size=batch_size)
+                elif module == "FinQA":
+                    answers = run_finqa_batch(group, batch_size=batch_size)
+                elif module == "Forecaster":
+                    symbols = [extract_symbol_from_question(q) for q in group]
+                    answers = run_forecaster_batch(group, symbols, batch_size=batch_size)
+                else:
+                    answers = ["Sorry, I couldn't determine the right model to use."] * len(group)
+            except Exception as e:
+                # Fall back to one question at a time so a single bad item only fails itself
+                print(f"[Batch] {module} batch failed ({e}); retrying sequentially")
+                answers = [_run_module_safely(module, q) for q in group]
+
+            for i, answer in zip(indices, answers):
+                outputs[i] = answer
+
+        return [
+            {"routed_module": module, "output": output}
+            for module, output in zip(routes, outputs)
+        ]
+
+
+def _route_batch_safely(batch: list, router: str, outputs: list, offset: int) -> list:
+    """
+    route_batch, falling back to one question at a time if the batch fails.
+    A question that still fails is routed to "Error" with its message in
+    outputs[offset + i], as the sequential path records it.
+    """
+    try:
+        return route_batch(batch, router=router)
+    except Exception as e:
+        print(f"[Batch] routing batch failed ({e}); retrying sequentially")
+    routes = []
+    for i, question in enumerate(batch):
+        try:
+            routes.append(route_batch([question], router=router)[0])
+        except Exception as e:
+            routes.append("Error")
+            outputs[offset + i] = f"[Error] {str(e)}"
+    return routes
 
-    return {
-        "routed_module": model_choice,
-        "output": output
-    }
 
+def _run_module_safely(module: str, question: str):
+    try:
+        if module == "FinRED":
+            return run_finred(question)
+        if module == "Forecaster":
+            return run_forecaster(question, symbol=extract_symbol_from_question(question))
+        return run_finqa(question)
+    except Exception as e:
+        return f"[Error] {str(e)}"
 
-def batch_run_from_file(dataset_path: str, save_path: str = "pipeline_outputs.jsonl"):
-    with open(dataset_path, 'r') as f:
-        data = [json.loads(line.strip()) for line in f]
 
-    results = []
-    for i, item in enumerate(data):
+def _run_window(window: list, batch_size: int, router: str) -> list:
+    if batch_size > 1:
+        return run_pipeline_batch([item["input"] for _, _, item in window], batch_size=batch_size, router=router)
+
+    responses = []
+    for i, _, item in window:
         question = item["input"]
         print(f"\n--- [{i+1}] Question ---\n{question}")
         try:
-            response = run_pipeline(question)
+            response = run_pipeline(question, router=router)
         except Exception as e:
             response = {
                 "routed_module": "Error",
                 "output": f"[Error] {str(e)}"
             }
-
-        result = {
-            "input": question,
-            "expected_output": item.get("output", ""),
-            "instruction": item.get("instruction", ""),
-            "module": item.get("module", ""),                  # ground truth module
-            "routed_module": response["routed_module"],        # model-predicted module
-            "pipeline_output": response["output"]              # actual model output
-        }
-        results.append(result)
-
-    with open(save_path, 'w') as f:
-        for r in results:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
-
-    print(f"Output saved to {save_path}")
+        responses.append(response)
+    return responses
+
+
+def batch_run_from_file(dataset_path: str, save_path: str = "pipeline_outputs.jsonl", batch_size: int = 1,
+                        router: str = "generate", start: int = 0, stop: int = None, resume: bool = True,
+                        window: int = None, fsync_every: int = 10, route_cache: bool = False):
+    """
+    Stream dataset_path through the pipeline and append every result to
+    save_path as soon as it is done.
+
+    Input is read lazily, at most `window` items at a time (default
+    4 * batch_size), so memory stays flat for any file size. With resume=True
+    items whose input hash is already in save_path are skipped, so a crashed
+    run picks up where it stopped. start/stop select a slice of input lines.
+    The route cache is bypassed unless route_cache is set, so every routed
+    module comes from the router being run.
+    """
+    cache_enabled = ROUTE_CACHE.enabled
+    ROUTE_CACHE.enabled = cache_enabled and route_cache
+    try:
+        _batch_run(dataset_path, save_path, batch_size, router, start, stop, resume, window, fsync_every)
+    finally:
+        ROUTE_CACHE.enabled = cache_enabled
+
+
+def _batch_run(dataset_path: str, save_path: str, batch_size: int, router: str, start: int, stop: int,
+               resume: bool, window: int, fsync_every: int):
+    window = window or max(1, 4 * batch_size)
+    if resume:
+        done = finished_counts(save_path)
+    else:
+        open(save_path, 'w').close()
+        done = {}
+
+    written = skipped = 0
+    with JsonlAppender(save_path, fsync_every=fsync_every) as out:
+        pending = []
+        items = iter_jsonl(dataset_path, start, stop)
+        while True:
+            for i, item in items:
+                key = input_hash(item)
+                if done.get(key, 0) > 0:
+                    done[key] -= 1
+                    skipped += 1
+                    continue
+                pending.append((i, key, item))
+                if len(pending) >= window:
+                    break
+
+            if not pending:
+                break
+
+            responses = _run_window(pending, batch_size, router)
+            for (_, key, item), response in zip(pending, responses):
+                out.write({
+                    "input": item["input"],
+                    "expected_output": item.get("output", ""),
+                    "instruction": item.get("instruction", ""),
+                    "module": item.get("module", ""),                  # ground truth module
+                    "routed_module": response["routed_module"],        # model-predicted module
+                    "pipeline_output": response["output"],             # actual model output
+                    "input_hash": key
+                })
+                written += 1
+            pending = []
+
+    print(f"Output saved to {save_path} ({written} new, {skipped} already done)")
+    GENERATION_CACHE.report()
+    ROUTE_CACHE.report()
+    REGISTRY.report()
+    METRICS.report()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--file", type=str, help="Path to dataset JSONL file")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Questions per padded generate call in --file mode (1 = sequential)")
+    parser.add_argument("--router", choices=sorted(ROUTERS), default="generate",
+                        help="generate: free-form router; score: label log-probability router; "
+                             "classifier: n-gram classifier with generate-router fallback")
+    parser.add_argument("--compare-routers", type=str, metavar="FILE",
+                        help="Report accuracy/latency of every router on a labeled JSONL file")
+    parser.add_argument("--out", type=str, default="pipeline_outputs.jsonl", help="Output JSONL file (appended)")
+    parser.add_argument("--start", type=int, default=0, help="First input line to run")
+    parser.add_argument("--stop", type=int, default=None, help="Stop before this input line")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite --out instead of skipping finished inputs")
+    parser.add_argument("--no-gen-cache", action="store_true", help="Bypass the persistent generation cache")
+    parser.add_argument("--no-route-cache", action="store_true", help="Route every question with --router")
+    parser.add_argument("--route-cache", action="store_true",
+                        help="Use the route cache in --file mode too (off there by default)")
+    parser.add_argument("--metrics", type=str, metavar="FILE", help="Append one JSON line per stage span to FILE")
+    parser.add_argument("--metrics-prom", type=str, metavar="FILE", help="Write a Prometheus text dump at exit")
+    parser.add_argument("--question", type=str, default="Will TSLA go up next week?",
+                        help="Question to answer when no --file is given")
+    parser.add_argument("--stream", action="store_true", help="Print the answer while it is generated")
+    add_model_arguments(parser)
     args = parser.parse_args()
-
-    if args.file:
-        batch_run_from_file(args.file)
+    configure_from_args(args)
+    GENERATION_CACHE.bypass = GENERATION_CACHE.bypass or args.no_gen_cache
+    ROUTE_CACHE.enabled = ROUTE_CACHE.enabled and not args.no_route_cache
+    if args.metrics or args.metrics_prom:
+        METRICS.configure(enabled=True, path=args.metrics)
+
+    if args.compare_routers:
+        compare_routers(args.compare_routers)
+    elif args.file:
+        batch_run_from_file(args.file, save_path=args.out, batch_size=args.batch_size, router=args.router,
+                            start=args.start, stop=args.stop, resume=not args.no_resume, route_cache=args.route_cache)
+    elif args.stream:
+        for event in run_pipeline_stream(args.question, router=args.router):
+            if event["event"] == "route":
+                print(f"[{event['module']}] ", end="", flush=True)
+            elif event["event"] == "delta":
+                print(event["text"], end="", flush=True)
+            elif event["event"] == "reset":
+                print("\n[...] ", end="", flush=True)
+        print()
     else:
-        question = "Will TSLA go up next week?"
-        print(run_pipeline(question))
+        print(run_pipeline(args.question, router=args.router))
+
+    if args.metrics_prom:
+        METRICS.write_prometheus(args.metrics_prom)
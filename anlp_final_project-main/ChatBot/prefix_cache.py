@@ -0,0 +1,142 @@
+import copy
+import hashlib
+from metrics import METRICS
+
+
+def _share(cache, n: int, batch: int):
+    """
+    A cache holding the first n positions of cache for batch rows, as views of
+    cache's tensors. DynamicCache grows by concatenating into new tensors and
+    crops by slicing, so generate() never writes to the shared prefix; only
+    the per-layer holders are copied.
+    """
+    def view(t):
+        return t[:, :, :n].expand(batch, -1, -1, -1)
+
+    shared = copy.copy(cache)
+    if hasattr(cache, "layers"):  # transformers >= 4.56: one object per layer
+        shared.layers = [copy.copy(layer) for layer in cache.layers]
+        for layer in shared.layers:
+            layer.keys, layer.values = view(layer.keys), view(layer.values)
+    else:
+        shared.key_cache = [view(t) for t in cache.key_cache]
+        shared.value_cache = [view(t) for t in cache.value_cache]
+        if hasattr(cache, "_seen_tokens"):
+            shared._seen_tokens = n
+    return shared
+
+
+def _move_padding(tokens: dict, n: int) -> dict:
+    """
+    Left-padded rows [pads][prefix][suffix] rearranged to [prefix][pads][suffix],
+    so the first n columns are the shared prefix of every row. The padding stays
+    masked out and every row keeps its length.
+    """
+    input_ids, attention_mask = tokens["input_ids"], tokens["attention_mask"]
+    ids, mask = input_ids.clone(), attention_mask.clone()
+    for row in range(input_ids.shape[0]):
+        pads = int((attention_mask[row] == 0).sum())
+        if pads:
+            ids[row, :n] = input_ids[row, pads:pads + n]
+            ids[row, n:n + pads] = input_ids[row, :pads]
+            mask[row, :n] = 1
+            mask[row, n:n + pads] = 0
+    return {**tokens, "input_ids": ids, "attention_mask": mask}
+
+
+class PrefixEntry:
+    def __init__(self, fingerprint, input_ids, past_key_values):
+        self.fingerprint = fingerprint
+        self.input_ids = input_ids
+        self.past_key_values = past_key_values
+
+
+class PrefixCache:
+    """
+    Keeps the past_key_values of each module's static few-shot prefix so a
+    request only has to prefill its own suffix.
+
+    Entries are keyed by module name and fingerprinted with the model identity
+    and a hash of the prefix text: loading another model or editing a template
+    recomputes the entry on next use.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._entries = {}
+
+    def clear(self):
+        self._entries.clear()
+
+    def forget(self, model):
+        """Drop the entries of model, e.g. before it is unloaded and its config's id can be reused."""
+        config_id = id(model.config)
+        for name in [name for name, entry in self._entries.items() if entry.fingerprint[0] == config_id]:
+            del self._entries[name]
+
+    def _fingerprint(self, model, prefix: str):
+        # model may be model_loader's lazy handle, so identify the loaded model by its config object
+        name = getattr(model.config, "_name_or_path", "")
+        return (id(model.config), name, hashlib.sha1(prefix.encode("utf-8")).hexdigest())
+
+    def get(self, model, tokenizer, name: str, prefix: str) -> PrefixEntry:
+        fingerprint = self._fingerprint(model, prefix)
+        entry = self._entries.get(name)
+        if entry is None or entry.fingerprint != fingerprint:
+            import torch
+            from transformers import DynamicCache
+
+            input_ids = tokenizer(prefix, return_tensors='pt')["input_ids"].to(model.device)
+            with torch.no_grad():
+                out = model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True)
+            entry = PrefixEntry(fingerprint, input_ids[0].tolist(), out.past_key_values)
+            self._entries[name] = entry
+        return entry
+
+    def reusable_length(self, entry: PrefixEntry, input_ids: list) -> int:
+        """
+        Number of leading prompt tokens covered by the cached prefix. At least
+        one prompt token is always left for generate() to prefill.
+        """
+        n = 0
+        limit = min(len(entry.input_ids), len(input_ids) - 1)
+        while n < limit and entry.input_ids[n] == input_ids[n]:
+            n += 1
+        return n
+
+    def generate(self, model, tokenizer, name: str, prefix: str, tokens: dict, **generate_kwargs):
+        """
+        model.generate() for already-tokenized (left-padded) prompts, starting
+        from the cached prefix state. Every row reuses the prefix tokens all rows
+        share; padding is moved behind them. Falls back to a plain generate() when
+        disabled or when a prompt does not start with the prefix tokens.
+        """
+        if not self.enabled:
+            return model.generate(**tokens, **generate_kwargs)
+
+        entry = self.get(model, tokenizer, name, prefix)
+        input_ids = tokens["input_ids"]
+        batch = input_ids.shape[0]
+        if batch == 1:
+            n = self.reusable_length(entry, input_ids[0].tolist())
+            inputs = tokens
+        else:
+            mask = tokens["attention_mask"]
+            rows = [ids[mask[row] == 1].tolist() for row, ids in enumerate(input_ids)]
+            n = min(self.reusable_length(entry, ids) for ids in rows)
+            inputs = _move_padding(tokens, n) if n else tokens
+        if n == 0:
+            return model.generate(**tokens, **generate_kwargs)
+
+        METRICS.add(prefix_cached_tokens=n * batch)
+        past_key_values = _share(entry.past_key_values, n, batch)
+        output_ids = model.generate(**inputs, past_key_values=past_key_values, **generate_kwargs)
+        if inputs is not tokens:
+            import torch
+
+            # Hand back the prompts as they were padded; the completions start at the same column
+            output_ids = torch.cat([input_ids, output_ids[:, input_ids.shape[1]:]], dim=1)
+        return output_ids
+
+
+PREFIX_CACHE = PrefixCache()
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from gen_cache import CACHE_DIR
+from indices import DOW_30, EURO_STOXX_50
+from metrics import METRICS
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# Company profiles change maybe quarterly
+DEFAULT_TTL = 30 * 24 * 3600
+
+
+class FinnhubBackend:
+    """Fetches profiles with finnhub's company_profile2 endpoint."""
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("FINNHUB_API_KEY")
+        self._client = None
+
+    def fetch(self, symbol: str) -> dict:
+        if self._client is None:
+            import finnhub
+            self._client = finnhub.Client(api_key=self.api_key)
+        return self._client.company_profile2(symbol=symbol)
+
+
+class FixtureBackend:
+    """Serves profiles from a local {symbol: profile} JSON file, e.g. in tests."""
+
+    def __init__(self, path=DATA_DIR / "company_profiles_dow30.json"):
+        with open(path, "r") as f:
+            self.profiles = json.load(f)
+
+    def fetch(self, symbol: str) -> dict:
+        return dict(self.profiles.get(symbol, {}))
+
+
+class ProfileProvider:
+    """
+    Company profiles with an in-memory TTL cache backed by a JSON store on disk.
+
+    Lookups go memory -> disk store -> backend; anything fetched from the
+    backend is written through to the store. Empty profiles (unknown
+    symbols) are never cached.
+    """
+
+    def __init__(self, backend=None, ttl: float = DEFAULT_TTL, store_path=None):
+        self.backend = backend or FinnhubBackend()
+        self.ttl = ttl
+        self.store_path = Path(store_path) if store_path else CACHE_DIR / "company_profiles.json"
+        self._lock = threading.Lock()
+        self._memory = {}
+        self._store = None
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and time.time() - entry["fetched_at"] < self.ttl
+
+    def _load_store(self) -> dict:
+        if self._store is None:
+            if self.store_path.exists():
+                with open(self.store_path, "r") as f:
+                    self._store = json.load(f)
+            else:
+                self._store = {}
+        return self._store
+
+    def _save_store(self):
+        self.store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.store_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._store, f, ensure_ascii=False)
+        os.replace(tmp_path, self.store_path)
+
+    def _cached(self, symbol: str):
+        entry = self._memory.get(symbol)
+        if self._fresh(entry):
+            return entry["profile"]
+        entry = self._load_store().get(symbol)
+        if self._fresh(entry):
+            self._memory[symbol] = entry
+            return entry["profile"]
+        return None
+
+    def _remember(self, symbol: str, profile: dict):
+        if profile:
+            entry = {"fetched_at": time.time(), "profile": profile}
+            self._memory[symbol] = entry
+            self._load_store()[symbol] = entry
+
+    def get(self, symbol: str) -> dict:
+        with self._lock:
+            profile = self._cached(symbol)
+        if profile is not None:
+            METRICS.add(profile_hits=1)
+            return dict(profile)
+
+        with METRICS.span("profile.fetch", symbol=symbol):
+            profile = self.backend.fetch(symbol)
+        with self._lock:
+            self._remember(symbol, profile)
+            if profile:
+                self._save_store()
+        return dict(profile)
+
+    def prefetch(self, symbols, workers: int = 4) -> int:
+        """
+        Fetch every stale or missing profile of symbols concurrently and write
+        the store once. Returns the number of profiles fetched.
+        """
+        with self._lock:
+            missing = [s for s in dict.fromkeys(symbols) if self._cached(s) is None]
+        if not missing:
+            return 0
+
+        with METRICS.span("profile.prefetch", symbols=len(missing)), ThreadPoolExecutor(max_workers=workers) as pool:
+            profiles = list(pool.map(self.backend.fetch, missing))
+
+        with self._lock:
+            for symbol, profile in zip(missing, profiles):
+                self._remember(symbol, profile)
+            self._save_store()
+        return sum(1 for p in profiles if p)
+
+    def invalidate(self, symbol: str = None):
+        with self._lock:
+            if symbol is None:
+                self._memory.clear()
+                self._store = {}
+            else:
+                self._memory.pop(symbol, None)
+                self._load_store().pop(symbol, None)
+            self._save_store()
+
+
+def default_backend():
+    fixture = os.getenv("FINBOT_PROFILE_FIXTURE")
+    return FixtureBackend(fixture) if fixture else FinnhubBackend()
+
+
+PROFILE_PROVIDER = ProfileProvider(
+    backend=default_backend(),
+    ttl=float(os.getenv("FINBOT_PROFILE_TTL", DEFAULT_TTL)),
+    store_path=os.getenv("FINBOT_PROFILE_STORE")
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefetch", action="store_true", help="Fetch all DOW_30 and EURO_STOXX_50 profiles")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.prefetch:
+        start = time.perf_counter()
+        fetched = PROFILE_PROVIDER.prefetch(DOW_30 + EURO_STOXX_50, workers=args.workers)
+        print(f"Fetched {fetched} profiles in {time.perf_counter() - start:.1f}s "
+              f"into {PROFILE_PROVIDER.store_path}")
@@ -1,17 +1,15 @@
 import os
 import json
 import random
-import finnhub
 import yfinance as yf
-import pandas as pd
 from indices import *
-
-finnhub_client = finnhub.Client(api_key=os.getenv("FINNHUB_API_KEY"))
+from profiles import PROFILE_PROVIDER
+from news_store import NEWS_STORE, week_articles
 
 
 def get_company_prompt(symbol):
     
-    profile = finnhub_client.company_profile2(symbol=symbol)
+    profile = PROFILE_PROVIDER.get(symbol)
 
     company_template = "[Company Introduction]:\n\n{name} is a leading entity in the {finnhubIndustry} sector. Incorporated and publicly traded since {ipo}, the company has established its reputation as one of the key players in the market. As of today, {name} has a market capitalization of {marketCapitalization:.2f} in {currency}, with {shareOutstanding:.2f} shares outstanding." \
         "\n\n{name} operates primarily in the {country}, trading under the ticker {ticker} on the {exchange}. As a dominant force in the {finnhubIndustry} space, the company continues to innovate and drive progress within the industry."
@@ -32,7 +30,21 @@ def get_crypto_prompt(symbol):
     return formatted_str
 
 
-def get_prompt_by_row(symbol, row):
+def _row_news(symbol, row, start_date, end_date, news_store):
+    """
+    The week's formatted articles: looked up in the news store when the week
+    was ingested, otherwise parsed from the row's News JSON. Both give the
+    same articles in the same order.
+    """
+    news_store = news_store or NEWS_STORE
+    if news_store is not None and symbol in news_store:
+        news = news_store.week(symbol, start_date, end_date)
+        if news is not None:
+            return news
+    return week_articles(row["News"], end_date)
+
+
+def get_prompt_by_row(symbol, row, news_store=None):
 
     start_date = row['Start Date'] if isinstance(row['Start Date'], str) else row['Start Date'].strftime('%Y-%m-%d')
     end_date = row['End Date'] if isinstance(row['End Date'], str) else row['End Date'].strftime('%Y-%m-%d')
@@ -40,10 +52,7 @@ def get_prompt_by_row(symbol, row):
     head = "From {} to {}, {}'s stock price {} from {:.2f} to {:.2f}. News during this period are listed below:\n\n".format(
         start_date, end_date, symbol, term, row['Start Price'], row['End Price'])
     
-    news = json.loads(row["News"])
-    news = ["[Headline]: {}\n[Summary]: {}\n".format(
-        n['headline'], n['summary']) for n in news if n['date'][:8] <= end_date.replace('-', '') and \
-        not n['summary'].startswith("Looking for stock market analysis and research with proves results?")]
+    news = _row_news(symbol, row, start_date, end_date, news_store)
 
     basics = json.loads(row['Basics'])
     if basics:
@@ -55,7 +64,7 @@ def get_prompt_by_row(symbol, row):
     return head, news, basics
 
 
-def get_crypto_prompt_by_row(symbol, row):
+def get_crypto_prompt_by_row(symbol, row, news_store=None):
 
     start_date = row['Start Date'] if isinstance(row['Start Date'], str) else row['Start Date'].strftime('%Y-%m-%d')
     end_date = row['End Date'] if isinstance(row['End Date'], str) else row['End Date'].strftime('%Y-%m-%d')
@@ -63,10 +72,7 @@ def get_crypto_prompt_by_row(symbol, row):
     head = "From {} to {}, {}'s stock price {} from {:.2f} to {:.2f}. News during this period are listed below:\n\n".format(
         start_date, end_date, symbol, term, row['Start Price'], row['End Price'])
     
-    news = json.loads(row["News"])
-    news = ["[Headline]: {}\n[Summary]: {}\n".format(
-        n['headline'], n['summary']) for n in news if n['date'][:8] <= end_date.replace('-', '') and \
-        not n['summary'].startswith("Looking for stock market analysis and research with proves results?")]
+    news = _row_news(symbol, row, start_date, end_date, news_store)
 
     return head, news, None
 
@@ -100,63 +106,17 @@ PROMPT_END = {
         "Then let's assume your prediction for next week ({start_date} to {end_date}) is {prediction}. Provide a summary analysis to support your prediction. The prediction result need to be inferred from your analysis at the end, and thus not appearing as a foundational factor of your analysis."
 }
 
-def get_all_prompts(symbol, data_dir, start_date, end_date, min_past_weeks=1, max_past_weeks=3, with_basics=True):
-
-    
-    if with_basics:
-        df = pd.read_csv(f'{data_dir}/{symbol}_{start_date}_{end_date}.csv')
-    else:
-        df = pd.read_csv(f'{data_dir}/{symbol}_{start_date}_{end_date}_nobasics.csv')
-    
-    if symbol in CRYPTO:
-        info_prompt = get_crypto_prompt(symbol)
-    else:
-        info_prompt = get_company_prompt(symbol)
-
-    prev_rows = []
-    all_prompts = []
-
-    for row_idx, row in df.iterrows():
-
-        prompt = ""
-        if len(prev_rows) >= min_past_weeks:
-            idx = min(random.choice(range(min_past_weeks, max_past_weeks+1)), len(prev_rows))
-            for i in range(-idx, 0):
-                # Add Price Movement (Head)
-                prompt += "\n" + prev_rows[i][0]
-                # Add News of previous weeks
-                sampled_news = sample_news(
-                    prev_rows[i][1],
-                    min(5, len(prev_rows[i][1]))
-                )
-                if sampled_news:
-                    prompt += "\n".join(sampled_news)
-                else:
-                    prompt += "No relative news reported."
-
-        if symbol in CRYPTO:
-            head, news, basics = get_crypto_prompt_by_row(symbol, row)
-        else:
-            head, news, basics = get_prompt_by_row(symbol, row)
-
-        prev_rows.append((head, news, basics))
-        if len(prev_rows) > max_past_weeks:
-            prev_rows.pop(0)  
-
-        if not prompt:
-            continue
-
-        prediction = map_bin_label(row['Bin Label'])
-        
-        prompt = info_prompt + '\n' + prompt + '\n' + basics
-
-        prompt += PROMPT_END['crypto' if symbol in CRYPTO else 'company'].format(
-            start_date=row['Start Date'],
-            end_date=row['End Date'],
-            prediction=prediction,
-            symbol=symbol
-        )
-
-        all_prompts.append(prompt.strip())
-    
-    return all_prompts
\ No newline at end of file
+def get_all_prompts(symbol, data_dir, start_date, end_date, min_past_weeks=1, max_past_weeks=3, with_basics=True, seed=None,
+                    max_tokens=None, tokenizer=None):
+    """
+    Prompts for every week of a symbol's CSV. The CSV is parsed once into a
+    cached columnar table (see prompt_builder); sampling uses the global random
+    state, or a private random.Random(seed) when a seed is given. With
+    max_tokens the lowest-priority news is shortened or dropped until each
+    prompt fits (see prompt_budget).
+    """
+    from prompt_builder import build_prompts
+
+    rng = random if seed is None else random.Random(seed)
+    return build_prompts(symbol, data_dir, start_date, end_date, min_past_weeks, max_past_weeks,
+                         with_basics=with_basics, rng=rng, max_tokens=max_tokens, tokenizer=tokenizer)
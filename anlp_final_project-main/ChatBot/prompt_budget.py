@@ -0,0 +1,218 @@
+"""
+Token-budgeted assembly of forecaster prompts.
+
+A prompt is split into sections, each measured in tokens with the loaded
+tokenizer. Required sections (system/task instructions, company
+introduction, weekly price heads, the question) are always kept. When the
+total exceeds the budget, news items are shortened to their headline and
+then dropped, lowest priority first: older weeks before newer ones, items
+that do not mention the company before items that do, earlier items of a
+week before later ones. Basic financials go after the last news item.
+
+    # Tokens saved on the forecaster slice of combined_financial_dataset.json
+    python prompt_budget.py --budgets 512 1024 1536 --tokenizer mistralai/Mistral-7B-Instruct-v0.2
+    # Also time the prefill of the original and the fitted prompts
+    python prompt_budget.py --prefill --limit 20 --model-name standin
+"""
+import re
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+from symbols import SYMBOL_INDEX
+
+DATA_DIR = Path(__file__).parent / "data"
+
+NEWS_ITEM_RE = re.compile(r"\[Headline\]: [^\n]*\n\[Summary\]: [^\n]*\n")
+WEEK_HEAD_RE = re.compile(r"From \S+ to \S+, (\S+)'s stock price (?:increased|decreased)")
+TICKER_RE = re.compile(r"trading under the ticker (\S+)")
+BASICS_RE = re.compile(r"(?:Some recent basic financials of |\[Basic Financials\]:).*?(?=\n\nBased on |\Z)", re.S)
+
+# Basics outrank every news item: they are the last optional section dropped
+BASICS_PRIORITY = (float("inf"),)
+
+
+class Section:
+    """
+    A piece of prompt text. priority None means the section is always kept;
+    short is the shortened form tried before dropping it.
+    """
+
+    def __init__(self, text: str, priority=None, short: str = None):
+        self.text = text
+        self.priority = priority
+        self.short = short
+
+
+def token_counter(tokenizer=None):
+    """texts -> token counts; ~4 characters per token without a tokenizer."""
+    if tokenizer is None:
+        return lambda texts: [(len(t) + 3) // 4 for t in texts]
+
+    def count(texts):
+        texts = list(texts)
+        # Fast tokenizers reject an empty batch
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]] if texts else []
+    return count
+
+
+def special_tokens(tokenizer) -> int:
+    """
+    Tokens the tokenizer adds to every encoded prompt (e.g. BOS). token_counter
+    leaves them out, so subtract them from a budget the engine enforces.
+    """
+    return len(tokenizer("")["input_ids"])
+
+
+def split_prompt(prompt: str, symbol: str = None) -> list:
+    """
+    Sections of a forecaster prompt in the prompt.py / prompt_builder format
+    (also the format of the forecaster rows in combined_financial_dataset.json).
+    """
+    if symbol is None:
+        match = TICKER_RE.search(prompt) or WEEK_HEAD_RE.search(prompt)
+        symbol = match.group(1).rstrip(".") if match else None
+
+    cuts = []  # (start, end, section)
+    week = 0
+    heads = [m.start() for m in WEEK_HEAD_RE.finditer(prompt)]
+    for position, m in enumerate(NEWS_ITEM_RE.finditer(prompt)):
+        while week < len(heads) and heads[week] < m.start():
+            week += 1
+        text = m.group(0)
+        relevant = symbol is not None and symbol in SYMBOL_INDEX.extract(text)
+        short = text[:text.index("\n") + 1]
+        cuts.append((m.start(), m.end(), Section(text, (week, relevant, position), short)))
+    basics = BASICS_RE.search(prompt)
+    if basics and basics.group(0).strip():
+        cuts.append((basics.start(), basics.end(), Section(basics.group(0), BASICS_PRIORITY)))
+    cuts.sort(key=lambda cut: cut[0])
+
+    sections = []
+    last = 0
+    for start, end, section in cuts:
+        if start > last:
+            sections.append(Section(prompt[last:start]))
+        sections.append(section)
+        last = end
+    if last < len(prompt):
+        sections.append(Section(prompt[last:]))
+    return sections
+
+
+def fit_sections(sections: list, budget: int, count_tokens) -> tuple:
+    """
+    (text, stats) with the optional sections shortened or dropped until the
+    joined text is at most budget tokens. stats: tokens_before, tokens,
+    shortened, dropped. If the required sections alone exceed the budget the
+    result is still over it (the engine then cuts the prompt's start).
+    """
+    full = "".join(s.text for s in sections)
+    total = count_tokens([full])[0]
+    stats = {"tokens_before": total, "tokens": total, "shortened": 0, "dropped": 0}
+    if total <= budget:
+        return full, stats
+
+    optional = sorted((i for i, s in enumerate(sections) if s.priority is not None),
+                      key=lambda i: sections[i].priority)
+    sizes = count_tokens([s.text for s in sections])
+    short_sizes = dict(zip(
+        [i for i in optional if sections[i].short is not None],
+        count_tokens([sections[i].short for i in optional if sections[i].short is not None])
+    ))
+    kept = {i: sections[i].text for i in range(len(sections))}
+
+    # Section-wise counts can differ from the joined count by a few tokens at
+    # the boundaries, so re-measure after each pass and go on if still over
+    moves = [(i, sections[i].short, short_sizes[i]) for i in optional if i in short_sizes]
+    moves += [(i, "", 0) for i in optional]
+    step = 0
+    while total > budget and step < len(moves):
+        excess = total - budget
+        while excess > 0 and step < len(moves):
+            i, text, size = moves[step]
+            excess -= sizes[i] - size
+            sizes[i] = size
+            kept[i] = text
+            step += 1
+        total = count_tokens(["".join(kept[i] for i in range(len(sections)))])[0]
+    stats["tokens"] = total
+    stats["shortened"] = sum(1 for i in short_sizes if kept[i] == sections[i].short)
+    stats["dropped"] = sum(1 for i in optional if kept[i] == "")
+    return "".join(kept[i] for i in range(len(sections))), stats
+
+
+def fit_prompt(prompt: str, budget: int, count_tokens, symbol: str = None) -> tuple:
+    """fit_sections(split_prompt(prompt, symbol), budget, count_tokens)"""
+    return fit_sections(split_prompt(prompt, symbol), budget, count_tokens)
+
+
+def forecaster_rows(path=DATA_DIR / "combined_financial_dataset.json") -> list:
+    """Prompts of the forecaster rows (news + basics -> prediction) of the combined dataset."""
+    with open(path, "r") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [row["input"] for row in rows if "[Positive Developments]" in row["output"]]
+
+
+def _prefill_ms(model, tokenizer, prompt: str, repeats: int) -> float:
+    import torch
+
+    input_ids = tokenizer(prompt, return_tensors="pt")["input_ids"].to(model.device)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with torch.no_grad():
+            model(input_ids=input_ids, use_cache=True)
+        times.append(time.perf_counter() - start)
+    return 1000 * statistics.median(times)
+
+
+def report(prompts: list, budgets: list, count_tokens, prefill=None):
+    print(f"{'budget':>7}{'prompts':>9}{'fitted':>8}{'tokens before':>15}{'after':>9}{'saved':>8}"
+          f"{'shortened':>11}{'dropped':>9}{'prefill ms':>13}{'saved':>8}")
+    for budget in budgets:
+        results = [fit_prompt(p, budget, count_tokens) for p in prompts]
+        before = sum(s["tokens_before"] for _, s in results)
+        after = sum(s["tokens"] for _, s in results)
+        fitted = sum(s["tokens_before"] > budget for _, s in results)
+        line = (f"{budget:>7}{len(prompts):>9}{fitted:>8}{before:>15}{after:>9}{1 - after / before:>8.1%}"
+                f"{sum(s['shortened'] for _, s in results):>11}{sum(s['dropped'] for _, s in results):>9}")
+        if prefill is not None:
+            ms_before = sum(prefill(p) for p in prompts)
+            ms_after = sum(prefill(text) for text, _ in results)
+            line += f"{ms_before:>7.0f}->{ms_after:<5.0f}{1 - ms_after / ms_before:>8.1%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    from model_loader import add_model_arguments, configure_from_args
+    from model_registry import REGISTRY
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budgets", type=int, nargs="+", default=[512, 768, 1024, 1536, 2048])
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help="HF tokenizer to count with (default: the configured model's, with --prefill)")
+    parser.add_argument("--prefill", action="store_true", help="Time the prefill forward pass of every prompt")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N forecaster rows")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    prompts = forecaster_rows()[:args.limit]
+    tokenizer = None
+    prefill = None
+    if args.prefill:
+        configure_from_args(args)
+        model, tokenizer = REGISTRY.get("forecaster")
+        prefill = lambda prompt: _prefill_ms(model, tokenizer, prompt, args.repeats)
+    elif args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    else:
+        try:
+            from standin import build_standin_tokenizer
+            tokenizer = build_standin_tokenizer()
+        except ImportError:
+            print("[Prompt Budget] tokenizers not installed, estimating 4 characters per token")
+    report(prompts, args.budgets, token_counter(tokenizer), prefill)
@@ -0,0 +1,220 @@
+import os
+import json
+import random
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from indices import CRYPTO
+from profiles import PROFILE_PROVIDER
+from prompt import get_company_prompt, get_crypto_prompt, map_bin_label, PROMPT_END
+from prompt_budget import fit_prompt, token_counter
+from news_store import NEWS_STORE, week_articles
+
+
+def symbol_csv_path(symbol, data_dir, start_date, end_date, with_basics=True):
+    suffix = "" if with_basics else "_nobasics"
+    return f'{data_dir}/{symbol}_{start_date}_{end_date}{suffix}.csv'
+
+
+def _format_basics(symbol, raw):
+    basics = json.loads(raw)
+    if basics:
+        return "Some recent basic financials of {}, reported at {}, are presented below:\n\n[Basic Financials]:\n\n".format(
+            symbol, basics['period']) + "\n".join(f"{k}: {v}" for k, v in basics.items() if k != 'period')
+    return "[Basic Financials]:\n\nNo basic financial reported."
+
+
+def parse_symbol_csv(symbol, csv_path, news_store=None):
+    """
+    Parse a symbol's weekly CSV once into columnar form: one row table (dates,
+    price head, basics, label and the [start, stop) slice of its news) and one
+    flat table of already formatted and filtered news items. Symbols ingested
+    into the news store take their news from it and the News column is not
+    read at all (unless a week is missing from the store).
+    """
+    news_store = news_store or NEWS_STORE
+    stored = news_store is not None and symbol in news_store
+    df = pd.read_csv(csv_path, usecols=lambda column: column != 'News') if stored else pd.read_csv(csv_path)
+    start = df['Start Date'].astype(str)
+    end = df['End Date'].astype(str)
+    term = (df['End Price'] > df['Start Price']).map({True: 'increased', False: 'decreased'})
+    heads = [
+        "From {} to {}, {}'s stock price {} from {:.2f} to {:.2f}. News during this period are listed below:\n\n".format(
+            s, e, symbol, t, sp, ep)
+        for s, e, t, sp, ep in zip(start, end, term, df['Start Price'], df['End Price'])
+    ]
+
+    if stored:
+        weeks = [news_store.week(symbol, s, e) for s, e in zip(start, end)]
+        if any(week is None for week in weeks):
+            raw_news = pd.read_csv(csv_path, usecols=['News'])['News']
+            weeks = [week if week is not None else week_articles(raw, e)
+                     for week, raw, e in zip(weeks, raw_news, end)]
+    else:
+        weeks = (week_articles(raw, e) for raw, e in zip(df['News'], end))
+
+    news_text, news_start, news_stop = [], [], []
+    for week in weeks:
+        news_start.append(len(news_text))
+        news_text.extend(week)
+        news_stop.append(len(news_text))
+
+    if symbol in CRYPTO:
+        basics = [None] * len(df)
+    else:
+        basics = [_format_basics(symbol, raw) for raw in df['Basics']]
+
+    rows = pd.DataFrame({
+        "start_date": start,
+        "end_date": end,
+        "head": heads,
+        "basics": basics,
+        "bin_label": df['Bin Label'].astype(str),
+        "news_start": news_start,
+        "news_stop": news_stop,
+    })
+    return rows, pd.DataFrame({"text": news_text})
+
+
+def load_symbol_table(symbol, csv_path, use_cache=True, news_store=None):
+    """
+    parse_symbol_csv with the result cached as Parquet next to the CSV. The
+    cache is rebuilt whenever the CSV is newer, and is kept apart per news
+    source: one for the CSV's News column, one per build of the news store.
+    Without pyarrow/fastparquet the CSV is simply parsed every time.
+    """
+    news_store = news_store or NEWS_STORE
+    source = f"store-{news_store.version()}" if news_store is not None and symbol in news_store else "csv"
+    rows_path, news_path = f"{csv_path}.{source}.rows.parquet", f"{csv_path}.{source}.news.parquet"
+    if use_cache and os.path.exists(news_path) and os.path.getmtime(news_path) >= os.path.getmtime(csv_path):
+        try:
+            return pd.read_parquet(rows_path), pd.read_parquet(news_path)
+        except (ImportError, OSError, ValueError):
+            pass
+
+    rows, news = parse_symbol_csv(symbol, csv_path, news_store)
+    if use_cache:
+        try:
+            rows.to_parquet(rows_path, index=False)
+            news.to_parquet(news_path, index=False)
+        except ImportError:
+            pass
+    return rows, news
+
+
+def assemble_prompts(symbol, rows, news, info_prompt, rng, min_past_weeks=1, max_past_weeks=3):
+    """
+    Build the training prompts of one symbol from its columnar table.
+
+    rng is anything with choice() and sample() (the random module or a
+    random.Random); it is consumed in exactly the same order as the original
+    row loop, so the same seed gives the same prompts.
+    """
+    texts = news["text"].tolist()
+    end_template = PROMPT_END['crypto' if symbol in CRYPTO else 'company']
+    prev_rows = deque(maxlen=max_past_weeks)
+    all_prompts = []
+
+    for start_date, end_date, head, basics, bin_label, lo, hi in zip(
+            rows["start_date"], rows["end_date"], rows["head"], rows["basics"],
+            rows["bin_label"], rows["news_start"], rows["news_stop"]):
+
+        prompt = ""
+        if len(prev_rows) >= min_past_weeks:
+            idx = min(rng.choice(range(min_past_weeks, max_past_weeks + 1)), len(prev_rows))
+            for prev_head, prev_news in list(prev_rows)[len(prev_rows) - idx:]:
+                # Add Price Movement (Head) and sampled News of previous weeks
+                prompt += "\n" + prev_head
+                k = min(5, len(prev_news))
+                sampled_news = [prev_news[i] for i in sorted(rng.sample(range(len(prev_news)), k))]
+                if sampled_news:
+                    prompt += "\n".join(sampled_news)
+                else:
+                    prompt += "No relative news reported."
+
+        prev_rows.append((head, texts[lo:hi]))
+
+        if not prompt:
+            continue
+
+        prompt = info_prompt + '\n' + prompt
+        if basics is not None:
+            prompt += '\n' + basics
+
+        prompt += end_template.format(
+            start_date=start_date,
+            end_date=end_date,
+            prediction=map_bin_label(bin_label),
+            symbol=symbol
+        )
+        all_prompts.append(prompt.strip())
+
+    return all_prompts
+
+
+def build_prompts(symbol, data_dir, start_date, end_date, min_past_weeks=1, max_past_weeks=3,
+                  with_basics=True, rng=None, seed=None, use_cache=True, max_tokens=None, tokenizer=None):
+    """
+    assemble_prompts for one symbol's CSV. With max_tokens every prompt is fitted
+    to that many tokens of tokenizer (see prompt_budget), dropping news first.
+    """
+    if rng is None:
+        rng = random.Random(seed)
+    rows, news = load_symbol_table(symbol, symbol_csv_path(symbol, data_dir, start_date, end_date, with_basics),
+                                   use_cache=use_cache)
+    info_prompt = get_crypto_prompt(symbol) if symbol in CRYPTO else get_company_prompt(symbol)
+    prompts = assemble_prompts(symbol, rows, news, info_prompt, rng, min_past_weeks, max_past_weeks)
+    if max_tokens is not None:
+        count_tokens = token_counter(tokenizer)
+        prompts = [fit_prompt(p, max_tokens, count_tokens, symbol)[0] for p in prompts]
+    return prompts
+
+
+def _build_symbol(job):
+    symbol, args, kwargs = job
+    return symbol, build_prompts(symbol, *args, **kwargs)
+
+
+def build_all_prompts(symbols, data_dir, start_date, end_date, seed=0, workers=None, **kwargs):
+    """
+    Build prompts for many symbols across a process pool. Every symbol gets its
+    own random.Random(seed), so each result equals
+    random.seed(seed); get_all_prompts(symbol, ...) run on its own.
+    """
+    # Fetch company profiles once here so workers read them from the on-disk store
+    PROFILE_PROVIDER.prefetch([s for s in symbols if s not in CRYPTO])
+
+    jobs = [(symbol, (data_dir, start_date, end_date), dict(kwargs, seed=seed)) for symbol in symbols]
+    if workers == 1:
+        return dict(map(_build_symbol, jobs))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_build_symbol, jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--start-date", required=True)
+    parser.add_argument("--end-date", required=True)
+    parser.add_argument("--symbols", nargs="+", required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", type=str, default="prompts.jsonl")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Fit every prompt to this many tokens")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help="HF tokenizer for --max-tokens (default: ~4 characters per token)")
+    args = parser.parse_args()
+
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    prompts = build_all_prompts(args.symbols, args.data_dir, args.start_date, args.end_date,
+                                seed=args.seed, workers=args.workers, max_tokens=args.max_tokens,
+                                tokenizer=tokenizer)
+    with open(args.out, "w") as f:
+        for symbol in args.symbols:
+            for p in prompts[symbol]:
+                f.write(json.dumps({"symbol": symbol, "prompt": p}, ensure_ascii=False) + "\n")
+    print(f"Wrote {sum(len(p) for p in prompts.values())} prompts to {args.out}")
@@ -0,0 +1,319 @@
+"""
+Record/replay model backend.
+
+ReplayModel stands in for the LLM wherever model.generate() is called and
+serves recorded completions keyed by prompt text; RecordingModel wraps the
+real model and records every generate() call. Everything around the model
+(routing, symbol extraction, parsing, output writing, evaluation) then runs
+for real, without a GPU.
+
+Recordings are JSONL. Two kinds of lines are understood:
+  {"prompt": ..., "completion": ...}              written by RecordingModel
+  {"input": ..., "routed_module": ..., "pipeline_output": ...}
+                                                   pipeline_outputs_*.jsonl; the
+                                                   router and module prompts are
+                                                   rebuilt from the input
+
+    # Replay a saved run through the current pipeline and report drift
+    python replay.py --replay data/pipeline_outputs_mistral.jsonl \\
+        --file data/finchatbot_300_dataset.jsonl --out replayed.jsonl
+    # Load test: 5000 pipeline requests against the replay backend
+    python replay.py --replay data/pipeline_outputs_mistral.jsonl \\
+        --file data/finchatbot_300_dataset.jsonl --load 5000
+    # Record a new session with the real model
+    python replay.py --record session.jsonl --file data/finchatbot_300_dataset.jsonl --out outputs.jsonl
+"""
+import time
+import hashlib
+import argparse
+from types import SimpleNamespace
+from model_loader import HANDLE, add_model_arguments, configure_from_args
+from gen_cache import GENERATION_CACHE
+from route_cache import ROUTE_CACHE
+from model_registry import REGISTRY
+from prefix_cache import PREFIX_CACHE
+from jsonl_io import iter_jsonl, JsonlAppender
+from pipeline import ROUTER_LABELS, build_router_prompt, extract_symbol_from_question
+
+REPLAY_MODEL_NAME = "replay"
+
+
+def prompt_key(text: str) -> str:
+    """Whitespace-insensitive key, so tokenizer round trips that respace text still hit."""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class ReplayStore:
+    """prompt -> completion, plus the recorded final output of every input."""
+
+    def __init__(self):
+        self.completions = {}
+        self.outputs = {}
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.completions)
+
+    def add(self, prompt: str, completion: str):
+        self.completions[prompt_key(prompt)] = completion
+
+    def get(self, prompt: str):
+        return self.completions.get(prompt_key(prompt))
+
+    def load(self, path: str):
+        for _, item in iter_jsonl(path):
+            if "prompt" in item and "completion" in item:
+                self.add(item["prompt"], item["completion"])
+            elif "pipeline_output" in item:
+                self.add_pipeline_record(item)
+        return self
+
+    def add_pipeline_record(self, item: dict):
+        """
+        Rebuild the prompts one pipeline_outputs record went through and the
+        completions that make the current code reproduce its output.
+        """
+        from finqa import build_finqa_prompt
+        from finred import build_finred_prompt, parse_finred_output
+        from forecaster import build_forecast_prompt
+
+        question, module, output = item["input"], item["routed_module"], item["pipeline_output"]
+        if module not in ROUTER_LABELS:
+            self.skipped += 1
+            return
+        self.outputs[question] = output
+        self.add(build_router_prompt(question), " " + module)
+
+        if module == "FinQA":
+            prompt = build_finqa_prompt(question) + "\n"
+            if output.startswith(prompt):
+                completion = output[len(prompt):]
+            elif output.startswith(prompt.rstrip()):
+                completion = output[len(prompt.rstrip()):].lstrip("\n")
+            else:
+                completion = output
+        elif module == "FinRED":
+            prompt = build_finred_prompt(question)
+            # Older runs parsed the whole decode, so the prompt's example relations lead the output
+            echoed = "; ".join(f"{r[0]}: {r[1]}, {r[2]}" for r in parse_finred_output(prompt, question))
+            if output == "[No valid relation extracted]":
+                completion = "\nNone"
+            elif output == echoed:
+                completion = ""
+            elif output.startswith(echoed + "; "):
+                completion = "\n" + output[len(echoed) + 2:].replace("; ", "\n")
+            else:
+                completion = "\n" + output.replace("; ", "\n")
+        else:
+            try:
+                prompt = build_forecast_prompt(question, extract_symbol_from_question(question), fit=False)
+            except (KeyError, ValueError):
+                # No profile for the symbol (e.g. offline without a fixture entry)
+                self.skipped += 1
+                return
+            completion = " " + output
+        self.add(prompt, completion)
+
+
+class ReplayModel:
+    """
+    Minimal causal-LM stand-in serving ReplayStore completions from generate().
+    Forward passes (prefix cache prefill, scoring router) are not supported.
+    """
+
+    def __init__(self, tokenizer, store: ReplayStore, strict: bool = False, max_position_embeddings: int = 4096):
+        self.tokenizer = tokenizer
+        self.store = store
+        self.strict = strict
+        self.config = SimpleNamespace(max_position_embeddings=max_position_embeddings,
+                                      _name_or_path=REPLAY_MODEL_NAME)
+        self.device = "cpu"
+        self.hits = 0
+        self.misses = 0
+
+    def eval(self):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        raise NotImplementedError("ReplayModel only serves generate(); use the generate router")
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens: int = 20,
+                 eos_token_id=None, pad_token_id=None, **kwargs):
+        import torch
+
+        eos_token_id = self.tokenizer.eos_token_id if eos_token_id is None else eos_token_id
+        pad_token_id = self.tokenizer.pad_token_id if pad_token_id is None else pad_token_id
+
+        new_rows = []
+        for row in input_ids.tolist():
+            prompt = self.tokenizer.decode(row, skip_special_tokens=True)
+            completion = self.store.get(prompt)
+            if completion is None:
+                self.misses += 1
+                if self.strict:
+                    raise KeyError(f"No recorded completion for prompt ending {prompt[-80:]!r}")
+                completion = ""
+            else:
+                self.hits += 1
+            # Not cut at max_new_tokens: the recording already obeyed the original model's limit
+            ids = self.tokenizer(completion, add_special_tokens=False)["input_ids"]
+            if eos_token_id is not None:
+                ids.append(eos_token_id)
+            new_rows.append(ids)
+
+        width = max(len(ids) for ids in new_rows)
+        padded = [ids + [pad_token_id] * (width - len(ids)) for ids in new_rows]
+        new_ids = torch.tensor(padded, dtype=input_ids.dtype, device=input_ids.device).reshape(len(padded), width)
+        streamer = kwargs.get("streamer")
+        if streamer is not None:
+            streamer.put(input_ids)
+            for column in new_ids.T:
+                streamer.put(column)
+            streamer.end()
+        return torch.cat([input_ids, new_ids], dim=1)
+
+
+class RecordingModel:
+    """Wraps a model and appends {"prompt", "completion"} for every generated row."""
+
+    def __init__(self, model, tokenizer, path: str, fsync_every: int = 10):
+        self._model = model
+        self._tokenizer = tokenizer
+        self._out = JsonlAppender(path, fsync_every=fsync_every).__enter__()
+        self.recorded = 0
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def __call__(self, *args, **kwargs):
+        return self._model(*args, **kwargs)
+
+    def generate(self, *args, **kwargs):
+        output_ids = self._model.generate(*args, **kwargs)
+        input_ids = kwargs["input_ids"] if "input_ids" in kwargs else args[0]
+        prompt_len = input_ids.shape[1]
+        for prompt_ids, full_ids in zip(input_ids, output_ids):
+            prompt = self._tokenizer.decode(prompt_ids, skip_special_tokens=True)
+            full = self._tokenizer.decode(full_ids, skip_special_tokens=True)
+            if full.startswith(prompt):
+                completion = full[len(prompt):]
+            else:
+                completion = self._tokenizer.decode(full_ids[prompt_len:], skip_special_tokens=True)
+            self._out.write({"prompt": prompt, "completion": completion})
+            self.recorded += 1
+        return output_ids
+
+    def close(self):
+        self._out.__exit__(None, None, None)
+
+
+def use_replay(store: ReplayStore, tokenizer=None, strict: bool = False) -> ReplayModel:
+    """
+    Install a ReplayModel as the shared model. Without a tokenizer the
+    offline stand-in tokenizer is used. The prefix cache (which needs forward
+    passes), the generation cache and the route cache (which would hide the
+    replay) are turned off, and every stage uses the replay (no model registry).
+    """
+    if tokenizer is None:
+        from standin import build_standin_tokenizer
+        tokenizer = build_standin_tokenizer()
+    replay = ReplayModel(tokenizer, store, strict=strict)
+    HANDLE.set(replay, tokenizer, model_name=REPLAY_MODEL_NAME)
+    REGISTRY.enabled = False
+    PREFIX_CACHE.enabled = False
+    GENERATION_CACHE.bypass = True
+    ROUTE_CACHE.enabled = False
+    return replay
+
+
+def use_recording(path: str) -> RecordingModel:
+    """
+    Wrap the configured model so every generate() call is recorded to path.
+    Only HANDLE's model is wrapped, so the model registry is turned off.
+    """
+    model, tokenizer = HANDLE.get()
+    recorder = RecordingModel(model, tokenizer, path)
+    HANDLE.set(recorder, tokenizer)
+    REGISTRY.enabled = False
+    GENERATION_CACHE.bypass = True
+    ROUTE_CACHE.enabled = False
+    return recorder
+
+
+def report_drift(store: ReplayStore, out_path: str):
+    """Compare replayed outputs with the recorded ones, input by input."""
+    same = differ = 0
+    for _, record in iter_jsonl(out_path):
+        recorded = store.outputs.get(record["input"])
+        if recorded is None:
+            continue
+        if recorded == record["pipeline_output"]:
+            same += 1
+        else:
+            differ += 1
+    print(f"[Replay] outputs identical to the recording: {same}/{same + differ}")
+
+
+def load_test(questions: list, n: int, batch_size: int):
+    from pipeline import run_pipeline, run_pipeline_batch
+
+    start = time.perf_counter()
+    done = 0
+    while done < n:
+        if batch_size > 1:
+            chunk = [questions[(done + i) % len(questions)] for i in range(min(batch_size, n - done))]
+            run_pipeline_batch(chunk, batch_size=batch_size)
+            done += len(chunk)
+        else:
+            run_pipeline(questions[done % len(questions)])
+            done += 1
+    elapsed = time.perf_counter() - start
+    print(f"[Replay] {n} requests in {elapsed:.2f}s ({n / elapsed:.0f} req/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", action="append", default=[], metavar="FILE",
+                        help="Recording or pipeline_outputs JSONL to serve (repeatable)")
+    parser.add_argument("--record", type=str, metavar="FILE", help="Record every generation of the real model")
+    parser.add_argument("--file", type=str, required=True, help="Dataset JSONL to run")
+    parser.add_argument("--out", type=str, default=None, help="Pipeline output JSONL (batch_run_from_file)")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--load", type=int, default=None, metavar="N", help="Send N requests and report req/s")
+    parser.add_argument("--strict", action="store_true", help="Fail on prompts without a recording")
+    parser.add_argument("--live-profiles", action="store_true", help="Fetch company profiles from Finnhub")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    if not args.live_profiles:
+        from gen_cache import CACHE_DIR
+        from profiles import PROFILE_PROVIDER, FixtureBackend
+        PROFILE_PROVIDER.backend = FixtureBackend()
+        PROFILE_PROVIDER.store_path = CACHE_DIR / "company_profiles_fixture.json"
+
+    from pipeline import batch_run_from_file
+
+    recorder = replay = store = None
+    if args.record:
+        configure_from_args(args)
+        recorder = use_recording(args.record)
+    else:
+        store = ReplayStore()
+        for path in args.replay:
+            store.load(path)
+        print(f"[Replay] {len(store)} recorded prompts ({store.skipped} records skipped)")
+        replay = use_replay(store, strict=args.strict)
+
+    if args.load:
+        load_test([item["input"] for _, item in iter_jsonl(args.file)], args.load, args.batch_size)
+    else:
+        out = args.out or "replayed_outputs.jsonl"
+        batch_run_from_file(args.file, save_path=out, batch_size=args.batch_size, resume=False)
+        if store is not None:
+            report_drift(store, out)
+
+    if replay is not None:
+        print(f"[Replay] generate rows served: {replay.hits} | missing: {replay.misses}")
+    if recorder is not None:
+        recorder.close()
+        print(f"[Record] {recorder.recorded} generations written to {args.record}")
@@ -0,0 +1,243 @@
+"""
+Semantic cache of routing decisions.
+
+Questions are embedded as L2-normalized hashed n-gram vectors (the
+intent classifier's features), with every ticker or company name masked,
+so "Will AAPL go up next week?" and "Will MSFT go up next week?" share
+one vector. A lookup returns the module of the most similar previously
+routed question when the cosine similarity reaches the threshold.
+Vectors are sparse and kept in an inverted index (bucket -> questions),
+so a lookup only scores entries that share a feature with the question.
+
+Entries are namespaced by who routed them (pipeline.route_batch uses the
+router model's identity and the router name), so a route chosen by one
+model or router is never served to another. The cache holds at most
+max_entries questions over all namespaces and evicts the least recently
+used. It is stored as JSON (CACHE_DIR/route_cache.json) and the vectors
+are rebuilt on load.
+
+    # Hit rate and routing accuracy on the bundled test sets
+    python route_cache.py --report
+"""
+import os
+import json
+import time
+import atexit
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from gen_cache import CACHE_DIR
+from intent_classifier import features, load_labeled, LABELS, DATA_DIR
+from symbols import SYMBOL_INDEX
+from metrics import METRICS
+
+
+def embed(question: str, buckets: int = 1 << 18) -> dict:
+    return features(" ".join(SYMBOL_INDEX.mask(question)), buckets)
+
+
+class RouteCache:
+    """question -> routed module, looked up by nearest neighbour."""
+
+    def __init__(self, path=None, threshold: float = 0.55, max_entries: int = 5000, enabled: bool = True,
+                 save_every: int = 32):
+        self.path = Path(path) if path else None
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (namespace, question) -> (vector, module), least recently used first
+        self._postings = {}            # (namespace, bucket) -> {question: weight}
+        self._unsaved = 0
+        self._loaded = False
+
+    def __len__(self):
+        self._load()
+        return len(self._entries)
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if self.path is not None and self.path.exists():
+            with open(self.path, "r") as f:
+                for item in json.load(f):
+                    # Entries from before namespacing have unknown origin: drop them
+                    if "namespace" in item:
+                        self._insert(item["namespace"], item["question"], item["module"])
+            self.evictions = 0
+        if self.path is not None:
+            atexit.register(self.save)
+
+    def save(self):
+        if self.path is None or not self._unsaved:
+            return
+        with self._lock:
+            records = [{"namespace": ns, "question": q, "module": module}
+                       for (ns, q), (_, module) in self._entries.items()]
+            self._unsaved = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(records, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _insert(self, namespace: str, question: str, module: str):
+        key = (namespace, question)
+        if key in self._entries:
+            self._remove(key)
+        vector = embed(question)
+        self._entries[key] = (vector, module)
+        for bucket, weight in vector.items():
+            self._postings.setdefault((namespace, bucket), {})[question] = weight
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: tuple):
+        vector, _ = self._entries.pop(key)
+        namespace, question = key
+        for bucket in vector:
+            postings = self._postings[(namespace, bucket)]
+            del postings[question]
+            if not postings:
+                del self._postings[(namespace, bucket)]
+
+    def nearest(self, question: str, namespace: str = ""):
+        """(most similar cached question of namespace, similarity), or (None, 0.0) when nothing shares a feature."""
+        scores = {}
+        for bucket, weight in embed(question).items():
+            for other, other_weight in self._postings.get((namespace, bucket), {}).items():
+                scores[other] = scores.get(other, 0.0) + weight * other_weight
+        if not scores:
+            return None, 0.0
+        best = max(scores, key=scores.get)
+        return best, scores[best]
+
+    def lookup(self, questions: list, namespace: str = "") -> list:
+        """Cached module per question, or None for a miss."""
+        self._load()
+        routes = []
+        with self._lock:
+            for question in questions:
+                best, similarity = self.nearest(question, namespace)
+                if best is not None and similarity >= self.threshold:
+                    self._entries.move_to_end((namespace, best))
+                    routes.append(self._entries[(namespace, best)][1])
+                else:
+                    routes.append(None)
+            hits = sum(1 for r in routes if r is not None)
+            self.hits += hits
+            self.misses += len(routes) - hits
+        METRICS.add(route_cache_hits=hits, route_cache_misses=len(routes) - hits)
+        return routes
+
+    def add(self, questions: list, modules: list, namespace: str = ""):
+        self._load()
+        with self._lock:
+            for question, module in zip(questions, modules):
+                if module in LABELS:
+                    self._insert(namespace, question, module)
+                    self._unsaved += 1
+            flush = self._unsaved >= self.save_every
+        if flush:
+            self.save()
+
+    def route(self, questions: list, router_fn, namespace: str = "") -> list:
+        """
+        Routes for questions: cache hits of namespace first, router_fn over
+        the misses in one call (their routes are added under namespace).
+        """
+        routes = self.lookup(questions, namespace)
+        missing = [i for i, r in enumerate(routes) if r is None]
+        if missing:
+            routed = router_fn([questions[i] for i in missing])
+            for i, module in zip(missing, routed):
+                routes[i] = module
+            self.add([questions[i] for i in missing], routed, namespace)
+        return routes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._unsaved += 1
+
+    def report(self):
+        if not self.enabled:
+            return
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(f"[Route Cache] hits: {self.hits} | misses: {self.misses} | hit rate: {rate:.2%} | "
+              f"entries: {len(self._entries)} | evictions: {self.evictions}")
+
+
+ROUTE_CACHE = RouteCache(
+    path=os.getenv("FINBOT_ROUTE_CACHE_PATH", CACHE_DIR / "route_cache.json"),
+    threshold=float(os.getenv("FINBOT_ROUTE_CACHE_THRESHOLD", "0.55")),
+    max_entries=int(os.getenv("FINBOT_ROUTE_CACHE_MAX_ENTRIES", "5000")),
+    enabled=os.getenv("FINBOT_ROUTE_CACHE", "on").lower() not in ("off", "0", "false")
+)
+
+
+def simulate(stream: list, threshold: float, routed: list = None, warm: list = ()) -> dict:
+    """
+    Feed (question, gold module) pairs through a fresh in-memory cache in
+    order. routed[i] is what the router picks for stream[i] on a miss
+    (default: the gold module, i.e. a perfect router). warm pairs are put
+    in the cache first and not counted.
+    """
+    routed = routed or [gold for _, gold in stream]
+    cache = RouteCache(threshold=threshold, max_entries=len(stream) + len(warm))
+    cache.add([q for q, _ in warm], [m for _, m in warm])
+    changed = correct = correct_without = 0
+    start = time.perf_counter()
+    for (question, gold), module in zip(stream, routed):
+        route = cache.route([question], lambda qs: [module])[0]
+        changed += route != module
+        correct += route == gold
+        correct_without += module == gold
+    elapsed = time.perf_counter() - start
+    n = len(stream)
+    return {"hit_rate": cache.hits / n, "changed": changed, "accuracy": correct / n,
+            "accuracy_without": correct_without / n, "us_per_question": 1e6 * elapsed / n}
+
+
+def report(thresholds):
+    train = load_labeled(DATA_DIR / "finchatbot_300_dataset.jsonl")
+    tests = load_labeled(DATA_DIR / "clean_router_testset_60.jsonl") + \
+        load_labeled(DATA_DIR / "router_test_60_with_outputs.jsonl")
+    scenarios = [("test sets (120 distinct), cold", tests, None, ()),
+                 ("test sets, warmed with finchatbot_300", tests, None, train)]
+    # Recorded LLM router decisions, row by row: hits replace the router's own answer
+    for name in ["pipeline_outputs_mistral.jsonl", "pipeline_outputs_Hermes.jsonl"]:
+        with open(DATA_DIR / name, "r") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        rows = [row for row in rows if row.get("module") in LABELS]
+        scenarios.append((f"{name}, cold", [(r["input"], r["module"]) for r in rows],
+                          [r["routed_module"] for r in rows], ()))
+
+    print(f"{'threshold':<10}{'scenario':<44}{'hit rate':>9}{'changed':>8}{'accuracy':>10}{'no cache':>10}{'us':>6}")
+    for threshold in thresholds:
+        for name, stream, routed, warm in scenarios:
+            r = simulate(stream, threshold, routed, warm)
+            print(f"{threshold:<10}{name:<44}{r['hit_rate']:>9.1%}{r['changed']:>8}{r['accuracy']:>10.1%}"
+                  f"{r['accuracy_without']:>10.1%}{r['us_per_question']:>6.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--report", action="store_true", help="Simulate the cache on the bundled test sets")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--clear", action="store_true", help="Empty the persistent route cache")
+    args = parser.parse_args()
+    if args.clear:
+        ROUTE_CACHE.clear()
+        ROUTE_CACHE.save()
+    if args.report:
+        report(args.thresholds)
@@ -0,0 +1,341 @@
+"""
+Long-running HTTP/JSON service in front of the pipeline.
+
+Concurrent questions are queued per stage for a short window and run as
+micro-batches: routing first, then one batch per module. Every batch runs on
+a single model thread, so all stages share the one model from model_loader
+while the event loop keeps accepting requests.
+
+    python server.py --port 8080 --window-ms 20 --max-batch 8
+    curl -s localhost:8080/ask -d '{"question": "Who is the CEO of Apple?"}'
+    curl -s localhost:8080/metrics
+
+    # Load test a running server with 32 concurrent clients
+    python server.py --load http://localhost:8080 --file data/finchatbot_300_dataset.jsonl --concurrency 32
+
+Endpoints:
+  POST /ask      {"question": ...} -> {"routed_module": ..., "output": ...}
+  GET  /metrics  Prometheus text: pipeline spans plus server counters
+  GET  /health   {"status": "ok", "pending": ...}
+
+Requests beyond --max-pending are rejected with 503 (Retry-After: 1) and
+requests running longer than --timeout get 504.
+"""
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from model_loader import add_model_arguments, configure_from_args, preload
+from gen_cache import GENERATION_CACHE
+from route_cache import ROUTE_CACHE
+from metrics import METRICS, QUANTILES
+from profiles import PROFILE_PROVIDER
+from pipeline import ROUTERS, route_batch, extract_symbol_from_question
+from finqa import run_finqa_batch
+from finred import run_finred_batch
+from forecaster import run_forecaster_batch
+
+UNKNOWN_MODULE_ANSWER = "Sorry, I couldn't determine the right model to use."
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests and runs fn once per
+    batch on executor. A batch closes window seconds after its first item
+    or when it holds max_batch items. Items whose caller already gave up
+    (timeout) are dropped before the batch runs. If a batch fails, its items
+    are retried one at a time so a single bad item only fails itself.
+    """
+
+    def __init__(self, name: str, fn, executor, max_batch: int = 8, window: float = 0.02):
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.window = window
+        self.queue = None
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        return asyncio.ensure_future(self._run())
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return [(item, future) for item, future in batch if not future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.fn, items)
+            except Exception:
+                results = []
+                for item in items:
+                    try:
+                        results.append((await loop.run_in_executor(self.executor, self.fn, [item]))[0])
+                    except Exception as e:
+                        results.append(e)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class PipelineServer:
+    """
+    run_pipeline as a service: router and module micro-batchers on one
+    model thread, admission control, per-request timeouts and counters.
+    """
+
+    def __init__(self, router: str = "generate", max_batch: int = 8, window: float = 0.02,
+                 max_pending: int = 256, timeout: float = 120.0, latency_window: int = 10000):
+        self.router = router
+        self.max_batch = max_batch
+        self.window = window
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.counts = {"requests": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+        self.latencies = deque(maxlen=latency_window)
+        self.model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="io")
+        self.batchers = {}
+        self._tasks = []
+
+    def _batcher(self, name: str, fn) -> MicroBatcher:
+        return MicroBatcher(name, fn, self.model_executor, self.max_batch, self.window)
+
+    def start_batchers(self):
+        n = self.max_batch
+        self.batchers = {
+            "router": self._batcher("router", lambda questions: route_batch(questions, router=self.router)),
+            "FinQA": self._batcher("FinQA", lambda questions: run_finqa_batch(questions, batch_size=n)),
+            "FinRED": self._batcher("FinRED", lambda questions: run_finred_batch(questions, batch_size=n)),
+            "Forecaster": self._batcher("Forecaster", lambda items: run_forecaster_batch(
+                [q for q, _ in items], [s for _, s in items], batch_size=n)),
+        }
+        self._tasks = [batcher.start() for batcher in self.batchers.values()]
+
+    async def answer(self, question: str) -> dict:
+        module = await self.batchers["router"].submit(question)
+        if module == "Forecaster":
+            symbol = extract_symbol_from_question(question)
+            try:
+                # Fetch the profile on an I/O thread while the model thread serves other batches
+                await asyncio.get_running_loop().run_in_executor(self.io_executor, PROFILE_PROVIDER.get, symbol)
+            except Exception:
+                pass  # the forecaster batch retries the fetch and reports the error
+            output = await self.batchers["Forecaster"].submit((question, symbol))
+        elif module in self.batchers:
+            output = await self.batchers[module].submit(question)
+        else:
+            output = UNKNOWN_MODULE_ANSWER
+        return {"routed_module": module, "output": output}
+
+    async def ask(self, question: str):
+        """(HTTP status, response body) for one question."""
+        if self.pending >= self.max_pending:
+            self.counts["rejected"] += 1
+            return 503, {"error": "server busy, retry later"}
+        self.pending += 1
+        self.counts["requests"] += 1
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self.answer(question), self.timeout)
+        except asyncio.TimeoutError:
+            self.counts["timeouts"] += 1
+            return 504, {"error": f"timed out after {self.timeout:.0f}s"}
+        except Exception as e:
+            self.counts["errors"] += 1
+            return 500, {"error": str(e)}
+        finally:
+            self.pending -= 1
+        self.latencies.append(time.perf_counter() - start)
+        return 200, response
+
+    def prometheus(self, prefix: str = "finbot") -> str:
+        lines = [METRICS.prometheus(prefix).rstrip("\n")]
+        for key, value in self.counts.items():
+            lines.append(f"# TYPE {prefix}_server_{key}_total counter")
+            lines.append(f"{prefix}_server_{key}_total {value}")
+        lines.append(f"# TYPE {prefix}_server_pending gauge")
+        lines.append(f"{prefix}_server_pending {self.pending}")
+        lines.append(f"# TYPE {prefix}_server_queue_depth gauge")
+        for name, batcher in self.batchers.items():
+            lines.append(f'{prefix}_server_queue_depth{{stage="{name}"}} {batcher.queue.qsize()}')
+        lines.append(f"# TYPE {prefix}_server_batch_size_mean gauge")
+        for name, batcher in self.batchers.items():
+            mean = batcher.items / batcher.batches if batcher.batches else 0.0
+            lines.append(f'{prefix}_server_batch_size_mean{{stage="{name}"}} {mean:.3f}')
+        latencies = sorted(self.latencies)
+        lines.append(f"# TYPE {prefix}_server_request_seconds summary")
+        for q in QUANTILES:
+            value = latencies[min(len(latencies) - 1, int(round(q * (len(latencies) - 1))))] if latencies else 0.0
+            lines.append(f'{prefix}_server_request_seconds{{quantile="{q}"}} {value:.6f}')
+        lines.append(f"{prefix}_server_request_seconds_count {len(latencies)}")
+        return "\n".join(lines) + "\n"
+
+    # --- HTTP ---
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                status, payload, content_type = await self.route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._respond(writer, status, payload, content_type, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes):
+        path = path.split("?", 1)[0]
+        if path == "/metrics" and method == "GET":
+            return 200, self.prometheus(), "text/plain; version=0.0.4"
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok", "pending": self.pending}, "application/json"
+        if path == "/ask" and method == "POST":
+            try:
+                question = json.loads(body or b"{}").get("question", "").strip()
+            except (ValueError, AttributeError):
+                question = ""
+            if not question:
+                return 400, {"error": 'expected a JSON body {"question": ...}'}, "application/json"
+            status, payload = await self.ask(question)
+            return status, payload, "application/json"
+        return 404, {"error": f"no route for {method} {path}"}, "application/json"
+
+    @staticmethod
+    def _respond(writer, status: int, payload, content_type: str, keep_alive: bool):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+                   503: "Service Unavailable", 504: "Gateway Timeout"}
+        if not isinstance(payload, str):
+            payload = json.dumps(payload, ensure_ascii=False)
+        data = payload.encode("utf-8")
+        head = [f"HTTP/1.1 {status} {reasons.get(status, '')}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(data)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+
+    async def serve(self, host: str, port: int):
+        self.start_batchers()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"[Server] listening on http://{host}:{port} "
+              f"(window {1000 * self.window:.0f} ms, max batch {self.max_batch}, router {self.router})")
+        async with server:
+            await server.serve_forever()
+
+
+def load_client(url: str, questions: list, n: int, concurrency: int):
+    """Send n questions from concurrency threads and report throughput and latency."""
+    import urllib.request
+    import urllib.error
+
+    latencies = []
+    statuses = {}
+
+    def send(i: int):
+        body = json.dumps({"question": questions[i % len(questions)]}).encode("utf-8")
+        request = urllib.request.Request(url.rstrip("/") + "/ask", data=body,
+                                         headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(n)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"[Load] {n} requests, concurrency {concurrency}: {n / elapsed:.2f} req/s | "
+          f"p50 {1000 * latencies[len(latencies) // 2]:.0f} ms | "
+          f"p95 {1000 * latencies[int(0.95 * (len(latencies) - 1))]:.0f} ms | status {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--router", choices=sorted(ROUTERS), default="generate")
+    parser.add_argument("--max-batch", type=int, default=8, help="Largest micro-batch per stage")
+    parser.add_argument("--window-ms", type=float, default=20, help="How long a batch waits for more requests")
+    parser.add_argument("--max-pending", type=int, default=256, help="Requests in flight before answering 503")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a request gets 504")
+    parser.add_argument("--no-gen-cache", action="store_true", help="Bypass the persistent generation cache")
+    parser.add_argument("--no-route-cache", action="store_true", help="Route every question with --router")
+    parser.add_argument("--load", type=str, metavar="URL", help="Load test a running server instead of serving")
+    parser.add_argument("--file", type=str, default="data/finchatbot_300_dataset.jsonl",
+                        help="Questions for --load")
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent by --load")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients for --load")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    if args.load:
+        with open(args.file, "r") as f:
+            questions = [json.loads(line)["input"] for line in f if line.strip()]
+        load_client(args.load, questions, args.requests, args.concurrency)
+    else:
+        configure_from_args(args)
+        GENERATION_CACHE.bypass = GENERATION_CACHE.bypass or args.no_gen_cache
+        ROUTE_CACHE.enabled = ROUTE_CACHE.enabled and not args.no_route_cache
+        METRICS.configure(enabled=True, path=METRICS.path)
+        preload()
+        server = PipelineServer(router=args.router, max_batch=args.max_batch, window=args.window_ms / 1000,
+                                max_pending=args.max_pending, timeout=args.timeout)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+
+DATA_DIR = Path(__file__).parent / "data"
+
+CORPUS_FILES = [
+    "finchatbot_300_dataset.jsonl",
+    "clean_router_testset_60.jsonl",
+]
+
+
+def _corpus():
+    for name in CORPUS_FILES:
+        with open(DATA_DIR / name, "r") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    yield item.get("input", "")
+                    yield item.get("output", "")
+
+
+def build_standin_tokenizer(vocab_size: int = 2000):
+    """
+    Byte-level BPE tokenizer trained on the bundled datasets. Needs no
+    network access and decodes every byte sequence back exactly.
+    """
+    from tokenizers import Tokenizer, models, trainers, pre_tokenizers, decoders, processors
+    from transformers import PreTrainedTokenizerFast
+
+    tok = Tokenizer(models.BPE(unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<unk>", "<s>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+        show_progress=False
+    )
+    tok.train_from_iterator(_corpus(), trainer)
+    tok.post_processor = processors.TemplateProcessing(
+        single="<s> $A",
+        pair="<s> $A <s> $B",
+        special_tokens=[("<s>", tok.token_to_id("<s>"))]
+    )
+
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tok,
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+        pad_token="</s>"
+    )
+    tokenizer.model_max_length = 4096
+    return tokenizer
+
+
+def build_standin_model(tokenizer, hidden_size: int = 256, num_layers: int = 4, seed: int = 0):
+    """
+    Small randomly initialized Llama-architecture causal LM that runs on CPU.
+    Outputs are meaningless but every code path around the model is exercised
+    with realistic shapes and caches.
+    """
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=4096,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id
+    )
+    config._name_or_path = "standin-llama"
+    torch.manual_seed(seed)
+    return LlamaForCausalLM(config).eval()
@@ -0,0 +1,206 @@
+import os
+import re
+
+# A complete "relation: head, tail" line (newline-terminated), or a bare "None" answer
+RELATION_LINE = re.compile(r"^[ \t\-]*(?:[a-z_/]+:[^\n,]+,[^\n]+|None)[ \t]*\n", re.MULTILINE)
+
+# Extra tokens decoded in front of a stop-string tail, so its first token may decode oddly
+TAIL_MARGIN = 4
+
+
+class StopSpec:
+    """
+    Where a module's answer ends in its generated text: the first of its stop
+    strings, or the end of the first match of pattern. Leading whitespace is
+    skipped, so an answer that starts with a blank line is not cut empty.
+    """
+
+    def __init__(self, strings=(), pattern=None):
+        self.strings = tuple(strings)
+        self.pattern = pattern
+
+    def signature(self) -> list:
+        return list(self.strings) + ([self.pattern.pattern] if self.pattern else [])
+
+    @property
+    def tail_tokens(self):
+        """
+        Generated tokens that hold any stop string completed by the newest
+        token (every token decodes to at least one character), or None when
+        the whole text must be searched (a pattern can span a long line).
+        """
+        if self.pattern is not None:
+            return None
+        return max((len(s) for s in self.strings), default=0) + TAIL_MARGIN
+
+    def find(self, text: str, leading: bool = True):
+        """
+        Cut position in text, or None while the answer is still open.
+        leading=False for text that starts after the answer's beginning.
+        """
+        start = len(text) - len(text.lstrip()) if leading else -1
+        if start == len(text):
+            return None
+        cut = None
+        for s in self.strings:
+            i = text.find(s, start + 1)
+            if i != -1 and (cut is None or i < cut):
+                cut = i
+        if self.pattern is not None:
+            m = self.pattern.search(text, start)
+            if m is not None and (cut is None or m.end() - 1 < cut):
+                cut = m.end() - 1
+        return cut
+
+
+MODULE_STOPS = {
+    # "A: FinQA" is followed by a newline and the next few-shot "Q:"
+    "router": StopSpec(["\n"]),
+    # Not "\n\n": 271 of the 300 recorded Hermes FinQA answers have paragraph
+    # breaks (lists, "Pros:/Cons:") before any follow-up "Q:", which it would cut
+    "finqa": StopSpec(["\nQ:", "### NEW QUESTION", "\n\n\n"]),
+    "finred": StopSpec(["[END", "\nQuestion:", "\n\n"], pattern=RELATION_LINE),
+    "forecaster": StopSpec(["---", "[Company Introduction]", "[Question]:", "\nQ:"]),
+}
+
+STOP_STRINGS_ENABLED = os.getenv("FINBOT_STOP_STRINGS", "on").lower() not in ("0", "off", "false")
+
+
+def stop_signature(module: str):
+    """Part of the generation-cache key: outputs differ with and without stops."""
+    return MODULE_STOPS[module].signature() if STOP_STRINGS_ENABLED else None
+
+
+class StopCriteria:
+    """
+    transformers stopping criterion that finishes each row of a batch on its
+    own once its generated text reaches the module's StopSpec. spec may also
+    be a list with one StopSpec (or None) per row, and limits a per-row
+    max_new_tokens, for batches that mix modules. generate() pads finished
+    rows until the whole batch is done.
+
+    Rows are checked after every step, so a new stop string can only end in
+    the newest token: once the answer is under way only the last
+    spec.tail_tokens tokens are decoded, which keeps a check O(1) instead
+    of re-decoding the whole completion.
+    """
+
+    def __init__(self, spec, tokenizer, prompt_len: int, limits: list = None):
+        self.spec = spec
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.limits = limits
+        self.done = None
+        self.started = None  # per row: generated tokens when the text first held more than whitespace
+
+    def _stopped(self, input_ids, row: int, spec: StopSpec, generated: int) -> bool:
+        """Whether row reached spec: searching its tail once the answer has started before it."""
+        tail = spec.tail_tokens
+        started = self.started[row]
+        if tail is not None and started is not None and generated - tail > started:
+            text = self.tokenizer.decode(input_ids[row, -tail:], skip_special_tokens=True)
+            return spec.find(text, leading=False) is not None
+        text = self.tokenizer.decode(input_ids[row, self.prompt_len:], skip_special_tokens=True)
+        if started is None and text.strip():
+            self.started[row] = generated
+        return spec.find(text) is not None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        if self.done is None:
+            self.done = [False] * input_ids.shape[0]
+            self.started = [None] * input_ids.shape[0]
+        generated = input_ids.shape[1] - self.prompt_len
+        for row in range(input_ids.shape[0]):
+            if self.done[row]:
+                continue
+            if self.limits is not None and generated >= self.limits[row]:
+                self.done[row] = True
+                continue
+            spec = self.spec[row] if isinstance(self.spec, list) else self.spec
+            if spec is not None:
+                self.done[row] = self._stopped(input_ids, row, spec, generated)
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+
+def stopping_kwargs(module: str, tokenizer, tokens: dict) -> dict:
+    """Extra generate() kwargs that stop module's rows at their stop strings."""
+    if not STOP_STRINGS_ENABLED:
+        return {}
+    from transformers import StoppingCriteriaList
+
+    criteria = StopCriteria(MODULE_STOPS[module], tokenizer, tokens["input_ids"].shape[1])
+    return {"stopping_criteria": StoppingCriteriaList([criteria])}
+
+
+def mixed_stopping_kwargs(modules: list, tokenizer, tokens: dict, limits: list) -> dict:
+    """
+    stopping_kwargs for a batch whose rows belong to different modules and
+    have their own max_new_tokens (limits). The limits apply even with stop
+    strings disabled.
+    """
+    from transformers import StoppingCriteriaList
+
+    specs = [MODULE_STOPS[m] if STOP_STRINGS_ENABLED else None for m in modules]
+    criteria = StopCriteria(specs, tokenizer, tokens["input_ids"].shape[1], limits)
+    return {"stopping_criteria": StoppingCriteriaList([criteria])}
+
+
+def trim_completions(module: str, texts: list) -> list:
+    """Cut each generated text at its module stop point, dropping the stop string."""
+    if not STOP_STRINGS_ENABLED:
+        return texts
+    spec = MODULE_STOPS[module]
+    trimmed = []
+    for text in texts:
+        cut = spec.find(text)
+        trimmed.append(text if cut is None else text[:cut])
+    return trimmed
+
+
+def decode_steps(tokens: dict, output_ids, max_new_tokens: int) -> dict:
+    """Decode steps run by one generate() call and the steps left unused."""
+    steps = output_ids.shape[1] - tokens["input_ids"].shape[1]
+    return {"decode_steps": steps, "decode_steps_saved": max(0, max_new_tokens - steps)}
+
+
+class StopTrimmer:
+    """
+    trim_completions for a completion that arrives in pieces. feed() returns
+    the part that can no longer be cut: the tail that might still turn
+    into a stop string is held back until the next piece or finish().
+    """
+
+    def __init__(self, module: str):
+        self.spec = MODULE_STOPS[module] if STOP_STRINGS_ENABLED else None
+        self.holdback = max((len(s) - 1 for s in self.spec.strings), default=0) if self.spec else 0
+        self.text = ""
+        self.end = None
+        self.sent = 0
+
+    @property
+    def output(self) -> str:
+        return self.text if self.end is None else self.text[:self.end]
+
+    def feed(self, piece: str) -> str:
+        if self.end is not None:
+            return ""
+        self.text += piece
+        cut = self.spec.find(self.text) if self.spec else None
+        if cut is not None:
+            self.end = cut
+            limit = cut
+        else:
+            limit = len(self.text) - self.holdback
+        return self._emit(limit)
+
+    def finish(self) -> str:
+        return self._emit(len(self.output))
+
+    def _emit(self, limit: int) -> str:
+        if limit <= self.sent:
+            return ""
+        piece = self.text[self.sent:limit]
+        self.sent = limit
+        return piece
@@ -0,0 +1,63 @@
+"""
+Events yielded by the streaming run_* functions and run_pipeline_stream:
+
+  {"event": "route", "module": ...}   routing decision (pipeline only)
+  {"event": "delta", "text": ...}     more answer text
+  {"event": "reset"}                  drop the text received so far (a marker
+                                      such as "Answer:" showed up late)
+  {"event": "done", "output": ...}    final output, identical to the
+                                      non-streaming function
+
+The deltas after the last reset always join to the final output.
+"""
+
+
+def delta(text: str) -> dict:
+    return {"event": "delta", "text": text}
+
+
+class AnswerStream:
+    """
+    Incremental form of "text after the last marker, stripped", the shape of
+    extract_finqa_answer and extract_forecast. feed() returns the events that
+    extend the visible answer; the tail that could still be a marker or
+    trailing whitespace is held back. finish() reconciles with the real
+    extractor's output, so the stream can never end on a different answer.
+    """
+
+    def __init__(self, markers=()):
+        self.markers = tuple(markers)
+        self.raw = ""
+        self.sent = ""
+
+    def _stable(self) -> str:
+        base = 0
+        for marker in self.markers:
+            i = self.raw.rfind(marker)
+            if i != -1:
+                base = max(base, i + len(marker))
+        text = self.raw[base:].lstrip()
+
+        hold = 0
+        for marker in self.markers:
+            for k in range(min(len(marker) - 1, len(text)), 0, -1):
+                if text.endswith(marker[:k]):
+                    hold = max(hold, k)
+                    break
+        return text[:len(text) - hold].rstrip()
+
+    def feed(self, piece: str) -> list:
+        self.raw += piece
+        return self._advance(self._stable())
+
+    def finish(self, output: str) -> list:
+        return self._advance(output)
+
+    def _advance(self, target: str) -> list:
+        if target.startswith(self.sent):
+            piece = target[len(self.sent):]
+            self.sent = target
+            return [delta(piece)] if piece else []
+        self.sent = target
+        reset = {"event": "reset"}
+        return [reset, delta(target)] if target else [reset]
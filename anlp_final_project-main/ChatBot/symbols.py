@@ -0,0 +1,96 @@
+import re
+from indices import DOW_30, EURO_STOXX_50, CRYPTO, COMPANY_ALIASES
+
+# Words: letters/digits, allowing inner "." and "-" as in "BTC-USD", "AD.AS", "Coca-Cola"
+TOKEN_RE = re.compile(r"[^\W_]+(?:[.\-][^\W_]+)*")
+
+# Names that are also everyday words only match when written exactly as listed
+AMBIGUOUS_WORDS = {"cat", "dis", "hon", "ing", "sol", "ada", "orange", "tron", "travelers", "dow"}
+
+
+class SymbolIndex:
+    """
+    Ticker / company-name lookup with token boundaries.
+
+    Tickers and aliases are stored as word tuples in hash tables, so extracting
+    symbols costs one pass over the question's words with at most max_words
+    lookups per position, whatever the size of the universe. Tickers and other
+    all-capital names ("SAP", "BTC") only match in capitals, so "the Dow" or
+    "sap" are not DOW or SAP.DE. Short names (<= 2 characters) and names in
+    AMBIGUOUS_WORDS are case-sensitive too, so "V" matches Visa but the "v" in
+    "Nvidia" or "vs" does not; other company names are case-insensitive.
+    """
+
+    def __init__(self, symbols, aliases: dict = None):
+        self._exact = {}
+        self._folded = {}
+        # First words of multi-word names; only these positions need n-gram lookups
+        self._multi_starts = set()
+        self.max_words = 1
+        for symbol in symbols:
+            self.add(symbol, symbol)
+        for name, symbol in (aliases or {}).items():
+            self.add(name, symbol)
+
+    def add(self, name: str, symbol: str):
+        words = tuple(TOKEN_RE.findall(name))
+        if not words:
+            return
+        self.max_words = max(self.max_words, len(words))
+        if name.isupper() or len(name) <= 2 or name.lower() in AMBIGUOUS_WORDS:
+            key = words
+            table = self._exact
+        else:
+            key = tuple(w.casefold() for w in words)
+            table = self._folded
+        if len(key) == 1:
+            key = key[0]
+        else:
+            self._multi_starts.add(key[0].casefold())
+        table.setdefault(key, symbol)
+
+    def __len__(self):
+        return len(set(self._exact.values()) | set(self._folded.values()))
+
+    def _matches(self, words: list):
+        """(position, number of words, symbol) of every name in words, left to right. Longest name wins."""
+        folded = [w.casefold() for w in words]
+        i = 0
+        while i < len(words):
+            symbol = None
+            if folded[i] in self._multi_starts:
+                for n in range(min(self.max_words, len(words) - i), 1, -1):
+                    symbol = self._exact.get(tuple(words[i:i + n])) or self._folded.get(tuple(folded[i:i + n]))
+                    if symbol:
+                        break
+            if symbol is None:
+                n = 1
+                symbol = self._exact.get(words[i]) or self._folded.get(folded[i])
+            if symbol:
+                yield i, n, symbol
+                i += n
+            else:
+                i += 1
+
+    def extract(self, text: str) -> list:
+        """All symbols mentioned in text, in order of first mention. Longest name wins."""
+        found = []
+        for _, _, symbol in self._matches(TOKEN_RE.findall(text)):
+            if symbol not in found:
+                found.append(symbol)
+        return found
+
+    def mask(self, text: str, placeholder: str = "SYM") -> list:
+        """The words of text with every ticker or company name replaced by placeholder."""
+        words = TOKEN_RE.findall(text)
+        masked = []
+        last = 0
+        for i, n, _ in self._matches(words):
+            masked.extend(words[last:i])
+            masked.append(placeholder)
+            last = i + n
+        masked.extend(words[last:])
+        return masked
+
+
+SYMBOL_INDEX = SymbolIndex(DOW_30 + EURO_STOXX_50 + CRYPTO, COMPANY_ALIASES)
@@ -2,6 +2,7 @@ import json
 from pathlib import Path
 from difflib import SequenceMatcher
 from finred import run_finred, parse_finred_output
+from triple_matcher import TripleMatcher, SequenceRatio
 
 # --- Normalization & Matching ---
 def normalize_entity(entity: str) -> str:
@@ -46,13 +47,7 @@ def evaluate_soft_f1(gold_triples_list, pred_triples_list):
     total_gold = 0
 
     for gold_set, pred_set in zip(gold_triples_list, pred_triples_list):
-        matched = set()
-        for pred in pred_set:
-            for gold in gold_set:
-                if soft_match(pred, gold) and gold not in matched:
-                    soft_tp += 1
-                    matched.add(gold)
-                    break
+        soft_tp += TripleMatcher(gold_set, SequenceRatio(0.85), RELATION_ALIASES).count(pred_set)
         total_pred += len(pred_set)
         total_gold += len(gold_set)
 
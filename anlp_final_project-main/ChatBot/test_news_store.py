@@ -0,0 +1,55 @@
+import csv
+import json
+import random
+import tempfile
+from pathlib import Path
+from news_store import NEWS_SPAM_PREFIX, NewsStore, ingest, week_articles
+
+
+def article(date, headline, summary="Summary"):
+    return {"date": date, "headline": headline, "summary": summary}
+
+
+# Out of date order, with a boundary-day article shared by both weeks, a spam
+# article and one dated after the week's end (the CSV path drops the last two)
+WEEKS = [
+    ("2024-03-01", "2024-03-08", [
+        article("20240305120000", "B midweek"),
+        article("20240301090000", "A start"),
+        article("20240303000000", "Spam", NEWS_SPAM_PREFIX + " Click here"),
+        article("20240308170000", "C boundary"),
+        article("20240309080000", "D after end"),
+    ]),
+    ("2024-03-08", "2024-03-15", [
+        article("20240308170000", "C boundary"),
+        article("20240315100000", "F end"),
+        article("20240310100000", "E early"),
+    ]),
+]
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = Path(tmp) / "AAPL_2024-03-01_2024-03-15.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Start Date", "End Date", "Start Price", "End Price", "News", "Basics", "Bin Label"])
+        for start, end, news in WEEKS:
+            writer.writerow([start, end, "100.0", "101.0", json.dumps(news), "{}", "U1"])
+
+    counts = ingest([path], Path(tmp) / "store")
+    store = NewsStore(Path(tmp) / "store")
+    assert counts == {"AAPL": 5}, counts  # C is stored once for both weeks
+
+    for start, end, news in WEEKS:
+        expected = week_articles(json.dumps(news), end)
+        got = store.week("AAPL", start, end)
+        # Same articles in the same (CSV) order, so a seeded sample picks the same news
+        assert got == expected, (got, expected)
+        assert random.Random(0).sample(got, 2) == random.Random(0).sample(expected, 2)
+
+    assert [a.split("\n")[0] for a in store.week("AAPL", "2024-03-01", "2024-03-08")] == \
+        ["[Headline]: B midweek", "[Headline]: A start", "[Headline]: C boundary"]
+    assert store.week("AAPL", "2024-03-15", "2024-03-22") is None   # week not ingested
+    assert store.week("MSFT", "2024-03-01", "2024-03-08") is None   # symbol not ingested
+    assert "AAPL" in store and "MSFT" not in store
+
+print("news_store checks passed")
@@ -0,0 +1,29 @@
+from prompt_budget import Section, fit_sections, token_counter, special_tokens
+from engine import ENGINE
+from standin import build_standin_model, build_standin_tokenizer
+
+tokenizer = build_standin_tokenizer()
+model = build_standin_model(tokenizer)
+count_tokens = token_counter(tokenizer)
+budget = ENGINE.context_budget(model, tokenizer, 64)
+
+# Optional news items between a required head and question, with the head padded
+# until the whole text is exactly budget tokens without special tokens
+news = [Section(f"[Headline]: Item {i}\n[Summary]: Something happened in week {i}.\n", priority=(i,))
+        for i in range(60)]
+question = Section("[Question]: Will the stock go up next week?\n[Your Forecast]:")
+head = "[Company Introduction]:\nAn example company."
+while count_tokens([head + "\n\n" + "".join(s.text for s in news) + question.text])[0] < budget:
+    head += "."
+sections = [Section(head + "\n\n")] + news + [question]
+assert count_tokens(["".join(s.text for s in sections)])[0] == budget
+
+# Fitted to the budget minus the BOS token, the prompt passes through the engine whole
+prompt, stats = fit_sections(sections, budget - special_tokens(tokenizer), count_tokens)
+encoded = tokenizer([prompt])["input_ids"][0]
+tokens = ENGINE.encode(model, tokenizer, [prompt], budget)
+assert stats["dropped"] >= 1, stats
+assert tokens["input_ids"][0].tolist() == encoded, (len(encoded), budget)
+assert encoded[0] == tokenizer.bos_token_id
+
+print("prompt_budget checks passed")
@@ -0,0 +1,33 @@
+from symbols import SYMBOL_INDEX
+
+# Tickers and company names that should be found
+CASES = [
+    ("Will AAPL stock go up next week?", ["AAPL"]),
+    ("How did Apple and microsoft do last quarter?", ["AAPL", "MSFT"]),
+    ("Is SAP a good buy?", ["SAP.DE"]),
+    ("What is the price of BTC-USD?", ["BTC-USD"]),
+    ("Should I buy bitcoin or ETH?", ["BTC-USD", "ETH-USD"]),
+    ("How is Dow Inc doing?", ["DOW"]),
+    ("Compare V and JPM", ["V", "JPM"]),
+    ("Visa vs the market", ["V"]),
+]
+
+# Everyday words that only look like tickers or names
+NEGATIVE_CASES = [
+    "How is the Dow doing?",
+    "Will the Dow Jones rise or fall next week?",
+    "how is the dow doing?",
+    "The sap of the maple tree",
+    "Is the ada lovelace biography any good?",
+    "I saw a cat on the way to the orange grove",
+]
+
+for question, expected in CASES:
+    got = SYMBOL_INDEX.extract(question)
+    assert got == expected, (question, got, expected)
+
+for question in NEGATIVE_CASES:
+    got = SYMBOL_INDEX.extract(question)
+    assert got == [], (question, got)
+
+print("symbols checks passed")
@@ -0,0 +1,113 @@
+import json
+import random
+from pathlib import Path
+from finred_utils import extract_tuples, normalize_triple
+from triple_matcher import TripleMatcher, CharOverlap, SequenceRatio, soft_match, soft_match_triples
+
+DATA_DIR = Path(__file__).parent / "data"
+
+RELATION_ALIASES = {
+    'employer': {'founded_by', 'owner_of', 'member_of'},
+    'founded_by': {'employer', 'owner_of'},
+    'owner_of': {'founded_by', 'employer'},
+}
+
+
+# --- Reference implementations (all-pairs, as before the index) ---
+def legacy_soft_match_triples(pred_triples, gold_triples, threshold=0.7):
+    matched = 0
+    for gt in gold_triples:
+        for pt in pred_triples:
+            if gt[0] == pt[0] and soft_match(gt[1], pt[1], threshold) and soft_match(gt[2], pt[2], threshold):
+                matched += 1
+                break
+    return matched
+
+
+def legacy_one_to_one(pred_triples, gold_triples, similarity, aliases=None):
+    aliases = aliases or {}
+    matched = set()
+    for pt in pred_triples:
+        for i, gt in enumerate(gold_triples):
+            rel_ok = gt[0] == pt[0] or gt[0] in aliases.get(pt[0], ()) or pt[0] in aliases.get(gt[0], ())
+            if i not in matched and rel_ok \
+                    and similarity.match(similarity.normalize(gt[1]), similarity.normalize(pt[1])) \
+                    and similarity.match(similarity.normalize(gt[2]), similarity.normalize(pt[2])):
+                matched.add(i)
+                break
+    return len(matched)
+
+
+# --- Regression on stored pipeline outputs ---
+rows = []
+for name in ["pipeline_outputs_Hermes.jsonl", "pipeline_outputs_mistral.jsonl"]:
+    with open(DATA_DIR / name, "r") as f:
+        rows.extend(json.loads(line) for line in f if line.strip())
+finred_rows = [r for r in rows if r.get("module") == "FinRED"]
+
+legacy_total, new_total, compared = 0, 0, 0
+for r in finred_rows:
+    gold = [normalize_triple(t) for t in extract_tuples(r["expected_output"])]
+    pred = [normalize_triple(t) for t in extract_tuples(r.get("pipeline_output", ""))]
+    if not gold or not pred:
+        continue
+    legacy = legacy_soft_match_triples(pred, gold)
+    new = soft_match_triples(pred, gold)
+    # The legacy count lets one prediction satisfy several gold triples; never more than that
+    assert new <= legacy, (r["input"], legacy, new)
+    assert new == legacy_one_to_one(pred, gold, CharOverlap(0.7)), r["input"]
+    legacy_total += legacy
+    new_total += new
+    compared += 1
+print(f"FinRED rows compared: {compared}  legacy matches: {legacy_total}  one-to-one matches: {new_total}")
+
+# --- One-to-one: a single prediction cannot satisfy two gold triples ---
+gold = [("founded_by", "amazon", "jeff bezos"), ("founded_by", "amazon", "jeff bezos")]
+pred = [("founded_by", "amazon", "jeff bezos")]
+assert legacy_soft_match_triples(pred, gold) == 2
+assert soft_match_triples(pred, gold) == 1
+
+# --- Exact matches are assigned before soft ones ---
+gold = [("employer", "tim cook", "apple inc")]
+pred = [("employer", "tim cook", "apple incs"), ("employer", "tim cook", "apple inc")]
+assert TripleMatcher(gold).match(pred) == [(0, 1)]
+
+# --- Randomized agreement with the all-pairs greedy matcher ---
+rng = random.Random(0)
+names = ["apple", "apple inc", "microsoft", "micro soft", "nvidia", "tesla", "tesla motors",
+         "jeff bezos", "elon musk", "satya nadella", "tim cook", "amazon", "amazon.com"]
+relations = ["employer", "founded_by", "owner_of", "headquarters_location", "subsidiary"]
+
+
+def noisy(s):
+    s = list(s)
+    for _ in range(rng.randint(0, 2)):
+        op = rng.random()
+        i = rng.randrange(len(s) + 1)
+        if op < 0.4:
+            s.insert(i, rng.choice("abcdeilmnorst .'"))
+        elif op < 0.8 and len(s) > 1:
+            del s[min(i, len(s) - 1)]
+        else:
+            s[min(i, len(s) - 1)] = rng.choice("abcdeilmnorst")
+    return "".join(s)
+
+
+for trial in range(300):
+    gold = [(rng.choice(relations), rng.choice(names), rng.choice(names)) for _ in range(rng.randint(1, 8))]
+    pred = [(r, noisy(h), noisy(t)) for r, h, t in rng.sample(gold, rng.randint(1, len(gold)))]
+    pred += [(rng.choice(relations), rng.choice(names), rng.choice(names)) for _ in range(rng.randint(0, 3))]
+    rng.shuffle(pred)
+    for similarity, aliases in [(CharOverlap(0.7), None), (SequenceRatio(0.85), RELATION_ALIASES)]:
+        matcher = TripleMatcher(gold, similarity, aliases)
+        pairs = matcher.match(pred)
+        assert len({g for g, _ in pairs}) == len(pairs) == len({p for _, p in pairs})
+        for g, p in pairs:
+            assert similarity.match(similarity.normalize(gold[g][1]), similarity.normalize(pred[p][1]))
+            assert similarity.match(similarity.normalize(gold[g][2]), similarity.normalize(pred[p][2]))
+        # Pruning never loses a pair: any prediction left unmatched has no free compatible gold
+        free = [i for i in range(len(gold)) if i not in {g for g, _ in pairs}]
+        for j in set(range(len(pred))) - {p for _, p in pairs}:
+            assert legacy_one_to_one([pred[j]], [gold[i] for i in free], similarity, aliases) == 0, (gold, pred)
+
+print("triple_matcher checks passed")
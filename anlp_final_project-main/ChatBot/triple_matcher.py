@@ -0,0 +1,227 @@
+import math
+from collections import Counter
+from difflib import SequenceMatcher
+
+
+def soft_match(a: str, b: str, threshold: float = 0.7) -> bool:
+    a, b = a.lower(), b.lower()
+    overlap = sum(1 for ch in a if ch in b)
+    return (overlap / max(len(a), len(b))) >= threshold
+
+
+class CharOverlap:
+    """
+    evaluate.soft_match: share of the gold string's characters that occur
+    anywhere in the predicted string, relative to the longer string. A gold
+    character is only missed when the prediction does not contain it at all.
+    """
+
+    def __init__(self, threshold: float = 0.7):
+        self.threshold = threshold
+
+    def normalize(self, s: str) -> str:
+        return s.lower()
+
+    def covered(self, pred_count: int):
+        """How many occurrences of a character the prediction covers (None: all)."""
+        return None if pred_count else 0
+
+    def max_misses(self, gold_len: int, pred_len: int) -> int:
+        # overlap = gold_len - misses >= t * max(gold_len, pred_len)
+        return math.floor(gold_len - self.threshold * max(gold_len, pred_len) + 1e-9)
+
+    def match(self, gold: str, pred: str) -> bool:
+        return soft_match(gold, pred, self.threshold)
+
+
+class SequenceRatio:
+    """
+    Exact equality or difflib ratio >= threshold, as in test_finred_generation.py.
+    ratio = 2 * matches / (len_a + len_b) and matches never exceed the shared
+    character multiset, so every occurrence beyond the prediction's count is a miss.
+    """
+
+    def __init__(self, threshold: float = 0.85):
+        self.threshold = threshold
+
+    def normalize(self, s: str) -> str:
+        return s
+
+    def covered(self, pred_count: int):
+        return pred_count
+
+    def max_misses(self, gold_len: int, pred_len: int) -> int:
+        # matches <= gold_len - misses and 2 * matches >= r * (gold_len + pred_len)
+        return math.floor(gold_len - self.threshold * (gold_len + pred_len) / 2 + 1e-9)
+
+    def match(self, gold: str, pred: str) -> bool:
+        return gold == pred or SequenceMatcher(None, pred, gold).ratio() >= self.threshold
+
+
+class _SideIndex:
+    """
+    Character-multiset signatures of one side (heads or tails) of a relation's
+    gold triples, stored bit-sliced: bit k of every bitmap is the relation's
+    k-th gold triple.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.by_length = {}
+        # char -> [golds with >= 1 occurrence, golds with >= 2, ...]
+        self.occurrences = {}
+
+    def add(self, text: str):
+        bit = 1 << self.size
+        self.size += 1
+        self.by_length[len(text)] = self.by_length.get(len(text), 0) | bit
+        for ch, count in Counter(text).items():
+            levels = self.occurrences.setdefault(ch, [])
+            while len(levels) < count:
+                levels.append(0)
+            for k in range(count):
+                levels[k] |= bit
+
+    def candidates(self, text: str, similarity) -> int:
+        """Bitmap of gold entities whose multiset bound still allows a match with text."""
+        budgets = []
+        for length, golds in self.by_length.items():
+            m = similarity.max_misses(length, len(text))
+            if m >= 0:
+                budgets.append((golds, min(m, length)))
+        if not budgets:
+            return 0
+
+        # at_least[j]: golds with at least j uncovered occurrences (counting stops at top)
+        top = max(m for _, m in budgets) + 1
+        at_least = [(1 << self.size) - 1] + [0] * top
+        counts = Counter(text)
+        seen = 0
+        for ch, levels in self.occurrences.items():
+            start = similarity.covered(counts.get(ch, 0))
+            if start is None:
+                continue
+            for golds in levels[start:]:
+                seen += 1
+                for j in range(min(top, seen), 0, -1):
+                    at_least[j] |= at_least[j - 1] & golds
+
+        found = 0
+        for golds, m in budgets:
+            found |= golds & ~at_least[m + 1]
+        return found
+
+
+class TripleMatcher:
+    """
+    One-to-one soft matching of predicted (relation, head, tail) triples
+    against a fixed set of gold triples.
+
+    Gold triples are indexed by relation, then by exact normalized (head,
+    tail) and by character-multiset signatures of head and tail. For a
+    prediction the whole relation is filtered at once with bitwise
+    operations on bit-sliced occurrence counts: a gold entity stays a
+    candidate only if the occurrences the prediction cannot cover fit the
+    similarity's miss budget for that pair of lengths. Only the survivors go
+    through the real similarity check. Exact pairs are assigned first, then
+    soft ones, and every gold triple is used at most once.
+
+    relation_aliases optionally maps a relation to the relations it may
+    also match (checked in both directions).
+    """
+
+    def __init__(self, gold_triples, similarity=None, relation_aliases=None):
+        self.similarity = similarity or CharOverlap()
+        self.gold = [self._prepare(t) for t in gold_triples]
+        self._aliases = relation_aliases or {}
+        self._related = {}
+
+        self._exact = {}
+        self._by_relation = {}
+        for i, (rel, head, tail) in enumerate(self.gold):
+            self._exact.setdefault((rel, head, tail), []).append(i)
+            self._by_relation.setdefault(rel, []).append(i)
+
+        self._heads = {}
+        self._tails = {}
+        for rel, ids in self._by_relation.items():
+            heads, tails = _SideIndex(), _SideIndex()
+            for i in ids:
+                heads.add(self.gold[i][1])
+                tails.add(self.gold[i][2])
+            self._heads[rel] = heads
+            self._tails[rel] = tails
+
+    def _prepare(self, triple):
+        rel, head, tail = triple
+        return (rel, self.similarity.normalize(head), self.similarity.normalize(tail))
+
+    def _relations(self, rel: str) -> list:
+        if rel not in self._related:
+            related = [rel] if rel in self._by_relation else []
+            for other in self._by_relation:
+                if other != rel and (other in self._aliases.get(rel, ()) or rel in self._aliases.get(other, ())):
+                    related.append(other)
+            self._related[rel] = related
+        return self._related[rel]
+
+    def _soft_hit(self, rel: str, head: str, tail: str, free: int):
+        """First free gold triple of rel matching (head, tail), and its bit."""
+        golds = free & self._heads[rel].candidates(head, self.similarity)
+        if golds:
+            golds &= self._tails[rel].candidates(tail, self.similarity)
+        ids = self._by_relation[rel]
+        while golds:
+            low = golds & -golds
+            i = ids[low.bit_length() - 1]
+            if self.similarity.match(self.gold[i][1], head) and self.similarity.match(self.gold[i][2], tail):
+                return i, low
+            golds ^= low
+        return None, 0
+
+    def match(self, pred_triples) -> list:
+        """Matched (gold_index, pred_index) pairs, each side used at most once."""
+        preds = [self._prepare(t) for t in pred_triples]
+        used = set()
+        pairs = []
+        pending = []
+
+        for j, (rel, head, tail) in enumerate(preds):
+            hit = None
+            for r in self._relations(rel):
+                for i in self._exact.get((r, head, tail), ()):
+                    if i not in used and self.similarity.match(self.gold[i][1], head) \
+                            and self.similarity.match(self.gold[i][2], tail):
+                        hit = i
+                        break
+                if hit is not None:
+                    break
+            if hit is None:
+                pending.append(j)
+            else:
+                used.add(hit)
+                pairs.append((hit, j))
+
+        # Bitmaps of the gold triples still unassigned, per relation
+        free = {}
+        for rel, ids in self._by_relation.items():
+            free[rel] = sum(1 << k for k, i in enumerate(ids) if i not in used)
+
+        for j in pending:
+            rel, head, tail = preds[j]
+            for r in self._relations(rel):
+                hit, bit = self._soft_hit(r, head, tail, free[r])
+                if hit is not None:
+                    free[r] ^= bit
+                    pairs.append((hit, j))
+                    break
+
+        return pairs
+
+    def count(self, pred_triples) -> int:
+        return len(self.match(pred_triples))
+
+
+def soft_match_triples(pred_triples, gold_triples, threshold=0.7) -> int:
+    """Number of gold triples soft-matched one-to-one by a predicted triple."""
+    return TripleMatcher(gold_triples, CharOverlap(threshold)).count(pred_triples)